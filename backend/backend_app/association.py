@@ -0,0 +1,106 @@
+# association.py
+import numpy as np
+
+PROXIMITY_PADDING = 20
+IOU_OCCUPIED_THRESHOLD = 0.5
+
+# === Scalar Predicates (one chair, one person) ===
+def calculate_iou(boxA, boxB):
+    xA = max(boxA[0], boxB[0])
+    yA = max(boxA[1], boxB[1])
+    xB = min(boxA[2], boxB[2])
+    yB = min(boxA[3], boxB[3])
+    interArea = max(0, xB - xA) * max(0, yB - yA)
+    boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
+    boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
+    return interArea / float(boxAArea + boxBArea - interArea + 1e-6)
+
+def is_center_inside(person_box, chair_box):
+    cx = (person_box[0] + person_box[2]) // 2
+    cy = (person_box[1] + person_box[3]) // 2
+    return chair_box[0] <= cx <= chair_box[2] and chair_box[1] <= cy <= chair_box[3]
+
+def is_vertically_aligned(chair_box, person_box):
+    _, y1_chair, _, y2_chair = chair_box
+    _, y1_person, _, y2_person = person_box
+    return y1_person < y2_chair and y2_person > y1_chair
+
+def is_person_near_chair(person_box, chair_box, padding=PROXIMITY_PADDING):
+    px = (person_box[0] + person_box[2]) // 2
+    py = (person_box[1] + person_box[3]) // 2
+    cx1 = chair_box[0] - padding
+    cy1 = chair_box[1] - padding
+    cx2 = chair_box[2] + padding
+    cy2 = chair_box[3] + padding
+    return cx1 <= px <= cx2 and cy1 <= py <= cy2
+
+def is_seated(chair_box, person_box, padding=PROXIMITY_PADDING):
+    # The rule run_detection uses
+    return (is_center_inside(person_box, chair_box) or is_person_near_chair(person_box, chair_box, padding)) \
+        and is_vertically_aligned(chair_box, person_box)
+
+def is_valid_seated_position(chair_box, person_box, padding=PROXIMITY_PADDING, iou_threshold=IOU_OCCUPIED_THRESHOLD):
+    # The rule yolo_realtime_detection uses, which also accepts a large overlap
+    vertical_check = is_vertically_aligned(chair_box, person_box)
+    iou = calculate_iou(chair_box, person_box)
+    return is_seated(chair_box, person_box, padding) or (iou > iou_threshold and vertical_check)
+
+# === Vectorized Kernels (all chairs x all persons) ===
+# Every matrix is shaped (chairs, persons). Boxes are integer x1, y1, x2, y2 rows,
+# and the arithmetic mirrors the scalar predicates above exactly, including the
+# floor division used for centres, so results match bit for bit.
+
+def as_boxes(boxes):
+    if isinstance(boxes, np.ndarray) and boxes.dtype == np.int64 and boxes.ndim == 2:
+        return boxes
+    return np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+
+def box_centers(boxes):
+    boxes = as_boxes(boxes)
+    return (boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2
+
+def center_inside_matrix(chairs, persons):
+    chairs, persons = as_boxes(chairs), as_boxes(persons)
+    px, py = box_centers(persons)
+    return (
+        (chairs[:, 0, None] <= px) & (px <= chairs[:, 2, None])
+        & (chairs[:, 1, None] <= py) & (py <= chairs[:, 3, None])
+    )
+
+def near_matrix(chairs, persons, padding=PROXIMITY_PADDING):
+    chairs, persons = as_boxes(chairs), as_boxes(persons)
+    px, py = box_centers(persons)
+    return (
+        (chairs[:, 0, None] - padding <= px) & (px <= chairs[:, 2, None] + padding)
+        & (chairs[:, 1, None] - padding <= py) & (py <= chairs[:, 3, None] + padding)
+    )
+
+def vertical_alignment_matrix(chairs, persons):
+    chairs, persons = as_boxes(chairs), as_boxes(persons)
+    return (persons[:, 1] < chairs[:, 3, None]) & (persons[:, 3] > chairs[:, 1, None])
+
+def iou_matrix(boxes_a, boxes_b):
+    a, b = as_boxes(boxes_a), as_boxes(boxes_b)
+    xA = np.maximum(a[:, 0, None], b[:, 0])
+    yA = np.maximum(a[:, 1, None], b[:, 1])
+    xB = np.minimum(a[:, 2, None], b[:, 2])
+    yB = np.minimum(a[:, 3, None], b[:, 3])
+    inter = np.maximum(0, xB - xA) * np.maximum(0, yB - yA)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b - inter + 1e-6)
+
+def seated_matrix(chairs, persons, padding=PROXIMITY_PADDING):
+    return (center_inside_matrix(chairs, persons) | near_matrix(chairs, persons, padding)) \
+        & vertical_alignment_matrix(chairs, persons)
+
+def valid_seated_matrix(chairs, persons, padding=PROXIMITY_PADDING, iou_threshold=IOU_OCCUPIED_THRESHOLD):
+    vertical = vertical_alignment_matrix(chairs, persons)
+    return seated_matrix(chairs, persons, padding) | ((iou_matrix(chairs, persons) > iou_threshold) & vertical)
+
+def chairs_seated(chairs, persons, padding=PROXIMITY_PADDING):
+    # One flag per chair: is anyone sitting on it this frame?
+    chairs, persons = as_boxes(chairs), as_boxes(persons)
+    if len(chairs) == 0 or len(persons) == 0:
+        return np.zeros(len(chairs), dtype=bool)
+    return seated_matrix(chairs, persons, padding).any(axis=1)
@@ -0,0 +1,268 @@
+# async_views.py
+# Live endpoints written for ASGI (e.g. `uvicorn backend.asgi:application`).
+# They await frames and updates instead of sleeping in a worker thread, so one
+# process can hold hundreds of open viewer connections. Under WSGI Django
+# collects an async streaming response into a list before sending it, and
+# these streams never end, so the streaming views are wrapped in asgi_only()
+# and hand WSGI requests to their sync counterparts instead.
+import asyncio
+import functools
+import json
+import weakref
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .models import Camera, UserCafe
+from .live_events import LiveEventWatcher, aread_live_events_since, aread_live_seq, aread_live_state
+from .occupancy import OccupancyWatcher, aread_cafe_occupancy, aread_occupancy_version
+from .streaming import MJPEG_BOUNDARY, ffmpeg_mjpeg_command, mjpeg_broadcaster, parse_camera_id, parse_quality, stream_hubs
+from .views import rtsp_stream, video_feed
+
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+LONG_POLL_TIMEOUT = 25.0  # seconds an unchanged occupancy request waits for an update
+SSE_KEEPALIVE = 15.0  # seconds between comment lines that keep idle proxies from closing the stream
+SSE_RETRY_MS = 3000  # reconnect delay the browser's EventSource should use
+
+# redis.asyncio connections belong to the event loop that opened them
+loop_clients = weakref.WeakKeyDictionary()
+loop_watchers = weakref.WeakKeyDictionary()
+loop_event_watchers = weakref.WeakKeyDictionary()
+
+
+def async_redis():
+    loop = asyncio.get_running_loop()
+    client = loop_clients.get(loop)
+    if client is None:
+        client = loop_clients[loop] = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    return client
+
+
+def occupancy_watcher():
+    loop = asyncio.get_running_loop()
+    watcher = loop_watchers.get(loop)
+    if watcher is None:
+        watcher = loop_watchers[loop] = OccupancyWatcher(async_redis())
+    return watcher
+
+
+def live_event_watcher():
+    loop = asyncio.get_running_loop()
+    watcher = loop_event_watchers.get(loop)
+    if watcher is None:
+        watcher = loop_event_watchers[loop] = LiveEventWatcher(async_redis())
+    return watcher
+
+
+def asgi_only(fallback):
+    """Runs the async view under ASGI and the sync fallback view under WSGI."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if isinstance(request, ASGIRequest):
+                return await view(request, *args, **kwargs)
+            return await sync_to_async(fallback)(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@sync_to_async
+def authenticate(request):
+    """The JWT user for the request, or None (DRF's api_view doesn't run async views).
+
+    Also accepts ?token=<access token>, since EventSource can't send headers.
+    """
+    auth = JWTAuthentication()
+    try:
+        if auth.get_header(request) is None and request.GET.get("token"):
+            return auth.get_user(auth.get_validated_token(request.GET["token"]))
+        result = auth.authenticate(request)
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+# === Live Video ===
+@csrf_exempt
+@asgi_only(video_feed)
+async def video_feed_async(request):
+    try:
+        camera_id = parse_camera_id(request.GET.get("camera_id"))
+    except ValueError:
+        return JsonResponse({"error": "camera_id must be a positive integer"}, status=400)
+    if camera_id is not None and not await Camera.objects.filter(id=camera_id).aexists():
+        return HttpResponseNotFound("Camera not found")
+    quality = parse_quality(request.GET.get("quality"))
+    return StreamingHttpResponse(
+        mjpeg_broadcaster.astream(camera_id, quality),
+        content_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+    )
+
+
+@csrf_exempt
+@asgi_only(rtsp_stream)
+async def rtsp_stream_async(request, camera_id):
+    try:
+        camera = await Camera.objects.aget(id=camera_id)
+        rtsp_url = f"rtsp://{camera.admin_name}:{camera.admin_password}@{camera.ip_address}/{camera.channel}"
+        return StreamingHttpResponse(
+            stream_hubs.astream(camera.id, ffmpeg_mjpeg_command(rtsp_url)),
+            content_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        )
+    except Camera.DoesNotExist:
+        return HttpResponseNotFound("Camera not found")
+    except Exception as e:
+        return HttpResponse(f"Error: {str(e)}", status=500)
+
+
+# === Live Occupancy ===
+async def chair_occupancy_async(request):
+    """chair_occupancy_view as a long poll: with ?since_version, waits for the next change instead of replying "unchanged" at once."""
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    cafe = await UserCafe.objects.filter(user=user).afirst()
+    if not cafe:
+        return JsonResponse({"error": "No cafe linked to user"}, status=400)
+
+    client = async_redis()
+    try:
+        since_version = request.GET.get("since_version")
+        if since_version is not None:
+            try:
+                since_version = int(since_version)
+            except ValueError:
+                return JsonResponse({"error": "since_version must be an integer"}, status=400)
+            watcher = occupancy_watcher()
+            await watcher.start()
+            future = watcher.register(cafe.id)
+            try:
+                version = await aread_occupancy_version(client, cafe.id)
+                if version == since_version:
+                    update = await watcher.wait(future, LONG_POLL_TIMEOUT)
+                    if update is None:
+                        return JsonResponse({"version": version, "unchanged": True})
+            finally:
+                watcher.unregister(cafe.id, future)
+        return JsonResponse(await aread_cafe_occupancy(client, cafe.id))
+    except aioredis.ConnectionError:
+        return JsonResponse({"error": "Redis connection failed"}, status=503)
+
+
+# === Live Events (SSE) ===
+def sse(event, data, event_id=None):
+    lines = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{lines}event: {event}\ndata: {data}\n\n".encode()
+
+
+def parse_last_event_id(value):
+    # "{occupancy version}-{live event id}"
+    try:
+        occupancy_version, event_id = value.split("-")
+        return int(occupancy_version), int(event_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def live_events_unavailable(request):
+    # An endless SSE stream can't be sent from a WSGI worker; dashboards keep polling instead
+    return JsonResponse(
+        {"error": "Live events need the ASGI server",
+         "poll": ["/api/chair-occupancy/", "/api/analytics/detection-status/", "/api/entry-state/"]},
+        status=501,
+    )
+
+
+@asgi_only(live_events_unavailable)
+async def live_events_async(request):
+    """Server-sent events for the dashboard: occupancy diffs, entry counts and detection status.
+
+    Replaces polling chair-occupancy/, detection-status/ and entry-state/.
+    A reconnecting EventSource sends Last-Event-ID and gets only what it
+    missed, or a fresh snapshot when the backlog doesn't reach back that far.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    cafe = await UserCafe.objects.filter(user=user).afirst()
+    if not cafe:
+        return JsonResponse({"error": "No cafe linked to user"}, status=400)
+
+    last_event_id = parse_last_event_id(request.headers.get("Last-Event-ID") or request.GET.get("last_event_id"))
+    response = StreamingHttpResponse(live_event_stream(cafe.id, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def live_event_stream(cafe_id, last_event_id):
+    client = async_redis()
+    watcher = live_event_watcher()
+    await watcher.start()
+    # Subscribed before reading current state, so nothing published in between is lost
+    queue = watcher.subscribe(cafe_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        occupancy_version, event_id = last_event_id or (None, None)
+
+        current_version = await aread_occupancy_version(client, cafe_id)
+        if occupancy_version != current_version:
+            snapshot = await aread_cafe_occupancy(client, cafe_id)
+            occupancy_version = snapshot["version"]
+            yield sse("occupancy_snapshot", json.dumps(snapshot), f"{occupancy_version}-{event_id or 0}")
+        # Diffs up to here are in the snapshot (or were sent before the reconnect)
+        skip_occupancy = occupancy_version
+
+        current_id = await aread_live_seq(client, cafe_id)
+        missed = None
+        if event_id is not None and event_id <= current_id:
+            missed = await aread_live_events_since(client, cafe_id, event_id)
+            if not missed and event_id < current_id:
+                missed = None  # the backlog is gone
+        if missed is None:
+            event_id = current_id
+            yield sse("state", json.dumps(await aread_live_state(client, cafe_id)), f"{occupancy_version}-{event_id}")
+        else:
+            for missed_id, event_type, payload in missed:
+                event_id = missed_id
+                yield sse(event_type, payload, f"{occupancy_version}-{event_id}")
+
+        while True:
+            if queue.overflowed:
+                # Fell behind (or the watcher died): start over from a snapshot
+                queue.overflowed = False
+                while not queue.empty():
+                    queue.get_nowait()
+                await watcher.start()
+                snapshot = await aread_cafe_occupancy(client, cafe_id)
+                occupancy_version = skip_occupancy = snapshot["version"]
+                event_id = await aread_live_seq(client, cafe_id)
+                yield sse("occupancy_snapshot", json.dumps(snapshot), f"{occupancy_version}-{event_id}")
+                yield sse("state", json.dumps(await aread_live_state(client, cafe_id)), f"{occupancy_version}-{event_id}")
+                continue
+            try:
+                kind, message, raw = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+
+            if kind == "occupancy":
+                # Cameras bump the shared version independently, so diffs can arrive slightly out of order
+                if message["version"] <= skip_occupancy:
+                    continue
+                occupancy_version = max(occupancy_version, message["version"])
+                yield sse("occupancy", raw, f"{occupancy_version}-{event_id}")
+            else:
+                if message["id"] <= event_id:
+                    continue
+                event_id = message["id"]
+                yield sse(message["type"], raw, f"{occupancy_version}-{event_id}")
+    finally:
+        watcher.unsubscribe(cafe_id, queue)
@@ -0,0 +1,140 @@
+# capture.py
+import threading
+import time
+import cv2
+
+RECONNECT_DELAY = 2.0  # seconds between attempts when a live stream drops
+OPEN_TIMEOUT = 15.0
+
+
+class FrameReader:
+    """Decodes a source on its own thread and keeps only the newest frame.
+
+    The detection loop takes whatever is freshest instead of draining OpenCV's
+    buffer, so analysis never falls behind real time. Frames that get replaced
+    before anyone reads them are counted as dropped.
+    """
+
+    def __init__(self, source, paced=False, loop=False, reconnect_delay=RECONNECT_DELAY):
+        self.source = source
+        self.paced = paced  # sleep to the file's native FPS instead of decoding as fast as possible
+        self.loop = loop  # rewind at end of file (sample videos) instead of reconnecting
+        self.reconnect_delay = reconnect_delay
+
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.consumed = True
+        self.native_fps = 0.0
+
+        self.frames_decoded = 0
+        self.frames_dropped = 0
+        self.frames_consumed = 0
+        self.reconnects = 0
+
+        self.running = False
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+
+    # === Lifecycle ===
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="frame-reader", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, timeout=5):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def wait_ready(self, timeout=OPEN_TIMEOUT):
+        # True once the source has been opened, False if it failed or timed out
+        return self.ready.wait(timeout) and self.error is None
+
+    # === Consumer Side ===
+    def read_latest(self, after_seq=0, timeout=1.0):
+        """Return (seq, frame) for the newest frame newer than after_seq, or (after_seq, None) on timeout."""
+        with self.cond:
+            if self.seq <= after_seq:
+                self.cond.wait_for(lambda: self.seq > after_seq or not self.running, timeout)
+            if self.seq <= after_seq or self.frame is None:
+                return after_seq, None
+            self.consumed = True
+            self.frames_consumed += 1
+            return self.seq, self.frame
+
+    def stats(self):
+        return {
+            "frames_decoded": self.frames_decoded,
+            "frames_dropped": self.frames_dropped,
+            "frames_consumed": self.frames_consumed,
+            "reconnects": self.reconnects,
+            "native_fps": round(self.native_fps, 2),
+            "paced": self.paced,
+        }
+
+    # === Producer Side ===
+    def publish(self, frame):
+        with self.cond:
+            if not self.consumed:
+                self.frames_dropped += 1
+            self.frame = frame
+            self.seq += 1
+            self.consumed = False
+            self.frames_decoded += 1
+            self.cond.notify_all()
+
+    def open(self):
+        cap = cv2.VideoCapture(self.source)
+        if cap.isOpened():
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Ignored by some backends, harmless elsewhere
+            self.native_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return cap
+
+    def run(self):
+        cap = self.open()
+        if not cap.isOpened():
+            print(f"[ERROR] Failed to open stream: {self.source}")
+            self.error = "failed to open stream"
+            self.running = False
+            self.ready.set()
+            return
+        self.ready.set()
+
+        frame_interval = 1.0 / self.native_fps if self.paced and self.native_fps > 0 else 0.0
+        next_frame_at = time.monotonic()
+
+        try:
+            while self.running:
+                ret, frame = cap.read()
+                if not ret:
+                    if self.loop:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        next_frame_at = time.monotonic()
+                        continue
+                    # Live stream dropped: reopen rather than spinning on a dead capture
+                    cap.release()
+                    time.sleep(self.reconnect_delay)
+                    self.reconnects += 1
+                    cap = self.open()
+                    continue
+
+                if frame_interval:
+                    next_frame_at += frame_interval
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_at = time.monotonic()  # Don't try to catch up after a stall
+
+                self.publish(frame)
+        finally:
+            cap.release()
+            with self.cond:
+                self.cond.notify_all()
@@ -4,30 +4,26 @@ import time
 import redis
 import json
 import cv2
-from ultralytics import YOLO
-import django
-import os
-import sys
-from datetime import datetime
-from django.utils.timezone import make_aware
 import backend_app.shared_video as shared_video
-import pickle
 
-# === Django setup ===
-sys.path.append("D:/Kuliah/Tugas Akhir/TheTugasFinal/backend")
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
-django.setup()
-
-from backend_app.models import EntryEvent, SeatDetection, Camera, Seat
-from backend_app.face_recognition import process_face_recognition, detector as face_detector, recognizer as face_recognizer, recognition_threshold
-
-# === Thread Control ===
-detection_thread = None
-running = False
-
-# === Redis and YOLO model ===
+# Imported by views and commands once Django is set up; model weights load on
+# first use (see model_registry), so importing this module loads nothing.
+from django.db import connection
+from backend_app.models import Camera, UserCafe, Floor
+from backend_app.face_recognition import face_indexes, quality_stats
+from backend_app.face_pipeline import FaceRecognitionPool
+from backend_app.visits import visits
+from backend_app.inference import INFER_TIMEOUT, InferenceScheduler, StreamTracker
+from backend_app.capture import FrameReader
+from backend_app.seat_state import SeatStateStore
+from backend_app.persistence import PersistenceQueue
+from backend_app.live_events import LiveEventPublisher
+from backend_app.occupancy import OccupancyPublisher
+from backend_app.identity import TrackIdentityCache
+from backend_app.model_registry import models
+
+# === Redis ===
 redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
-model = YOLO("D:/Kuliah/Tugas Akhir/TheTugasFinal/models/detection_models/best.pt")
 
 
 
@@ -38,64 +34,36 @@ IOU_OCCUPIED_THRESHOLD = 0.5
 OCCUPANCY_TIME_THRESHOLD = 40
 COOLDOWN_FRAME_THRESHOLD = 5
 PROXIMITY_PADDING = 20
+OCCUPANCY_PUBLISH_INTERVAL = 0.0  # minimum seconds between occupancy writes; 0 = at most once per frame
+CHECKPOINT_INTERVAL = 30  # seconds between chair state checkpoints to Redis
+PACE_SAMPLE_VIDEO = True  # play sample videos at their native FPS so timers behave like a live camera
 line_pts = [(1690, 864), (1164, 1018)]
 
-active_detections = {}
-
 # === Utility Functions ===
-def calculate_iou(boxA, boxB):
-    xA = max(boxA[0], boxB[0])
-    yA = max(boxA[1], boxB[1])
-    xB = min(boxA[2], boxB[2])
-    yB = min(boxA[3], boxB[3])
-    interArea = max(0, xB - xA) * max(0, yB - yA)
-    boxAArea = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-    boxBArea = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-    return interArea / float(boxAArea + boxBArea - interArea + 1e-6)
-
-def is_center_inside(person_box, chair_box):
-    cx = (person_box[0] + person_box[2]) // 2
-    cy = (person_box[1] + person_box[3]) // 2
-    return chair_box[0] <= cx <= chair_box[2] and chair_box[1] <= cy <= chair_box[3]
-
-def is_vertically_aligned(chair_box, person_box):
-    _, y1_chair, _, y2_chair = chair_box
-    _, y1_person, _, y2_person = person_box
-    return y1_person < y2_chair and y2_person > y1_chair
-
-def is_person_near_chair(person_box, chair_box, padding=PROXIMITY_PADDING):
-    px = (person_box[0] + person_box[2]) // 2
-    py = (person_box[1] + person_box[3]) // 2
-    cx1 = chair_box[0] - padding
-    cy1 = chair_box[1] - padding
-    cx2 = chair_box[2] + padding
-    cy2 = chair_box[3] + padding
-    return cx1 <= px <= cx2 and cy1 <= py <= cy2
+from backend_app.association import chairs_seated
 
 def get_side_of_line(p1, p2, point):
     return (p2[0] - p1[0]) * (point[1] - p1[1]) - (p2[1] - p1[1]) * (point[0] - p1[0])
 
-# === Detection Logic ===
-def run_detection():
-    global running, active_detections
-    running = True
+# === Redis Keys ===
+def chair_cache_key(cafe_id, camera_id):
+    return f"cached_chair_positions:cafe:{cafe_id}:camera:{camera_id}"
 
-    cafe_id = redis_client.get("active_cafe_id")
-    source_type = redis_client.get("source_type") or "camera"
+# === Source Resolution ===
+def camera_stream_url(camera):
+    return f"rtsp://{camera.admin_name}:{camera.admin_password}@{camera.ip_address}/{camera.channel}stream2"
 
-    from backend_app.models import UserCafe, Floor
+def resolve_sources(cafe_id, source_type="camera", camera_ids=None, sample_path=None):
+    cafe = UserCafe.objects.filter(id=cafe_id).first()
+    if not cafe:
+        print("[ERROR] Cafe not found.")
+        return []
 
     if source_type == "sample":
-        stream_url = redis_client.get("sample_video_path") or "D:/default_sample.mp4"
-
-        # Fallback cafe
-        cafe = UserCafe.objects.filter(id=cafe_id).first()
-        if not cafe:
-            print("[ERROR] Cafe not found.")
-            return
+        stream_url = sample_path or "D:/default_sample.mp4"
 
         # Try to get or create a Camera for video source
-        selected_camera, _ = Camera.objects.get_or_create(
+        sample_camera, _ = Camera.objects.get_or_create(
             cafe=cafe,
             ip_address="127.0.0.1",  # Fake IP
             channel="video",
@@ -107,144 +75,208 @@ def run_detection():
                 "floor": Floor.objects.filter(cafe=cafe).first()  # Use any floor from this cafe
             }
         )
-    else:
-        selected_ids = json.loads(redis_client.get("selected_camera_ids") or "[]")
-        selected_camera = Camera.objects.filter(id__in=selected_ids, cafe_id=cafe_id, status="active").first()
-        if not selected_camera:
-            print(f"[ERROR] No active camera found for cafe {cafe_id}.")
-            return
-        stream_url = f"rtsp://{selected_camera.admin_name}:{selected_camera.admin_password}@{selected_camera.ip_address}/{selected_camera.channel}stream2 "
-
-    print(f"[INFO] Source Type: {source_type}")
-    print(f"[INFO] Stream URL: {stream_url}")
-
-
-
-    cap = cv2.VideoCapture(stream_url)
-    if not cap.isOpened():
-        print(f"[ERROR] Failed to open stream: {stream_url}")
-        return
-
-    frame_count = 0
-    registered_chairs = {}
-    person_memory = {}
-    next_chair_id = 0
+        return [(sample_camera, stream_url)]
+
+    cameras = Camera.objects.filter(id__in=camera_ids or [], cafe_id=cafe_id, status="active")
+    sources = [(camera, camera_stream_url(camera)) for camera in cameras]
+    if not sources:
+        print(f"[ERROR] No active camera found for cafe {cafe_id}.")
+    return sources
+
+# === Per-Camera Worker ===
+class CameraWorker:
+    """Runs detection for one camera and owns its chair, tracker and output state."""
+
+    def __init__(self, camera, stream_url, cafe_id, scheduler, persistence, face_pool, source_type="camera", paced=None,
+                 on_exit=None):
+        self.camera = camera
+        self.camera_id = camera.id
+        self.cafe_id = cafe_id
+        self.stream_url = stream_url
+        self.source_type = source_type
+        self.scheduler = scheduler
+        self.persistence = persistence
+        self.face_pool = face_pool
+        self.paced = PACE_SAMPLE_VIDEO if paced is None else paced
+        self.on_exit = on_exit  # called from the worker thread once the loop has ended
+        self.reader = None
+
+        self.running = False
+        self.thread = None
+        self.state = "stopped"
+        self.error = None
+        self.started_at = None
+        self.last_frame_at = None
+        self.fps = 0.0
+
+        self.frame_count = 0
+        self.seats = SeatStateStore()
+        self.last_checkpoint = 0.0
+        self.person_memory = {}
+        self.identities = TrackIdentityCache()
+        self.face_results = []  # latest faces from the face pool, drawn until the next result
+        self.publisher = OccupancyPublisher(redis_client, cafe_id, camera.id, OCCUPANCY_PUBLISH_INTERVAL)
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.running = True
+        self.state = "starting"
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=f"detector-camera-{self.camera_id}", daemon=True)
+        self.thread.start()
+        return True
 
-    cached = redis_client.get(f"cached_chair_positions:cafe:{cafe_id}")
-    if cached:
+    def stop(self, timeout=5):
+        self.running = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def status(self):
+        return {
+            "camera_id": self.camera_id,
+            "cafe_id": self.cafe_id,
+            "source_type": self.source_type,
+            "state": self.state,
+            "error": self.error,
+            "frames": self.frame_count,
+            "fps": round(self.fps, 2),
+            "chairs": len(self.seats),
+            "started_at": self.started_at,
+            "last_frame_at": self.last_frame_at,
+            "capture": self.reader.stats() if self.reader else None,
+            "occupancy": self.publisher.stats(),
+            "identities": self.identities.status(),
+        }
+
+    def load_cached_chairs(self):
+        cached = redis_client.get(chair_cache_key(self.cafe_id, self.camera_id))
+        if not cached:
+            return
         try:
-            data = json.loads(cached)
-            registered_chairs = {
-                int(cid): {
-                    "box": tuple(c["box"]),
-                    "occupied": c["occupied"],
-                    "start_time": c["start_time"],
-                    "cooldown": c["cooldown"]
-                } for cid, c in data["registered_chairs"].items()
-            }
-            next_chair_id = data["next_chair_id"]
+            self.seats = SeatStateStore.from_cache(json.loads(cached))
         except:
             pass
 
-    while True:
-        if not running:
-            break
-
-        ret, frame = cap.read()
-        if not ret:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-            continue
+    def checkpoint_chairs(self, current_time):
+        redis_client.set(chair_cache_key(self.cafe_id, self.camera_id), json.dumps(self.seats.to_cache()))
+        self.last_checkpoint = current_time
 
-        frame_count += 1
-        current_time = time.time()
-        results = model.track(frame, persist=True)[0]
-        detected_persons = []
+    def run(self):
+        print(f"[INFO] Camera {self.camera_id} Source Type: {self.source_type}")
+        print(f"[INFO] Camera {self.camera_id} Stream URL: {self.stream_url}")
 
-        face_results = process_face_recognition(frame)
-        for (x, y, w, h), label in face_results:
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-        if results and results.boxes is not None:
-            for box in results.boxes:
-                cls_id = int(box.cls[0])
-                conf = float(box.conf[0])
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                if cls_id == 0 and frame_count <= 3:
-                    new_box = (x1, y1, x2, y2)
-                    if not any(calculate_iou(c['box'], new_box) > 0.8 for c in registered_chairs.values()):
-                        registered_chairs[next_chair_id] = {
-                            'box': new_box,
-                            'occupied': False,
-                            'start_time': None,
-                            'cooldown': 0
-                        }
-                        next_chair_id += 1
-                elif cls_id == 2 and conf >= CONFIDENCE_THRESHOLD and box.id is not None:
-                    track_id = int(box.id[0])
-                    person_box = (x1, y1, x2, y2)
-                    detected_persons.append(person_box)
-                    cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-                    current_side = get_side_of_line(line_pts[0], line_pts[1], (cx, cy))
-                    prev_side = person_memory.get(track_id)
-                    if prev_side is not None:
-                        if prev_side < 0 and current_side >= 0:
-                            EntryEvent.objects.create(event_type="enter", track_id=track_id, camera=selected_camera)
-                        elif prev_side > 0 and current_side <= 0:
-                            EntryEvent.objects.create(event_type="exit", track_id=track_id, camera=selected_camera)
-                    person_memory[track_id] = current_side
-
-        for chair_id, state in registered_chairs.items():
-            chair_box = state['box']
-            seated = any(
-                (is_center_inside(p, chair_box) or is_person_near_chair(p, chair_box)) and is_vertically_aligned(chair_box, p)
-                for p in detected_persons
-            )
+        is_sample = self.source_type == "sample"
+        self.reader = FrameReader(self.stream_url, paced=is_sample and self.paced, loop=is_sample)
+        self.reader.start()
+        try:
+            if not self.reader.wait_ready():
+                self.state = "error"
+                self.error = self.reader.error or "timed out opening stream"
+                return
+
+            # Detection is batched across cameras, tracking stays per stream
+            tracker = StreamTracker(frame_rate=int(self.reader.native_fps or 30))
+            self.scheduler.register(self.camera_id)
+            self.publisher.reset()
+            self.load_cached_chairs()
+            self.started_at = time.time()
+            self.state = "running"
+
+            last_seq = 0
+            while self.running:
+                # Always work on the freshest frame; never block on decoding
+                last_seq, frame = self.reader.read_latest(last_seq)
+                if frame is None:
+                    continue
 
-            if seated:
-                state['cooldown'] = 0
-                if state['start_time'] is None:
-                    state['start_time'] = current_time
-                elif not state['occupied'] and (current_time - state['start_time']) >= OCCUPANCY_TIME_THRESHOLD:
-                    state['occupied'] = True
-                    seat_obj, created = Seat.objects.get_or_create(
-                        cafe_id=cafe_id,
-                        chair_index=chair_id,
-                        defaults={
-                            "x1": chair_box[0],
-                            "y1": chair_box[1],
-                            "x2": chair_box[2],
-                            "y2": chair_box[3],
-                        }
-                    )
-                    if not created:
-                        seat_obj.x1 = chair_box[0]
-                        seat_obj.y1 = chair_box[1]
-                        seat_obj.x2 = chair_box[2]
-                        seat_obj.y2 = chair_box[3]
-                        seat_obj.save()
-
-                    
-                    cx = (chair_box[0] + chair_box[2]) // 2
-                    cy = (chair_box[1] + chair_box[3]) // 2
-                    detection = SeatDetection.objects.create(
-                        camera=selected_camera,
-                        seat=seat_obj,
-                        time_start=make_aware(datetime.utcfromtimestamp(state['start_time']))
-                    )
-                    active_detections[chair_id] = detection
+                current_time = time.time()
+                # Bounded wait so a stop request is noticed even if the scheduler stalls
+                result = self.scheduler.infer(self.camera_id, frame, timeout=INFER_TIMEOUT)
+                if result is None:
+                    continue
+                self.frame_count += 1
+                detections = tracker.update(result, frame)
+                self.process_frame(frame, detections, current_time)
+                if current_time - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.checkpoint_chairs(current_time)
+
+                if self.last_frame_at:
+                    elapsed = current_time - self.last_frame_at
+                    if elapsed > 0:
+                        self.fps = 0.9 * self.fps + 0.1 * (1.0 / elapsed)
+                self.last_frame_at = current_time
+
+            self.checkpoint_chairs(time.time())
+            self.state = "stopped"
+        except Exception as e:
+            print(f"[ERROR] Camera {self.camera_id} detection failed: {e}")
+            self.state = "error"
+            self.error = str(e)
+        finally:
+            self.running = False
+            self.scheduler.unregister(self.camera_id)
+            self.face_pool.discard(self.camera_id)
+            self.reader.stop()
+            if self.on_exit is not None:
+                self.on_exit(self)  # may flush visits on this thread's connection, so before closing it
+            connection.close()
+            print(f"[YOLO] Camera {self.camera_id} detection loop stopped cleanly.")
+
+    def process_frame(self, frame, detections, current_time):
+        detected_persons = []
+        tracked_persons = []  # (track_id, box)
+
+        for (x1, y1, x2, y2), cls_id, conf, track_id in zip(
+            detections.boxes.tolist(), detections.classes.tolist(),
+            detections.confidences.tolist(), detections.track_ids.tolist()
+        ):
+            if cls_id == 0 and self.frame_count <= 3:
+                self.seats.register((x1, y1, x2, y2))
+            elif cls_id == 2 and conf >= CONFIDENCE_THRESHOLD and track_id >= 0:
+                detected_persons.append((x1, y1, x2, y2))
+                tracked_persons.append((track_id, (x1, y1, x2, y2)))
+
+        # Faces are recognized on the face pool; results for earlier frames are applied as they
+        # arrive, matched to the tracks of the frame they came from
+        track_ids = [track_id for track_id, _ in tracked_persons]
+        self.identities.observe(track_ids, current_time)
+        for result in self.face_pool.poll(self.camera_id):
+            for track_id, face_id, first_seen in self.identities.assign(result.persons, result.faces, current_time):
+                # Entry events recorded before the face was recognized get the customer too
+                self.persistence.record_identity(self.camera_id, track_id, face_id, first_seen)
+            self.face_results = result.faces
+        if self.identities.needs_recognition(track_ids, current_time):
+            # Only requested while some tracked person lacks a fresh identity
+            self.face_pool.submit(self.camera_id, self.cafe_id, self.frame_count, frame, tracked_persons)
+
+        for track_id, (x1, y1, x2, y2) in tracked_persons:
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+            current_side = get_side_of_line(line_pts[0], line_pts[1], (cx, cy))
+            prev_side = self.person_memory.get(track_id)
+            if prev_side is not None:
+                if prev_side < 0 and current_side >= 0:
+                    self.persistence.record_entry(self.camera_id, "enter", track_id, self.identities.face_id(track_id))
+                elif prev_side > 0 and current_side <= 0:
+                    self.persistence.record_entry(self.camera_id, "exit", track_id, self.identities.face_id(track_id))
+            self.person_memory[track_id] = current_side
+
+        # One vectorized pass over every chair/person pair, then apply the state transitions
+        seated_flags = chairs_seated(self.seats.active_boxes(), detected_persons, PROXIMITY_PADDING)
+        events = self.seats.update(seated_flags, current_time, OCCUPANCY_TIME_THRESHOLD, COOLDOWN_FRAME_THRESHOLD)
+
+        # Database writes happen on the persistence thread, not here
+        for event in events:
+            if event.kind == "occupied":
+                self.persistence.record_seat_open(self.cafe_id, self.camera_id, event.chair_id, event.box, event.start_time)
             else:
-                state['cooldown'] += 1
-                if state['cooldown'] >= COOLDOWN_FRAME_THRESHOLD:
-                    if state['occupied']:
-                        detection = active_detections.get(chair_id)
-                        if detection:
-                            detection.time_end = make_aware(datetime.utcfromtimestamp(current_time))
-                            detection.save()
-                            del active_detections[chair_id]
-                    state['start_time'] = None
-                    state['occupied'] = False
+                self.persistence.record_seat_close(self.camera_id, event.chair_id, event.start_time, event.timestamp)
+
+        # Only changed chairs are written, once per frame at most
+        self.publisher.publish(self.seats.items(), current_time)
 
         resized_frame = cv2.resize(frame, (640, 480))
 
@@ -253,62 +285,190 @@ def run_detection():
         scale_y = 480 / frame.shape[0]
 
         # Draw chair boxes
-        for chair_id, state in registered_chairs.items():
-            x1, y1, x2, y2 = state["box"]
+        for chair_id, (x1, y1, x2, y2), occupied, _ in self.seats.items():
             x1 = int(x1 * scale_x)
             y1 = int(y1 * scale_y)
             x2 = int(x2 * scale_x)
             y2 = int(y2 * scale_y)
-            color = (0, 0, 255) if state["occupied"] else (0, 255, 255)
-            label = f"Chair {chair_id}: {'Occupied' if state['occupied'] else 'Available'}"
+            color = (0, 0, 255) if occupied else (0, 255, 255)
+            label = f"Chair {chair_id}: {'Occupied' if occupied else 'Available'}"
             cv2.rectangle(resized_frame, (x1, y1), (x2, y2), color, 2)
             cv2.putText(resized_frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
 
+        # Draw faces
+        for (x, y, w, h), label, _ in self.face_results:
+            x1 = int(x * scale_x)
+            y1 = int(y * scale_y)
+            x2 = int((x + w) * scale_x)
+            y2 = int((y + h) * scale_y)
+            cv2.rectangle(resized_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(resized_frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
         # Draw persons
-        if results and results.boxes is not None:
-            for box in results.boxes:
-                cls_id = int(box.cls[0])
-                if cls_id != 2:  # Only draw persons
-                    continue
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                x1 = int(x1 * scale_x)
-                y1 = int(y1 * scale_y)
-                x2 = int(x2 * scale_x)
-                y2 = int(y2 * scale_y)
-                cv2.rectangle(resized_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                cv2.putText(resized_frame, "Person", (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-                redis_client.set(f"chair_occupancy:cafe:{cafe_id}", json.dumps({
-                    "chairs": {
-                        str(chair_id): {
-                            "status": "occupied" if state["occupied"] else "available",
-                            "box": list(state["box"]),
-                            "start_time": state.get("start_time")
-                        } for chair_id, state in registered_chairs.items()
-                    },
-                    "timestamp": current_time
-                }))
-
-                time.sleep(0.01)
-
-        with shared_video.video_lock:
-            shared_video.latest_frame = resized_frame.copy()
-            
-    cap.release()
-    print("[YOLO] Detection loop stopped cleanly.")
+        for (x1, y1, x2, y2), cls_id, track_id in zip(
+            detections.boxes.tolist(), detections.classes.tolist(), detections.track_ids.tolist()
+        ):
+            if cls_id != 2:  # Only draw persons
+                continue
+            x1 = int(x1 * scale_x)
+            y1 = int(y1 * scale_y)
+            x2 = int(x2 * scale_x)
+            y2 = int(y2 * scale_y)
+            label = self.identities.face_id(track_id) or "Person"
+            cv2.rectangle(resized_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(resized_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+        shared_video.frame_bus.publish(self.camera_id, resized_frame)
+
+        return resized_frame
+
+# === Detection Engine ===
+class DetectionEngine:
+    """Keeps one CameraWorker per active camera and exposes start/stop/status per camera."""
+
+    def __init__(self):
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.events = LiveEventPublisher(redis_client)
+        self.publish_lock = threading.Lock()  # state is read and published as one step, so the last event is current
+        self.scheduler = InferenceScheduler()
+        self.persistence = PersistenceQueue(events=self.events)
+        self.face_pool = FaceRecognitionPool()
+
+    def start(self, cafe_id, source_type="camera", camera_ids=None, sample_path=None, paced=None):
+        started = []
+        for camera, stream_url in resolve_sources(cafe_id, source_type, camera_ids, sample_path):
+            if self.start_camera(camera, stream_url, cafe_id, source_type, paced):
+                started.append(camera.id)
+        if started:
+            self.publish_state(cafe_id)
+        return started
+
+    def start_camera(self, camera, stream_url, cafe_id, source_type="camera", paced=None):
+        with self.lock:
+            worker = self.workers.get(camera.id)
+            if worker is not None and worker.is_alive():
+                return False
+            self.scheduler.start()
+            self.persistence.start()
+            self.face_pool.start()
+            worker = CameraWorker(
+                camera, stream_url, cafe_id, self.scheduler, self.persistence, self.face_pool, source_type, paced,
+                on_exit=self.worker_exited,
+            )
+            self.workers[camera.id] = worker
+            return worker.start()
+
+    def stop_camera(self, camera_id, timeout=5):
+        with self.lock:
+            worker = self.workers.pop(camera_id, None)
+        if worker is None:
+            return False
+        worker.stop(timeout=timeout)
+        shared_video.frame_bus.remove(camera_id)
+        self.publish_state(worker.cafe_id)
+        self.shutdown_if_idle(timeout)
+        return True
 
-# === Control Functions ===
-def start_detection():
-    global detection_thread, running
-    if detection_thread is None or not detection_thread.is_alive():
-        detection_thread = threading.Thread(target=run_detection, daemon=True)
-        detection_thread.start()
+    def worker_exited(self, worker):
+        # A worker that ended on its own (stream error, failed model) stops counting as active
+        with self.lock:
+            if self.workers.get(worker.camera_id) is not worker:
+                return  # already removed by stop_camera()/stop()
+            del self.workers[worker.camera_id]
+        print(f"[WARN] Camera {worker.camera_id} detection ended ({worker.state}: {worker.error})")
+        shared_video.frame_bus.remove(worker.camera_id)
+        self.publish_state(worker.cafe_id)
+        self.shutdown_if_idle()
+
+    def shutdown_if_idle(self, timeout=5):
+        # Held under the lock so a camera starting meanwhile can't have its pipeline stopped under it
+        with self.lock:
+            if not self.workers:
+                self.shutdown(timeout)
+
+    def shutdown(self, timeout=5):
+        """Stops the shared pipeline once no camera is left and saves what only lives in memory."""
+        self.scheduler.stop(timeout=timeout)
+        self.face_pool.stop(timeout=timeout)
+        self.persistence.stop()  # flushes everything the workers queued
+        face_indexes.save_all()
+        visits.flush()
+
+    def stop(self, timeout=5):
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        # Signal every worker first so they wind down in parallel
+        for worker in workers:
+            worker.running = False
+        for worker in workers:
+            worker.stop(timeout=timeout)
+        for cafe_id in {worker.cafe_id for worker in workers}:
+            self.publish_state(cafe_id)
+        if not workers:
+            redis_client.set("detection_status", "stopped")  # nothing to announce, but clear a stale flag
+        self.shutdown(timeout)
+        shared_video.frame_bus.clear()
         return True
-    return False
-
-def stop_detection():
-    global running, detection_thread
-    running = False
-    if detection_thread and detection_thread.is_alive():
-        detection_thread.join(timeout=5)
-    return True
\ No newline at end of file
+
+    def publish_state(self, cafe_id):
+        """Announces the cafe's remaining cameras ("stopped" once none are left) and updates detection_status."""
+        with self.publish_lock:
+            with self.lock:
+                running = bool(self.workers)
+                cameras = {
+                    camera_id: worker.status() for camera_id, worker in self.workers.items()
+                    if str(worker.cafe_id) == str(cafe_id)
+                }
+            try:
+                redis_client.set("detection_status", "running" if running else "stopped")
+                self.events.publish_detection(cafe_id, "running" if cameras else "stopped", cameras)
+            except Exception as e:
+                print(f"[WARN] Failed to publish detection state for cafe {cafe_id}: {e}")
+
+    def is_running(self):
+        with self.lock:
+            return any(worker.is_alive() for worker in self.workers.values())
+
+    def status(self):
+        with self.lock:
+            return {camera_id: worker.status() for camera_id, worker in self.workers.items()}
+
+    def metrics(self):
+        return {
+            "inference": self.scheduler.status(),
+            "persistence": self.persistence.status(),
+            "faces": self.face_pool.status(),
+            "face_quality": dict(quality_stats),
+            "face_indexes": face_indexes.status(),
+            "visits": visits.status(),
+            "models": models.status(),
+        }
+
+engine = DetectionEngine()
+
+# === Control Functions ===
+def start_detection(cafe_id=None, source_type=None, camera_ids=None, sample_path=None, paced=None):
+    # Fall back to the configuration the views store in Redis
+    cafe_id = cafe_id or redis_client.get("active_cafe_id")
+    source_type = source_type or redis_client.get("source_type") or "camera"
+    if camera_ids is None:
+        camera_ids = json.loads(redis_client.get("selected_camera_ids") or "[]")
+    if sample_path is None:
+        sample_path = redis_client.get("sample_video_path")
+    return engine.start(cafe_id, source_type, camera_ids, sample_path, paced)
+
+def stop_detection(camera_ids=None):
+    if camera_ids:
+        for camera_id in camera_ids:
+            engine.stop_camera(int(camera_id))
+    else:
+        engine.stop()
+    return True
+
+def detection_state():
+    return engine.status()
+
+def detection_metrics():
+    return engine.metrics()
@@ -0,0 +1,99 @@
+# face_images.py
+import glob
+import hashlib
+import io
+import os
+
+import cv2 as cv
+import numpy as np
+from django.conf import settings
+
+FACE_IMAGE_DIR = os.path.join(settings.MEDIA_ROOT, "face_images")
+FACE_IMAGE_REFS_KEY = "face_image_refs"  # Redis hash, face_id -> content hash of its crop
+LEGACY_FACE_IMAGES_KEY = "face_images"  # Redis hash of JPEG bytes the store replaces
+JPEG_QUALITY = 70
+THUMBNAIL_SIZE = 96  # px, longest side
+
+
+def as_text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class FaceImageStore:
+    """Customer face crops as JPEG files named by their SHA-256, plus a thumbnail of each.
+
+    Redis only keeps the face_id -> hash reference, so its memory no longer
+    grows with image bytes. Identical crops are stored once.
+    """
+
+    def __init__(self, client, root=FACE_IMAGE_DIR):
+        # client must return bytes (decode_responses=False) for the legacy JPEG fallback
+        self.client = client
+        self.root = root
+
+    def path(self, digest, thumbnail=False):
+        return os.path.join(self.root, "thumbs" if thumbnail else "full", digest[:2], f"{digest}.jpg")
+
+    def write(self, path, data):
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def save(self, face_id, image):
+        _, buffer = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return self.save_jpeg(face_id, buffer.tobytes(), image)
+
+    def save_jpeg(self, face_id, data, image=None):
+        digest = hashlib.sha256(data).hexdigest()
+        self.write(self.path(digest), data)
+
+        if not os.path.exists(self.path(digest, thumbnail=True)):
+            if image is None:
+                image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+            if image is not None and image.size:
+                height, width = image.shape[:2]
+                scale = min(1.0, THUMBNAIL_SIZE / max(height, width))
+                thumbnail = cv.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv.INTER_AREA)
+                _, buffer = cv.imencode(".jpg", thumbnail, [cv.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                self.write(self.path(digest, thumbnail=True), buffer.tobytes())
+
+        self.client.hset(FACE_IMAGE_REFS_KEY, face_id, digest)
+        return digest
+
+    def digest(self, face_id):
+        return as_text(self.client.hget(FACE_IMAGE_REFS_KEY, face_id))
+
+    def open(self, face_id, thumbnail=False):
+        """Binary file object for the crop, or None. Falls back to the legacy Redis hash."""
+        digest = self.digest(face_id)
+        if digest:
+            path = self.path(digest, thumbnail)
+            if not os.path.exists(path) and thumbnail:
+                path = self.path(digest)
+            if os.path.exists(path):
+                return open(path, "rb")
+        legacy = self.client.hget(LEGACY_FACE_IMAGES_KEY, face_id)
+        if legacy is not None:
+            return io.BytesIO(legacy)
+        return None
+
+    def delete(self, *face_ids):
+        # Only the references go; files may be shared and are removed by prune()
+        if face_ids:
+            self.client.hdel(FACE_IMAGE_REFS_KEY, *face_ids)
+            self.client.hdel(LEGACY_FACE_IMAGES_KEY, *face_ids)
+
+    def prune(self):
+        """Delete files no face_id refers to. Returns how many were removed."""
+        referenced = {as_text(digest) for digest in self.client.hvals(FACE_IMAGE_REFS_KEY)}
+        removed = 0
+        for path in glob.glob(os.path.join(self.root, "*", "*", "*.jpg")):
+            if os.path.basename(path)[:-len(".jpg")] not in referenced:
+                os.remove(path)
+                removed += 1
+        return removed
+
@@ -0,0 +1,406 @@
+# face_index.py
+import glob
+import os
+import pickle
+import threading
+import uuid
+
+import numpy as np
+
+EMBEDDING_DIM = 128  # SFace feature size
+EMBEDDING_BYTES = EMBEDDING_DIM * 4  # one float32 vector, the stored form of an embedding
+
+# IVF parameters: identities are bucketed around IVF_LISTS centroids and a
+# query only scores the IVF_PROBES closest buckets.
+IVF_LISTS = 64
+IVF_PROBES = 8
+IVF_TRAIN_SAMPLE = 20000
+IVF_KMEANS_ITERATIONS = 10
+
+
+def normalize(features):
+    # Rows scaled to unit length, so a dot product is the cosine score recognizer.match() returns
+    features = np.asarray(features, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+# === Stored Embedding Format ===
+def encode_embedding(feature):
+    # Raw little-endian float32, EMBEDDING_BYTES long; no pickle
+    return np.asarray(feature, dtype="<f4").reshape(EMBEDDING_DIM).tobytes()
+
+def decode_embedding(payload):
+    """(1, EMBEDDING_DIM) float32 feature from either the raw format or a legacy pickled array."""
+    if len(payload) == EMBEDDING_BYTES:
+        return np.frombuffer(payload, dtype="<f4").reshape(1, EMBEDDING_DIM)
+    return np.asarray(pickle.loads(payload), dtype=np.float32).reshape(1, EMBEDDING_DIM)
+
+def is_legacy_embedding(payload):
+    return len(payload) != EMBEDDING_BYTES
+
+
+class EmbeddingMatrix:
+    """Known face embeddings as one L2-normalized float32 matrix plus a parallel name list.
+
+    Matching every face in a frame against every identity is a single matrix
+    product instead of one recognizer.match() call per pair.
+
+    Rows loaded from a snapshot stay in a read-only memory map (frozen), shared
+    with every other process that maps the same file; rows added afterwards go
+    to the in-memory matrix. Positions count frozen rows first.
+    """
+
+    kind = "exact"
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=1024):
+        self.dim = dim
+        self.count = 0
+        self.frozen = np.zeros((0, dim), dtype=np.float32)
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.names = []
+        self.positions = {}  # name -> row
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    @classmethod
+    def from_mapping(cls, known, **kwargs):
+        index = cls(capacity=max(len(known), 1024), **kwargs)
+        index.add_many(known.keys(), list(known.values()))
+        return index
+
+    def add(self, name, feature):
+        self.add_many([name], [feature])
+
+    def add_many(self, names, features):
+        names = list(names)
+        if not names:
+            return []
+        rows = normalize(features)
+        positions = []
+        with self.lock:
+            for name, row in zip(names, rows):
+                position = self.positions.get(name)
+                if position is not None and position < len(self.frozen):
+                    self.thaw()  # replacing a mapped row; rare enough to take a private copy
+                if position is None:
+                    appended = self.count - len(self.frozen)
+                    if appended == len(self.matrix):
+                        grown = np.zeros((max(2 * len(self.matrix), 16), self.dim), dtype=np.float32)
+                        grown[:appended] = self.matrix[:appended]
+                        self.matrix = grown
+                    position = self.count
+                    self.positions[name] = position
+                    self.names.append(name)
+                    self.count += 1
+                self.matrix[position - len(self.frozen)] = row
+                positions.append(position)
+        return positions
+
+    def thaw(self):
+        # Caller holds the lock. Moves the mapped rows into the private matrix.
+        frozen = len(self.frozen)
+        if not frozen:
+            return
+        appended = self.count - frozen
+        matrix = np.zeros((max(self.count, 1024), self.dim), dtype=np.float32)
+        matrix[:frozen] = self.frozen
+        matrix[frozen:self.count] = self.matrix[:appended]
+        self.matrix = matrix
+        self.frozen = np.zeros((0, self.dim), dtype=np.float32)
+
+    def take(self, positions):
+        # Rows at the given positions, from whichever segment holds them
+        positions = np.asarray(positions, dtype=np.int64)
+        frozen = len(self.frozen)
+        if not frozen:
+            return self.matrix[positions]
+        rows = np.empty((len(positions), self.dim), dtype=np.float32)
+        mapped = positions < frozen
+        rows[mapped] = self.frozen[positions[mapped]]
+        rows[~mapped] = self.matrix[positions[~mapped] - frozen]
+        return rows
+
+    def all_rows(self):
+        with self.lock:
+            frozen = len(self.frozen)
+            appended = self.matrix[:self.count - frozen]
+            return np.vstack([self.frozen, appended]) if frozen else appended.copy()
+
+    def scores(self, features):
+        # (faces, identities) cosine similarity matrix
+        queries = normalize(features)
+        with self.lock:
+            frozen = self.frozen
+            appended = self.matrix[:self.count - len(frozen)]
+        if not len(frozen):
+            return queries @ appended.T
+        return np.hstack([queries @ frozen.T, queries @ appended.T])
+
+    def match(self, features):
+        """Best (name, score) per query feature, "Unknown"/0.0 when nothing scores above zero."""
+        queries = normalize(features)
+        if self.count == 0 or len(queries) == 0:
+            return [("Unknown", 0.0)] * len(queries)
+        with self.lock:
+            names = self.names[:self.count]
+        scores = self.scores(queries)[:, :len(names)]
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(queries)), best]
+        return [
+            (names[i], float(score)) if score > 0.0 else ("Unknown", 0.0)
+            for i, score in zip(best.tolist(), best_scores.tolist())
+        ]
+
+    def status(self):
+        return {"backend": self.kind, "identities": self.count, "mapped": len(self.frozen)}
+
+    # === Snapshots ===
+    # A snapshot is a small .npz (names, metadata, backend state) plus a plain .npy
+    # matrix next to it. The .npy is what gets memory-mapped; every save writes a
+    # new one and then swaps the .npz, so readers never see a half-written pair.
+    def state(self):
+        return {"names": np.array(self.names, dtype=str)}
+
+    def save(self, path, **meta):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        matrix_file = f"{os.path.basename(path)}.{uuid.uuid4().hex[:12]}.npy"
+        np.save(os.path.join(directory, matrix_file), self.all_rows())
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f, kind=np.array(self.kind), dim=np.array(self.dim), matrix_file=np.array(matrix_file),
+                **self.state(), **{f"meta_{k}": np.array(v) for k, v in meta.items()},
+            )
+        os.replace(tmp_path, path)
+
+        for stale in glob.glob(f"{glob.escape(path)}.*.npy"):
+            if os.path.basename(stale) != matrix_file:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass  # still mapped by a process on a platform that won't unlink it
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Return (index, meta) from a snapshot written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            index_cls = INDEX_BACKENDS[str(data["kind"])]
+            if "dim" in data.files and int(data["dim"]) != EMBEDDING_DIM:
+                raise ValueError(f"Snapshot has {int(data['dim'])}-d embeddings, expected {EMBEDDING_DIM}")
+            if "matrix_file" in data.files:
+                matrix_path = os.path.join(os.path.dirname(path), str(data["matrix_file"]))
+                matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+            else:
+                matrix = data["matrix"]  # older single-file snapshots
+            index = index_cls(capacity=1024 if mmap else max(len(matrix), 1024))
+            index.restore(data, matrix, mmap)
+            meta = {k[len("meta_"):]: data[k].item() for k in data.files if k.startswith("meta_")}
+        return index, meta
+
+    def restore(self, data, matrix, mmap=True):
+        names = [str(name) for name in data["names"]]
+        if mmap and isinstance(matrix, np.memmap):
+            self.frozen = matrix
+        else:
+            if len(self.matrix) < len(names):
+                self.matrix = np.zeros((len(names), self.dim), dtype=np.float32)
+            self.matrix[:len(names)] = matrix
+        self.names = names
+        self.positions = {name: i for i, name in enumerate(names)}
+        self.count = len(names)
+
+
+class IVFIndex(EmbeddingMatrix):
+    """Approximate index: spherical k-means buckets, and queries only scan the closest few.
+
+    Until there are enough identities to train on, it answers exactly. Inserts
+    go to their nearest bucket; the buckets are retrained once the index has
+    doubled since the last training.
+
+    Each bucket keeps its own contiguous copy of its rows, so a frame's faces
+    are scored with one matrix product per probed bucket rather than a gather
+    per face.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=1024, n_lists=IVF_LISTS, n_probes=IVF_PROBES):
+        super().__init__(dim, capacity)
+        self.n_lists = n_lists
+        self.n_probes = n_probes
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.slots = np.zeros(0, dtype=np.int64)  # position -> row within its bucket
+        self.list_vectors = []  # per bucket: (capacity, dim) rows, the first list_sizes[k] in use
+        self.list_positions = []  # per bucket: index position of each of those rows
+        self.list_sizes = np.zeros(0, dtype=np.int64)
+        self.trained_on = 0
+
+    def add_many(self, names, features):
+        positions = super().add_many(names, features)
+        if not positions:
+            return positions
+        if self.centroids is None or self.count >= 2 * max(self.trained_on, 1):
+            if self.count >= 4 * self.n_lists:
+                self.train()
+            return positions
+        with self.lock:
+            self.assign(np.array(positions, dtype=np.int64))
+        return positions
+
+    def train(self, seed=0):
+        rng = np.random.default_rng(seed)
+        data = self.all_rows()
+        with self.lock:
+            sample = data if len(data) <= IVF_TRAIN_SAMPLE else data[rng.choice(len(data), IVF_TRAIN_SAMPLE, replace=False)]
+            centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+            for _ in range(IVF_KMEANS_ITERATIONS):
+                labels = (sample @ centroids.T).argmax(axis=1)
+                for k in range(self.n_lists):
+                    members = sample[labels == k]
+                    if len(members):
+                        centroids[k] = members.mean(axis=0)
+                centroids = normalize(centroids)
+            self.centroids = centroids
+            labels = np.concatenate([
+                (data[start:start + 8192] @ centroids.T).argmax(axis=1) for start in range(0, len(data), 8192)
+            ]) if len(data) else np.zeros(0, dtype=np.int64)
+            self.build_lists(data, labels)
+            self.trained_on = self.count
+
+    def build_lists(self, data, labels):
+        # Caller holds the lock. Buckets laid out from scratch for rows data labelled labels.
+        count = len(labels)
+        self.assignments = np.full(max(count, 1024), -1, dtype=np.int32)
+        self.assignments[:count] = labels
+        self.slots = np.full(max(count, 1024), -1, dtype=np.int64)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(self.n_lists + 1))
+        self.list_vectors, self.list_positions = [], []
+        self.list_sizes = np.zeros(self.n_lists, dtype=np.int64)
+        for k in range(self.n_lists):
+            members = order[bounds[k]:bounds[k + 1]]
+            size = len(members)
+            vectors = np.zeros((max(2 * size, 16), self.dim), dtype=np.float32)
+            vectors[:size] = data[members]
+            positions = np.zeros(len(vectors), dtype=np.int64)
+            positions[:size] = members
+            self.slots[members] = np.arange(size)
+            self.list_vectors.append(vectors)
+            self.list_positions.append(positions)
+            self.list_sizes[k] = size
+
+    def assign(self, positions):
+        # Caller holds the lock
+        if len(self.assignments) < self.count:
+            grown = max(2 * len(self.assignments), self.count, 1024)
+            self.assignments = np.concatenate([self.assignments, np.full(grown - len(self.assignments), -1, np.int32)])
+            self.slots = np.concatenate([self.slots, np.full(grown - len(self.slots), -1, np.int64)])
+        for start in range(0, len(positions), 8192):
+            block = positions[start:start + 8192]
+            rows = self.take(block)
+            labels = (rows @ self.centroids.T).argmax(axis=1)
+            for position, label, row in zip(block.tolist(), labels.tolist(), rows):
+                previous = self.assignments[position]
+                if previous == label:
+                    self.list_vectors[label][self.slots[position]] = row  # replaced feature, same bucket
+                    continue
+                if previous >= 0:
+                    self.remove_from_list(previous, position)
+                self.append_to_list(label, position, row)
+
+    def append_to_list(self, label, position, row):
+        size = self.list_sizes[label]
+        if size == len(self.list_vectors[label]):
+            self.list_vectors[label] = np.vstack([self.list_vectors[label], np.zeros_like(self.list_vectors[label])])
+            self.list_positions[label] = np.concatenate([self.list_positions[label], np.zeros(size, dtype=np.int64)])
+        self.list_vectors[label][size] = row
+        self.list_positions[label][size] = position
+        self.slots[position] = size
+        self.assignments[position] = label
+        self.list_sizes[label] = size + 1
+
+    def remove_from_list(self, label, position):
+        # The bucket's last row moves into the freed slot
+        slot, last = self.slots[position], self.list_sizes[label] - 1
+        moved = self.list_positions[label][last]
+        self.list_vectors[label][slot] = self.list_vectors[label][last]
+        self.list_positions[label][slot] = moved
+        self.slots[moved] = slot
+        self.list_sizes[label] = last
+
+    def match(self, features):
+        if self.centroids is None:
+            return super().match(features)
+        queries = normalize(features)
+        if self.count == 0 or len(queries) == 0:
+            return [("Unknown", 0.0)] * len(queries)
+
+        best_scores = np.zeros(len(queries), dtype=np.float32)  # only positive scores count as a match
+        best_positions = np.full(len(queries), -1, dtype=np.int64)
+        with self.lock:
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.n_probes]
+            for label in np.unique(probes).tolist():
+                size = self.list_sizes[label]
+                if not size:
+                    continue
+                # Every face that probes this bucket, in one product
+                asking = np.flatnonzero((probes == label).any(axis=1))
+                scores = queries[asking] @ self.list_vectors[label][:size].T
+                best = scores.argmax(axis=1)
+                top = scores[np.arange(len(asking)), best]
+                better = top > best_scores[asking]
+                best_scores[asking[better]] = top[better]
+                best_positions[asking[better]] = self.list_positions[label][best[better]]
+            names = [self.names[p] if p >= 0 else None for p in best_positions.tolist()]
+        return [
+            (name, float(score)) if name is not None else ("Unknown", 0.0)
+            for name, score in zip(names, best_scores.tolist())
+        ]
+
+    def status(self):
+        status = super().status()
+        status.update({"lists": self.n_lists, "probes": self.n_probes, "trained": self.centroids is not None})
+        return status
+
+    def state(self):
+        state = super().state()
+        if self.centroids is not None:
+            state["centroids"] = self.centroids
+            state["assignments"] = self.assignments[:self.count]
+        return state
+
+    def restore(self, data, matrix, mmap=True):
+        super().restore(data, matrix, mmap)
+        if "centroids" in data.files:
+            self.centroids = data["centroids"]
+            self.n_lists = len(self.centroids)
+            self.build_lists(np.asarray(matrix, dtype=np.float32), np.asarray(data["assignments"], dtype=np.int64))
+            self.trained_on = self.count
+
+
+INDEX_BACKENDS = {"exact": EmbeddingMatrix, "ivf": IVFIndex}
+
+
+def build_index(known, backend="exact"):
+    return INDEX_BACKENDS[backend].from_mapping(known)
+
+
+def measure_recall(index, queries, exact=None):
+    """Fraction of queries where the index returns the same best match as an exact scan."""
+    if exact is None:
+        exact = EmbeddingMatrix(capacity=max(len(index), 1))
+        exact.add_many(index.names[:len(index)], index.all_rows())
+    expected = exact.match(queries)
+    found = index.match(queries)
+    if not expected:
+        return 1.0
+    return sum(a[0] == b[0] for a, b in zip(expected, found)) / len(expected)
@@ -0,0 +1,164 @@
+# face_pipeline.py
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from django.db import connection
+
+from backend_app.face_recognition import process_face_recognition
+
+FACE_WORKERS = 2  # OpenCV DNN releases the GIL, so threads run face models in parallel
+MAX_PENDING = 16  # jobs waiting across all cameras; at most one per camera
+MAX_JOB_AGE = 1.0  # seconds; older jobs are dropped instead of processed
+MAX_RESULTS_PER_CAMERA = 4  # finished results kept until the camera polls them
+
+# persons is the [(track_id, box)] list of the frame the faces were found in,
+# so results can be matched to tracks even though they arrive frames later.
+FaceJob = namedtuple("FaceJob", ["camera_id", "cafe_id", "frame_seq", "frame", "persons", "submitted_at"])
+FaceResult = namedtuple("FaceResult", ["camera_id", "frame_seq", "persons", "faces", "submitted_at", "finished_at"])
+
+
+class FaceRecognitionPool:
+    """Runs face detection and recognition for every camera on a small thread pool.
+
+    Camera workers submit() a frame and poll() for finished results; neither
+    call blocks. Each camera has at most one waiting job, so a newer frame
+    replaces an older one that hasn't started yet.
+    """
+
+    def __init__(self, workers=FACE_WORKERS, max_pending=MAX_PENDING, max_job_age=MAX_JOB_AGE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_job_age = max_job_age
+
+        self.pending = OrderedDict()  # camera_id -> FaceJob, oldest first
+        self.results = {}  # camera_id -> deque of FaceResult
+        self.cond = threading.Condition()
+        self.running = False
+        self.threads = []
+
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.dropped_superseded = 0
+        self.dropped_full = 0
+        self.dropped_stale = 0
+        self.dropped_results = 0
+        self.last_wait = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    # === Lifecycle ===
+    def start(self):
+        with self.cond:
+            if self.running:
+                return False
+            self.running = True
+            self.threads = [
+                threading.Thread(target=self.run, name=f"face-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self.threads:
+            thread.start()
+        return True
+
+    def stop(self, timeout=5):
+        with self.cond:
+            self.running = False
+            self.pending.clear()
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+        self.threads = []
+
+    # === Camera Side ===
+    def submit(self, camera_id, cafe_id, frame_seq, frame, persons):
+        """Queue a frame for face recognition. Returns False if it was dropped."""
+        job = FaceJob(camera_id, cafe_id, frame_seq, frame, list(persons), time.time())
+        with self.cond:
+            if camera_id in self.pending:
+                del self.pending[camera_id]
+                self.dropped_superseded += 1
+            elif len(self.pending) >= self.max_pending:
+                self.dropped_full += 1
+                return False
+            self.pending[camera_id] = job
+            self.submitted += 1
+            self.cond.notify()
+        return True
+
+    def poll(self, camera_id):
+        # Finished results for this camera, oldest first
+        with self.cond:
+            results = self.results.get(camera_id)
+            if not results:
+                return []
+            finished = list(results)
+            results.clear()
+            return finished
+
+    def busy(self, camera_id):
+        with self.cond:
+            return camera_id in self.pending
+
+    def discard(self, camera_id):
+        with self.cond:
+            self.pending.pop(camera_id, None)
+            self.results.pop(camera_id, None)
+
+    def status(self):
+        return {
+            "workers": len(self.threads),
+            "pending": len(self.pending),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "dropped_superseded": self.dropped_superseded,
+            "dropped_full": self.dropped_full,
+            "dropped_stale": self.dropped_stale,
+            "dropped_results": self.dropped_results,
+            "last_wait_ms": round(self.last_wait * 1000, 2),
+            "last_latency_ms": round(self.last_latency * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2),
+        }
+
+    # === Worker Side ===
+    def next_job(self):
+        with self.cond:
+            while self.running:
+                while self.pending:
+                    _, job = self.pending.popitem(last=False)
+                    if time.time() - job.submitted_at <= self.max_job_age:
+                        return job
+                    self.dropped_stale += 1
+                self.cond.wait(0.1)
+            return None
+
+    def run(self):
+        try:
+            while True:
+                job = self.next_job()
+                if job is None:
+                    break
+                started = time.time()
+                try:
+                    faces = process_face_recognition(job.frame, camera_id=job.camera_id, cafe_id=job.cafe_id)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[ERROR] Face recognition failed for camera {job.camera_id}: {e}")
+                    continue
+                finished = time.time()
+                self.finish(FaceResult(job.camera_id, job.frame_seq, job.persons, faces, job.submitted_at, finished), started)
+        finally:
+            connection.close()
+
+    def finish(self, result, started):
+        with self.cond:
+            results = self.results.setdefault(result.camera_id, deque(maxlen=MAX_RESULTS_PER_CAMERA))
+            if len(results) == results.maxlen:
+                self.dropped_results += 1
+            results.append(result)
+            self.completed += 1
+            self.last_wait = started - result.submitted_at
+            self.last_latency = result.finished_at - result.submitted_at
+            self.max_latency = max(self.max_latency, self.last_latency)
@@ -1,10 +1,18 @@
 import cv2 as cv
 import numpy as np
 import redis
-import pickle
+import os
+import json
+import uuid
 from backend_app.models import Customer, UserCafe
+from django.conf import settings
 from django.utils import timezone
 import time
+import threading
+from backend_app.face_index import EmbeddingMatrix, build_index, encode_embedding, decode_embedding
+from backend_app.visits import visits
+from backend_app.face_images import FaceImageStore, LEGACY_FACE_IMAGES_KEY
+from backend_app.model_registry import models
 
 # === Redis Setup ===
 redis_client = redis.StrictRedis(host='localhost', port=6379, decode_responses=False)
@@ -13,69 +21,405 @@ redis_client = redis.StrictRedis(host='localhost', port=6379, decode_responses=F
 face_detection_model = "D:/Kuliah/Tugas Akhir/TheTugasFinal/models/face_detection_models/face_detection_yunet_2023mar.onnx"
 face_recognition_model = "D:/Kuliah/Tugas Akhir/TheTugasFinal/models/face_detection_models/face_recognition_sface_2021dec.onnx"
 
-detector = cv.FaceDetectorYN.create(face_detection_model, "", (320, 320), score_threshold=0.9, nms_threshold=0.3, top_k=5000)
-recognizer = cv.FaceRecognizerSF.create(face_recognition_model, "")
+# Loaded on first use through the model registry, not at import. The DNN objects
+# keep per-call state (input size, buffers), so every worker thread gets its own.
+def get_face_models():
+    detector = models.get_local("yunet", lambda: cv.FaceDetectorYN.create(
+        face_detection_model, "", (320, 320), score_threshold=0.9, nms_threshold=0.3, top_k=5000))
+    recognizer = models.get_local("sface", lambda: cv.FaceRecognizerSF.create(face_recognition_model, ""))
+    return detector, recognizer
+
+# === Batched Embeddings ===
+# FaceRecognizerSF.feature() runs one forward pass per face. The same network
+# loaded through cv.dnn takes every aligned face of a frame as one blob, using
+# the preprocessing feature() applies internally (112x112, RGB, no scaling).
+SFACE_INPUT_SIZE = (112, 112)
+_batching_supported = None  # unknown until the first multi-face batch runs
+
+def get_feature_net():
+    return models.get_local("sface_batch", lambda: cv.dnn.readNet(face_recognition_model))
+
+def embed_aligned_faces(aligned):
+    """One (1, 128) feature per aligned face crop, as recognizer.feature() would return."""
+    global _batching_supported
+    if not aligned:
+        return []
+    if len(aligned) > 1 and _batching_supported is not False:
+        try:
+            net = get_feature_net()
+            net.setInput(cv.dnn.blobFromImages(aligned, 1.0, SFACE_INPUT_SIZE, (0, 0, 0), swapRB=True, crop=False))
+            output = net.forward().reshape(len(aligned), -1)
+            _batching_supported = True
+            return [output[i:i + 1].copy() for i in range(len(aligned))]
+        except cv.error as e:
+            # Models exported with a fixed batch size of 1 can't take the whole frame at once
+            print(f"[WARN] Batched face embedding unavailable, using one pass per face: {e}")
+            _batching_supported = False
+    _, recognizer = get_face_models()
+    return [recognizer.feature(face) for face in aligned]
+
+# === Detection and Quality Gate ===
+FACE_DETECTION_WIDTH = 640  # YuNet runs on frames downscaled to this width (0 = full resolution)
+MIN_FACE_SIZE = 40  # px at full resolution; smaller faces don't embed reliably
+MIN_FACE_SHARPNESS = 50.0  # variance of the Laplacian over the aligned crop
+MAX_FACE_YAW = 0.35  # nose offset from the eye midpoint, relative to eye distance
+LOW_QUALITY_LABEL = "Low Quality"
+
+quality_stats = {"detected": 0, "embedded": 0, "small": 0, "angle": 0, "blur": 0}
+
+def detect_faces(frame, detection_width=FACE_DETECTION_WIDTH):
+    """YuNet rows (box, 5 landmarks, score) in full-resolution coordinates."""
+    detector, _ = get_face_models()
+    height, width = frame.shape[:2]
+    scale = 1.0
+    image = frame
+    if detection_width and width > detection_width:
+        scale = width / detection_width
+        image = cv.resize(frame, (detection_width, round(height / scale)), interpolation=cv.INTER_AREA)
+    detector.setInputSize((image.shape[1], image.shape[0]))
+    _, faces = detector.detect(image)
+    if faces is None:
+        return np.zeros((0, 15), dtype=np.float32)
+    if scale != 1.0:
+        faces = faces.copy()
+        faces[:, :14] *= scale  # box and landmarks; the score stays as is
+    return faces
+
+def face_quality_issue(face):
+    # Checks that need only the detection row; blur is checked on the aligned crop
+    if min(face[2], face[3]) < MIN_FACE_SIZE:
+        return "small"
+    right_eye_x, left_eye_x, nose_x = face[4], face[6], face[8]
+    eye_distance = abs(left_eye_x - right_eye_x)
+    if eye_distance < 1 or abs(nose_x - (right_eye_x + left_eye_x) / 2) / eye_distance > MAX_FACE_YAW:
+        return "angle"
+    return None
+
+def face_sharpness(aligned):
+    return cv.Laplacian(cv.cvtColor(aligned, cv.COLOR_BGR2GRAY), cv.CV_64F).var()
+
+def align_good_faces(frame, faces):
+    """Aligned crops for the faces that pass the quality gate, and their row indexes."""
+    _, recognizer = get_face_models()
+    accepted, aligned = [], []
+    for idx, face in enumerate(faces):
+        issue = face_quality_issue(face)
+        if issue is None:
+            crop = recognizer.alignCrop(frame, face)
+            if face_sharpness(crop) < MIN_FACE_SHARPNESS:
+                issue = "blur"
+        if issue is not None:
+            quality_stats[issue] += 1
+            continue
+        accepted.append(idx)
+        aligned.append(crop)
+    quality_stats["detected"] += len(faces)
+    quality_stats["embedded"] += len(aligned)
+    return accepted, aligned
 
 recognition_threshold = 0.5
 detection_delay = 3 #seconds
 new_customers = {}
+new_customers_lock = threading.Lock()  # face pool threads share new_customers
 
 # === Redis Embeddings ===
-def store_embedding_in_redis(name, feature):
-    redis_client.hset("face_embeddings", name, pickle.dumps(feature))
+# Every write bumps EMBEDDINGS_VERSION_KEY and is announced on EMBEDDINGS_CHANNEL,
+# so other processes can apply it to their resident indexes without rescanning the hash.
+EMBEDDINGS_VERSION_KEY = "face_embeddings_version"
+EMBEDDINGS_CHANNEL = "face_embeddings_updates"
+PROCESS_ID = uuid.uuid4().hex
+
+def store_embedding_in_redis(name, feature, cafe_id=None):
+    pipe = redis_client.pipeline()
+    pipe.hset("face_embeddings", name, encode_embedding(feature))
+    pipe.incr(EMBEDDINGS_VERSION_KEY)
+    version = pipe.execute()[-1]
+    redis_client.publish(EMBEDDINGS_CHANNEL, json.dumps({
+        "face_id": name, "cafe_id": cafe_id, "version": version, "origin": PROCESS_ID,
+    }))
+    return version
+
+def read_embeddings_version():
+    return int(redis_client.get(EMBEDDINGS_VERSION_KEY) or 0)
 
 def load_known_faces():
     known = {}
     for name, feature in redis_client.hgetall("face_embeddings").items():
         try:
-            known[name.decode()] = pickle.loads(feature)
+            known[name.decode()] = decode_embedding(feature)
         except:
             pass
     return known
 
-def store_face_image_in_redis(name, image):
-    _, buffer = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, 70])
-    redis_client.hset("face_images", name, buffer.tobytes())
+def load_cafe_faces(cafe_id):
+    # Only the embeddings of this cafe's customers, fetched in chunks
+    face_ids = list(Customer.objects.filter(cafe_id=cafe_id).values_list("face_id", flat=True))
+    known = {}
+    for start in range(0, len(face_ids), 1000):
+        chunk = face_ids[start:start + 1000]
+        for name, feature in zip(chunk, redis_client.hmget("face_embeddings", chunk)):
+            if feature is None:
+                continue
+            try:
+                known[name] = decode_embedding(feature)
+            except:
+                pass
+    return known
+
+# === Per-Cafe Face Indexes ===
+FACE_INDEX_BACKEND = "auto"  # "exact", "ivf", or "auto" (ivf once a cafe reaches IVF_MIN_IDENTITIES)
+IVF_MIN_IDENTITIES = 20000  # below this benchmark_face_index shows ivf no faster than an exact scan
+FACE_INDEX_DIR = os.path.join(settings.BASE_DIR, "face_index")
+SAVE_EVERY_INSERTS = 50
+VERSION_CHECK_INTERVAL = 1.0  # seconds between version key reads
+STALE_RESYNC_AFTER = 5.0  # seconds an index may trail the version key before it is reloaded
+
+class CafeFaceIndexes:
+    """One resident face index per cafe, so matching cost follows that cafe's customers only.
+
+    Indexes are built on first use, saved under FACE_INDEX_DIR and reloaded from
+    there on restart as long as the cafe's customer count hasn't changed.
+
+    Faces saved by other processes arrive through EMBEDDINGS_CHANNEL. As a
+    backstop, the version key is compared at most every VERSION_CHECK_INTERVAL;
+    if this process stays behind for STALE_RESYNC_AFTER (missed messages), the
+    resident indexes are dropped and reloaded.
+    """
+
+    def __init__(self, backend=FACE_INDEX_BACKEND, index_dir=FACE_INDEX_DIR):
+        self.backend = backend
+        self.index_dir = index_dir
+        self.indexes = {}
+        self.unsaved = {}
+        self.lock = threading.Lock()
+
+        self.synced_version = 0  # every embedding up to this version is in the resident indexes
+        self.checked_at = 0.0
+        self.behind_since = None
+        self.listener = None
+
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.updates_applied = 0
+        self.stale_checks = 0
+
+    def path(self, cafe_id):
+        return os.path.join(self.index_dir, f"cafe_{cafe_id}.npz")
+
+    def choose_backend(self, size):
+        if self.backend != "auto":
+            return self.backend
+        return "ivf" if size >= IVF_MIN_IDENTITIES else "exact"
+
+    def get(self, cafe_id):
+        cafe_id = int(cafe_id)
+        self.start_listener()
+        self.check_version()
+        index = self.indexes.get(cafe_id)
+        if index is not None:
+            self.hits += 1
+            return index
+        with self.lock:
+            index = self.indexes.get(cafe_id)
+            if index is None:
+                index = self.load(cafe_id)
+                self.indexes[cafe_id] = index
+                self.loads += 1
+        return index
+
+    def load(self, cafe_id, use_snapshot=True):
+        customers = Customer.objects.filter(cafe_id=cafe_id).count()
+        path = self.path(cafe_id)
+        if use_snapshot and os.path.exists(path):
+            try:
+                index, meta = EmbeddingMatrix.load(path)
+                if meta.get("customers") == customers:
+                    return index
+            except Exception as e:
+                print(f"[WARN] Ignoring unreadable face index {path}: {e}")
+
+        known = load_cafe_faces(cafe_id)
+        index = build_index(known, self.choose_backend(len(known)))
+        self.save(cafe_id, index, customers)
+        return index
+
+    def rebuild(self, cafe_id):
+        # Fresh index and snapshot from the embeddings in Redis, replacing any resident copy
+        cafe_id = int(cafe_id)
+        index = self.load(cafe_id, use_snapshot=False)
+        with self.lock:
+            self.indexes[cafe_id] = index
+            self.unsaved[cafe_id] = 0
+        return index
+
+    def save(self, cafe_id, index=None, customers=None):
+        if index is None:
+            index = self.indexes.get(cafe_id)
+        if index is None:
+            return
+        if customers is None:
+            customers = Customer.objects.filter(cafe_id=cafe_id).count()
+        try:
+            index.save(self.path(cafe_id), customers=customers)
+            self.unsaved[cafe_id] = 0
+        except OSError as e:
+            print(f"[WARN] Could not save face index for cafe {cafe_id}: {e}")
+
+    def save_all(self):
+        for cafe_id in list(self.indexes):
+            if self.unsaved.get(cafe_id):
+                self.save(cafe_id)
+
+    def add(self, cafe_id, name, feature):
+        cafe_id = int(cafe_id)
+        self.insert(cafe_id, self.get(cafe_id), name, feature)
+
+    def insert(self, cafe_id, index, name, feature):
+        index.add(name, feature)
+        self.unsaved[cafe_id] = self.unsaved.get(cafe_id, 0) + 1
+        if self.unsaved[cafe_id] >= SAVE_EVERY_INSERTS:
+            self.save(cafe_id)
+
+    # === Cross-Process Sync ===
+    def check_version(self):
+        now = time.time()
+        if now - self.checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        try:
+            remote = read_embeddings_version()
+        except redis.RedisError:
+            return
+        if not self.indexes or remote <= self.synced_version:
+            # Nothing resident means nothing can be stale
+            self.synced_version = max(self.synced_version, remote)
+            self.behind_since = None
+            return
+
+        self.stale_checks += 1
+        if self.behind_since is None:
+            self.behind_since = now
+        elif now - self.behind_since >= STALE_RESYNC_AFTER:
+            print(f"[WARN] Face indexes stuck at version {self.synced_version} of {remote}, reloading.")
+            self.resync(remote)
+
+    def resync(self, version=None):
+        with self.lock:
+            self.save_all()
+            self.indexes = {}
+            self.unsaved = {}
+            self.synced_version = read_embeddings_version() if version is None else version
+            self.behind_since = None
+            self.reloads += 1
+
+    def apply_update(self, message):
+        update = json.loads(message)
+        cafe_id = update.get("cafe_id")
+        index = self.indexes.get(int(cafe_id)) if cafe_id is not None else None
+        # Our own writes are already in the index; cafes not loaded here will read it on load
+        if index is not None and update.get("origin") != PROCESS_ID:
+            payload = redis_client.hget("face_embeddings", update["face_id"])
+            if payload is not None:
+                self.insert(int(cafe_id), index, update["face_id"], decode_embedding(payload))
+                self.updates_applied += 1
+        self.synced_version = max(self.synced_version, int(update.get("version") or 0))
+
+    def start_listener(self):
+        if self.listener is not None and self.listener.is_alive():
+            return
+        self.listener = threading.Thread(target=self.listen, name="face-embedding-sync", daemon=True)
+        self.listener.start()
+
+    def listen(self):
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(EMBEDDINGS_CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self.apply_update(message["data"])
+                    except Exception as e:
+                        print(f"[WARN] Skipping face embedding update: {e}")
+            except redis.RedisError as e:
+                print(f"[WARN] Face embedding updates disconnected: {e}")
+            finally:
+                pubsub.close()
+            # Anything published while we were disconnected is gone; reload on next use
+            time.sleep(2)
+            try:
+                self.resync()
+            except redis.RedisError:
+                pass
+
+    def status(self):
+        return {
+            "indexes": {cafe_id: index.status() for cafe_id, index in self.indexes.items()},
+            "synced_version": self.synced_version,
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "updates_applied": self.updates_applied,
+            "stale_checks": self.stale_checks,
+            "listening": self.listener is not None and self.listener.is_alive(),
+        }
+
+face_indexes = CafeFaceIndexes()
+
+def active_cafe_id():
+    cafe_id = redis_client.get("active_cafe_id")
+    return int(cafe_id) if cafe_id else None
+
+face_image_store = FaceImageStore(redis_client)
+
+# === Customer IDs ===
+CUSTOMER_SEQUENCE_KEY = "customer_id_sequence"
+
+def highest_customer_number():
+    # Where the sequence starts: past every customer_N already minted
+    numbers = [0, redis_client.hlen(LEGACY_FACE_IMAGES_KEY)]
+    for face_id in Customer.objects.filter(face_id__startswith="customer_").values_list("face_id", flat=True):
+        suffix = face_id[len("customer_"):]
+        if suffix.isdigit():
+            numbers.append(int(suffix))
+    return max(numbers)
+
+def ensure_customer_sequence():
+    if not redis_client.exists(CUSTOMER_SEQUENCE_KEY):
+        redis_client.setnx(CUSTOMER_SEQUENCE_KEY, highest_customer_number())
+
+def next_face_id():
+    # INCR is atomic, so concurrent workers and processes never mint the same id
+    ensure_customer_sequence()
+    return f"customer_{redis_client.incr(CUSTOMER_SEQUENCE_KEY)}"
 
 # === Core Logic ===
-def recognize_face(face_feature):
-    best_match, best_score = "Unknown", 0.0
-    for name, stored_feature in load_known_faces().items():
-        score = recognizer.match(face_feature, stored_feature, cv.FaceRecognizerSF_FR_COSINE)
-        if score > best_score:
-            best_score, best_match = score, name
+def match_faces(face_features, cafe_id=None):
+    # Every face in the frame is scored against the cafe's index in one call
+    cafe_id = cafe_id or active_cafe_id()
+    if cafe_id is None:
+        return [("Unknown", 0.0)] * len(face_features)
+    return face_indexes.get(cafe_id).match(face_features)
+
+def recognize_face(face_feature, match=None, cafe_id=None):
+    best_match, best_score = match or match_faces([face_feature], cafe_id)[0]
 
     if best_match != "Unknown" and best_score >= recognition_threshold:
-        try:
-            customer = Customer.objects.get(face_id=best_match)
-            customer.visit_count += 1
-            customer.last_visit = timezone.now()
-            customer.status = 'returning'
-            customer.save()
-        except Customer.DoesNotExist:
-            pass
+        # Buffered; counted as a visit once per presence session and written in bulk
+        visits.record(best_match)
 
     return best_match, best_score
 
-def save_new_customer(frame, coords):
+def save_new_customer(frame, coords, cafe_id=None):
     x, y, w, h = coords
     crop = frame[y:y+h, x:x+w]
     if crop.size == 0:
         return
 
-    count = redis_client.hlen("face_images")
-    face_id = f"customer_{count + 1}"
+    face_id = next_face_id()
 
-    resized = cv.resize(crop, (320, 320))
-    detector.setInputSize((320, 320))
-    faces = detector.detect(resized)
-    if faces[1] is not None:
-        aligned = recognizer.alignCrop(resized, faces[1][0])
-        feature = recognizer.feature(aligned)
-        store_embedding_in_redis(face_id, feature)
-
-    cafe_id = redis_client.get("active_cafe_id")
-    assigned_cafe = UserCafe.objects.get(id=int(cafe_id)) if cafe_id else UserCafe.objects.first()
+    cafe_id = cafe_id or active_cafe_id()
+    assigned_cafe = UserCafe.objects.get(id=cafe_id) if cafe_id else UserCafe.objects.first()
 
     # === Fix: Prevent duplicate face_id using get_or_create ===
     customer, created = Customer.objects.get_or_create(
@@ -95,30 +439,53 @@ def save_new_customer(frame, coords):
         customer.visit_count += 1
         customer.last_visit = timezone.now()
         customer.save()
+    face_image_store.save(face_id, crop)
 
+    # Stored after the Customer row exists, so a process loading this cafe's index
+    # in between either sees both or gets the face through the update channel
+    detector, recognizer = get_face_models()
+    resized = cv.resize(crop, (320, 320))
+    detector.setInputSize((320, 320))
+    faces = detector.detect(resized)
+    if faces[1] is not None:
+        aligned = recognizer.alignCrop(resized, faces[1][0])
+        feature = recognizer.feature(aligned)
+        face_indexes.add(assigned_cafe.id, face_id, feature)
+        store_embedding_in_redis(face_id, feature, assigned_cafe.id)
 
 
-def process_face_recognition(frame):
+
+def process_face_recognition(frame, camera_id=None, cafe_id=None):
     results = []
-    detector.setInputSize((frame.shape[1], frame.shape[0]))
-    faces = detector.detect(frame)
-    if faces[1] is not None:
-        for idx, face in enumerate(faces[1]):
+    faces = detect_faces(frame)
+    if len(faces):
+        accepted, aligned = align_good_faces(frame, faces)
+        features = embed_aligned_faces(aligned)
+        matches = match_faces(features, cafe_id) if features else []
+        embedded = dict(zip(accepted, zip(features, matches)))
+        for idx, face in enumerate(faces):
             x, y, w, h = face[:4].astype(int)
             coords = (x, y, w, h)
-            aligned = recognizer.alignCrop(frame, face)
-            feature = recognizer.feature(aligned)
-            name, score = recognize_face(feature)
+            if idx not in embedded:
+                # Too small, blurred or turned away: shown, but never matched or saved as a new customer
+                results.append((coords, LOW_QUALITY_LABEL, 0.0))
+                continue
+            feature, match = embedded[idx]
+            name, score = recognize_face(feature, match, cafe_id)
 
             if score < recognition_threshold:
                 name = "New Customer"
 
             if name == "New Customer":
-                if idx not in new_customers:
-                    new_customers[idx] = time.time()
-                elif time.time() - new_customers[idx] >= detection_delay:
-                    save_new_customer(frame, coords)
-                    del new_customers[idx]
+                key = (camera_id, idx)
+                with new_customers_lock:
+                    first_seen = new_customers.setdefault(key, time.time())
+                    # Claimed under the lock, so only one thread saves this customer
+                    due = time.time() - first_seen >= detection_delay
+                    if due:
+                        del new_customers[key]
+                if due:
+                    save_new_customer(frame, coords, cafe_id)
 
-            results.append((coords, name))
+            results.append((coords, name, score))
     return results
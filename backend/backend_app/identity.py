@@ -0,0 +1,110 @@
+# identity.py
+import numpy as np
+
+from backend_app.association import center_inside_matrix
+
+IDENTITY_BIND_SCORE = 0.6  # a track takes a face's identity once a match scores at least this
+REVERIFY_INTERVAL = 30.0  # seconds before a bound track's face is checked again
+RETRY_INTERVAL = 0.5  # seconds between attempts for a track whose face hasn't matched yet
+TRACK_LOST_AFTER = 2.0  # seconds unseen before a track and its identity are forgotten
+IDLE_RECOGNITION_INTERVAL = 1.0  # seconds between face passes when no person is tracked
+
+
+class TrackIdentityCache:
+    """Binds YOLO track ids to recognized face ids for one camera.
+
+    Face recognition only has to run while some visible track is unbound or
+    due for re-verification; once every person in view has an identity the
+    face pipeline is skipped for that frame.
+    """
+
+    def __init__(self):
+        self.tracks = {}  # track_id -> {"face_id", "score", "verified_at", "next_attempt", "first_seen", "last_seen"}
+        self.last_recognition = 0.0
+
+        self.frames_recognized = 0
+        self.frames_skipped = 0
+        self.binds = 0
+        self.rebinds = 0
+        self.lost = 0
+
+    def observe(self, track_ids, now):
+        """Mark tracks as seen this frame and forget the ones that have been gone too long."""
+        for track_id in track_ids:
+            track = self.tracks.get(track_id)
+            if track is None:
+                self.tracks[track_id] = {
+                    "face_id": None, "score": 0.0, "verified_at": None,
+                    "next_attempt": now, "first_seen": now, "last_seen": now,
+                }
+            else:
+                track["last_seen"] = now
+        for track_id in [t for t, track in self.tracks.items() if now - track["last_seen"] > TRACK_LOST_AFTER]:
+            del self.tracks[track_id]
+            self.lost += 1
+
+    def needs_recognition(self, track_ids, now):
+        due = any(self.is_due(self.tracks[t], now) for t in track_ids if t in self.tracks)
+        if not track_ids:
+            due = now - self.last_recognition >= IDLE_RECOGNITION_INTERVAL
+        if due:
+            self.frames_recognized += 1
+            self.last_recognition = now
+        else:
+            self.frames_skipped += 1
+        return due
+
+    def is_due(self, track, now):
+        if track["face_id"] is None:
+            return now >= track["next_attempt"]
+        return now - track["verified_at"] >= REVERIFY_INTERVAL
+
+    def assign(self, persons, faces, now):
+        """persons is [(track_id, box)], faces is [((x, y, w, h), face_id, score)] from process_face_recognition.
+
+        Each face goes to the tracked person whose box contains its center. Returns
+        [(track_id, face_id, first_seen)] for tracks that were bound or rebound.
+        """
+        tracked = [(track_id, box) for track_id, box in persons if track_id in self.tracks]
+        attempted = {track_id for track_id, _ in tracked if self.is_due(self.tracks[track_id], now)}
+        bound = []
+        if tracked and faces:
+            face_boxes = [(x, y, x + w, y + h) for (x, y, w, h), _, _ in faces]
+            inside = center_inside_matrix([box for _, box in tracked], face_boxes)
+            for f, (_, face_id, score) in enumerate(faces):
+                owners = np.flatnonzero(inside[:, f])
+                if len(owners) != 1 or score < IDENTITY_BIND_SCORE or face_id in ("Unknown", "New Customer"):
+                    continue  # ambiguous, weak or unknown faces never bind
+                track_id = tracked[owners[0]][0]
+                track = self.tracks[track_id]
+                if track["face_id"] != face_id:
+                    if track["face_id"] is None:
+                        self.binds += 1
+                    else:
+                        self.rebinds += 1
+                    bound.append((track_id, face_id, track["first_seen"]))
+                track.update(face_id=face_id, score=score, verified_at=now)
+
+        for track_id in attempted:
+            track = self.tracks[track_id]
+            if track["face_id"] is None:
+                track["next_attempt"] = now + RETRY_INTERVAL
+            elif track["verified_at"] != now:
+                # No confirming face this time; keep the identity and check again shortly
+                track["verified_at"] = now - REVERIFY_INTERVAL + RETRY_INTERVAL
+        return bound
+
+    def face_id(self, track_id):
+        track = self.tracks.get(track_id)
+        return track["face_id"] if track else None
+
+    def status(self):
+        return {
+            "tracks": len(self.tracks),
+            "bound": sum(1 for track in self.tracks.values() if track["face_id"] is not None),
+            "frames_recognized": self.frames_recognized,
+            "frames_skipped": self.frames_skipped,
+            "binds": self.binds,
+            "rebinds": self.rebinds,
+            "lost": self.lost,
+        }
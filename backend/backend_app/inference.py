@@ -0,0 +1,363 @@
+# inference.py
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from backend_app.model_registry import models
+
+MODEL_PATH = "D:/Kuliah/Tugas Akhir/TheTugasFinal/models/detection_models/best.pt"
+TRACKER_CONFIG = "bytetrack.yaml"
+
+# model.track() lowers the confidence floor to 0.1 and lets the tracker filter,
+# so batched predict() uses the same floor to keep detections identical.
+TRACK_CONFIDENCE = 0.1
+MAX_BATCH_SIZE = 8
+MAX_BATCH_WAIT = 0.005  # seconds to wait for the other streams to catch up
+INFER_TIMEOUT = 1.0  # seconds a stream waits for its result before checking whether it should stop
+
+# === Inference Backend ===
+# "torch" runs MODEL_PATH as is; "onnx" and "openvino" run a CPU export of it,
+# made by `manage.py benchmark_backends --export` and stored next to the weights.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_IMGSZ = int(os.getenv("INFERENCE_IMGSZ", "640"))
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "0") == "1"
+BACKENDS = ("torch", "onnx", "openvino")
+
+# Plain arrays so the occupancy logic doesn't depend on ultralytics result objects.
+# track_ids is -1 for boxes the tracker has not assigned an ID to.
+Detections = namedtuple("Detections", ["boxes", "classes", "confidences", "track_ids"])
+
+
+# ultralytics pulls in torch, so it is imported on first use rather than with this module
+def load_yolo(model_path=MODEL_PATH):
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+
+def yolo_model(model_path=MODEL_PATH):
+    """The process-wide YOLO instance for model_path, loaded on first call."""
+    return models.get(f"yolo:{model_path}", lambda: load_yolo(model_path))
+
+
+class InferenceBackend:
+    """Which runtime runs the detector, at what input size and precision.
+
+    Exported models load through ultralytics too, so predict() returns the
+    same Results objects for every backend and the tracker is unaffected.
+    An export has a fixed input size; imgsz is passed to every predict().
+    """
+
+    def __init__(self, name=INFERENCE_BACKEND, model_path=MODEL_PATH, imgsz=INFERENCE_IMGSZ, int8=INFERENCE_INT8):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown inference backend {name!r}, expected one of {', '.join(BACKENDS)}")
+        self.name = name
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.int8 = int8 and name != "torch"
+
+    @property
+    def label(self):
+        return f"{self.name}-{self.imgsz}{'-int8' if self.int8 else ''}"
+
+    @property
+    def path(self):
+        """Weights this backend loads: MODEL_PATH for torch, the matching export otherwise."""
+        if self.name == "torch":
+            return self.model_path
+        stem = os.path.splitext(self.model_path)[0]
+        variant = f"{stem}_{self.imgsz}{'_int8' if self.int8 else ''}"
+        return f"{variant}.onnx" if self.name == "onnx" else f"{variant}_openvino_model"
+
+    def exported(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        if not self.exported():
+            raise FileNotFoundError(f"No {self.label} model at {self.path}; run `manage.py benchmark_backends --export`")
+        from ultralytics import YOLO
+        return YOLO(self.path, task="detect")
+
+    def model(self):
+        if self.name == "torch":
+            return yolo_model(self.model_path)
+        return models.get(f"yolo:{self.label}:{self.path}", self.load)
+
+    def predict(self, model, frames, conf=TRACK_CONFIDENCE):
+        if self.name == "torch":
+            return model.predict(frames, conf=conf, imgsz=self.imgsz, verbose=False)
+        return model.predict(frames, conf=conf, imgsz=self.imgsz, device="cpu", verbose=False)
+
+    def export(self, calibration=None):
+        """Writes the export for this backend (no-op for torch) and returns its path.
+
+        calibration is a dataset yaml for OpenVINO INT8; ONNX INT8 quantizes
+        the FP32 export's weights with onnxruntime, which needs no data.
+        """
+        if self.name == "torch":
+            return self.path
+        model = load_yolo(self.model_path)
+        if self.name == "onnx":
+            exported = model.export(format="onnx", imgsz=self.imgsz, dynamic=True, simplify=True)
+            if self.int8:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(exported, self.path, weight_type=QuantType.QUInt8)
+                os.remove(exported)
+                return self.path
+        else:
+            exported = model.export(format="openvino", imgsz=self.imgsz, dynamic=True, int8=self.int8,
+                                    data=calibration)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path) if os.path.isdir(self.path) else os.remove(self.path)
+        shutil.move(exported, self.path)
+        return self.path
+
+    def status(self):
+        return {"backend": self.name, "imgsz": self.imgsz, "int8": self.int8, "path": self.path}
+
+
+def empty_detections():
+    return Detections(
+        np.empty((0, 4), dtype=np.int64),
+        np.empty(0, dtype=np.int64),
+        np.empty(0, dtype=np.float32),
+        np.empty(0, dtype=np.int64),
+    )
+
+
+def detections_from_result(result):
+    if result is None or result.boxes is None or len(result.boxes) == 0:
+        return empty_detections()
+    boxes = result.boxes.cpu().numpy()
+    track_ids = boxes.id.astype(np.int64) if boxes.id is not None else np.full(len(boxes), -1, dtype=np.int64)
+    return Detections(
+        boxes.xyxy.astype(np.int64),
+        boxes.cls.astype(np.int64),
+        boxes.conf.astype(np.float32),
+        track_ids,
+    )
+
+
+# === Per-Stream Tracking ===
+tracker_lock = threading.Lock()
+
+
+class StreamTracker:
+    """ByteTrack state for one camera; mirrors what model.track(persist=True) does per stream."""
+
+    def __init__(self, frame_rate=30):
+        from ultralytics.trackers.basetrack import BaseTrack
+        from ultralytics.trackers.byte_tracker import BYTETracker
+        from ultralytics.utils import IterableSimpleNamespace, yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        config = IterableSimpleNamespace(**yaml_load(check_yaml(TRACKER_CONFIG)))
+        with tracker_lock:
+            # Track ids come from one class-level counter shared by every camera, and
+            # BYTETracker() resets it to 0; put it back so running cameras don't reuse ids
+            next_id = BaseTrack._count
+            self.tracker = BYTETracker(args=config, frame_rate=frame_rate)
+            BaseTrack._count = max(BaseTrack._count, next_id)
+
+    def update(self, result, frame):
+        if result is None or result.boxes is None or len(result.boxes) == 0:
+            return empty_detections()
+
+        det = result.boxes.cpu().numpy()
+        tracks = self.tracker.update(det, frame)
+        if len(tracks) == 0:
+            # Same as ultralytics: untracked detections are passed through without IDs
+            return detections_from_result(result)
+
+        # Track rows are x1, y1, x2, y2, track_id, score, cls, det_index
+        return Detections(
+            tracks[:, :4].astype(np.int64),
+            tracks[:, 6].astype(np.int64),
+            tracks[:, 5].astype(np.float32),
+            tracks[:, 4].astype(np.int64),
+        )
+
+
+# === Batched Scheduler ===
+class InferenceRequest:
+    def __init__(self, camera_id, frame):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.result = None
+        self.error = None
+        self.superseded = False
+        self.event = threading.Event()
+
+
+class InferenceScheduler:
+    """Collects the newest frame from every registered stream and runs them through YOLO as one batch."""
+
+    def __init__(self, backend=None, max_batch=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT, conf=TRACK_CONFIDENCE):
+        self.backend = backend or InferenceBackend()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.conf = conf
+
+        self.model = None
+        self.streams = set()
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.error = None  # set when the model can't be loaded; fails every request until the next start()
+
+        self.batches = 0
+        self.frames = 0
+        self.last_batch_size = 0
+        self.last_batch_latency = 0.0
+
+    def start(self):
+        with self.cond:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.running = True
+            self.error = None
+            self.thread = threading.Thread(target=self.run, name="inference-scheduler", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self, timeout=5):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def register(self, camera_id):
+        with self.cond:
+            self.streams.add(camera_id)
+
+    def unregister(self, camera_id):
+        with self.cond:
+            self.streams.discard(camera_id)
+            request = self.pending.pop(camera_id, None)
+            if request is not None:
+                request.superseded = True
+                request.event.set()
+            self.cond.notify_all()
+
+    def submit(self, camera_id, frame):
+        request = InferenceRequest(camera_id, frame)
+        with self.cond:
+            if self.error is not None:
+                request.error = self.error
+                request.event.set()
+                return request
+            stale = self.pending.get(camera_id)
+            if stale is not None:
+                # Only the newest frame per stream is worth running
+                stale.superseded = True
+                stale.event.set()
+            self.pending[camera_id] = request
+            self.cond.notify_all()
+        return request
+
+    def infer(self, camera_id, frame, timeout=None):
+        request = self.submit(camera_id, frame)
+        if not request.event.wait(timeout):
+            return None
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def status(self):
+        return {
+            "backend": self.backend.status(),
+            "alive": self.thread is not None and self.thread.is_alive(),
+            "error": str(self.error) if self.error is not None else None,
+            "streams": len(self.streams),
+            "batches": self.batches,
+            "frames": self.frames,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_latency_ms": round(self.last_batch_latency * 1000, 2),
+        }
+
+    def next_batch(self):
+        with self.cond:
+            while self.running and not self.pending:
+                self.cond.wait(0.1)
+            if not self.running:
+                return []
+
+            # Give the other streams a moment so they land in the same batch
+            deadline = time.monotonic() + self.max_wait
+            while self.running and len(self.pending) < min(len(self.streams), self.max_batch):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = []
+            for camera_id in list(self.pending)[:self.max_batch]:
+                batch.append(self.pending.pop(camera_id))
+            return batch
+
+    def load_model(self):
+        if self.model is not None:
+            return
+        try:
+            self.model = self.backend.model()
+        except Exception as e:
+            if self.backend.name == "torch":
+                raise
+            print(f"[WARN] {self.backend.label} backend unavailable ({e}); falling back to torch")
+            self.backend = InferenceBackend("torch", self.backend.model_path, self.backend.imgsz)
+            self.model = self.backend.model()
+
+    def fail(self, error):
+        # Without a model nothing can run: fail what's queued and everything submitted after
+        print(f"[ERROR] Inference model failed to load: {error}")
+        with self.cond:
+            self.error = error
+            self.running = False
+            for request in self.pending.values():
+                request.error = error
+                request.frame = None
+                request.event.set()
+            self.pending.clear()
+
+    def run(self):
+        try:
+            self.load_model()
+        except Exception as e:
+            self.fail(e)
+            return
+
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                results = self.backend.predict(self.model, [r.frame for r in batch], conf=self.conf)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                print(f"[ERROR] Batched inference failed: {e}")
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.frame = None
+                    request.event.set()
+
+            self.last_batch_latency = time.perf_counter() - started
+            self.last_batch_size = len(batch)
+            self.batches += 1
+            self.frames += len(batch)
+
+        # Release anyone still waiting
+        with self.cond:
+            for request in self.pending.values():
+                request.superseded = True
+                request.event.set()
+            self.pending.clear()
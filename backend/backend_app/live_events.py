@@ -0,0 +1,176 @@
+# live_events.py
+import asyncio
+import json
+import time
+
+from django.utils import timezone
+
+from backend_app.occupancy import occupancy_channel
+
+# === Redis Keys ===
+# live_events_seq:cafe:{cafe}       counter, id of the cafe's last event
+# live_events:cafe:{cafe}           list of the last LIVE_EVENT_BACKLOG events as JSON, newest first
+# live_events_updates:cafe:{cafe}   pub/sub channel carrying each event
+# live_detection:cafe:{cafe}        JSON of the last detection status event
+# entry_counts:cafe:{cafe}:{date}   hash with the day's "enter" / "exit" totals
+#
+# Occupancy diffs keep their own channel and version (see occupancy.py); the
+# SSE stream merges both, so its event ids are "{occupancy version}-{event id}".
+
+LIVE_EVENT_BACKLOG = 500  # events kept for clients resuming with Last-Event-ID
+ENTRY_COUNTS_TTL = 3 * 24 * 3600  # seconds
+SUBSCRIBER_QUEUE_SIZE = 256  # messages buffered per stream before it resyncs from a snapshot
+
+
+def live_events_seq_key(cafe_id):
+    return f"live_events_seq:cafe:{cafe_id}"
+
+def live_events_key(cafe_id):
+    return f"live_events:cafe:{cafe_id}"
+
+def live_events_channel(cafe_id):
+    return f"live_events_updates:cafe:{cafe_id}"
+
+def live_detection_key(cafe_id):
+    return f"live_detection:cafe:{cafe_id}"
+
+def entry_counts_key(cafe_id, day=None):
+    return f"entry_counts:cafe:{cafe_id}:{(day or timezone.localdate()).isoformat()}"
+
+
+class LiveEventPublisher:
+    """Appends entry and detection events to a cafe's backlog and announces them."""
+
+    def __init__(self, client):
+        self.client = client
+        self.published = 0
+
+    def publish(self, cafe_id, event_type, data):
+        event_id = self.client.incr(live_events_seq_key(cafe_id))
+        payload = json.dumps({"id": event_id, "type": event_type, "timestamp": time.time(), "data": data})
+        pipe = self.client.pipeline()
+        pipe.lpush(live_events_key(cafe_id), payload)
+        pipe.ltrim(live_events_key(cafe_id), 0, LIVE_EVENT_BACKLOG - 1)
+        pipe.publish(live_events_channel(cafe_id), payload)
+        pipe.execute()
+        self.published += 1
+        return event_id
+
+    def publish_entries(self, cafe_id, entries):
+        """entries are (camera_id, event_type, face_id, timestamp); one event carries the whole batch."""
+        key = entry_counts_key(cafe_id)
+        enters = sum(1 for e in entries if e[1] == "enter")
+        exits = len(entries) - enters
+        pipe = self.client.pipeline()
+        pipe.hincrby(key, "enter", enters)
+        pipe.hincrby(key, "exit", exits)
+        pipe.expire(key, ENTRY_COUNTS_TTL)
+        total_enter, total_exit, _ = pipe.execute()
+        return self.publish(cafe_id, "entry", {
+            "counts": entry_counts(total_enter, total_exit),
+            "events": [
+                {"camera_id": camera_id, "event_type": event_type, "face_id": face_id, "timestamp": timestamp.isoformat()}
+                for camera_id, event_type, face_id, timestamp in entries
+            ],
+        })
+
+    def publish_detection(self, cafe_id, status, cameras):
+        data = {"status": status, "cameras": cameras}
+        self.client.set(live_detection_key(cafe_id), json.dumps(data))
+        return self.publish(cafe_id, "detection", data)
+
+
+def entry_counts(enter, exit):
+    enter, exit = int(enter or 0), int(exit or 0)
+    return {"enter": enter, "exit": exit, "inside": max(0, enter - exit)}
+
+
+# === Async Readers ===
+async def aread_live_seq(client, cafe_id):
+    return int(await client.get(live_events_seq_key(cafe_id)) or 0)
+
+async def aread_live_state(client, cafe_id):
+    """Entry counts and detection status, sent to streams that can't replay what they missed."""
+    pipe = client.pipeline()
+    pipe.hgetall(entry_counts_key(cafe_id))
+    pipe.get(live_detection_key(cafe_id))
+    counts, detection = await pipe.execute()
+    return {
+        "counts": entry_counts(counts.get("enter"), counts.get("exit")),
+        "detection": json.loads(detection) if detection else {"status": "stopped", "cameras": []},
+    }
+
+async def aread_live_events_since(client, cafe_id, after_id):
+    """Events newer than after_id as (id, type, payload), oldest first; None if the backlog no longer reaches back that far."""
+    events = []
+    for payload in await client.lrange(live_events_key(cafe_id), 0, -1):
+        event = json.loads(payload)
+        if event["id"] <= after_id:
+            return events[::-1]
+        events.append((event["id"], event["type"], payload))
+    # The whole backlog is newer: fine only if it starts right after after_id
+    if not events or events[-1][0] == after_id + 1:
+        return events[::-1]
+    return None
+
+
+class LiveEventWatcher:
+    """One pattern subscription per event loop for occupancy diffs and live events, fanned out to stream queues.
+
+    Each message is parsed once and handed to every stream of its cafe as
+    (kind, parsed, raw). A stream whose queue fills up is flagged to resync.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.pubsub = None
+        self.task = None
+        self.queues = {}  # cafe id (str) -> set of asyncio.Queue
+        self.starting = asyncio.Lock()
+        self.messages = 0
+        self.overflows = 0
+
+    async def start(self):
+        async with self.starting:
+            if self.task is not None and not self.task.done():
+                return
+            self.pubsub = self.client.pubsub()
+            await self.pubsub.psubscribe(occupancy_channel("*"), live_events_channel("*"))
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+
+    def subscribe(self, cafe_id):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        queue.overflowed = False
+        self.queues.setdefault(str(cafe_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, cafe_id, queue):
+        queues = self.queues.get(str(cafe_id))
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.queues[str(cafe_id)]
+
+    async def listen(self):
+        try:
+            async for message in self.pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                channel = message["channel"]
+                queues = self.queues.get(channel.rsplit(":", 1)[1])
+                if not queues:
+                    continue
+                kind = "occupancy" if channel.startswith(occupancy_channel("")) else "event"
+                item = (kind, json.loads(message["data"]), message["data"])
+                self.messages += 1
+                for queue in queues:
+                    try:
+                        queue.put_nowait(item)
+                    except asyncio.QueueFull:
+                        queue.overflowed = True
+                        self.overflows += 1
+        except Exception as e:
+            print(f"[ERROR] Live event watcher stopped: {e}")
+            for queues in self.queues.values():
+                for queue in queues:
+                    queue.overflowed = True
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+import time
+import numpy as np
+from backend_app.association import (
+    is_seated, is_valid_seated_position, calculate_iou,
+    seated_matrix, valid_seated_matrix, iou_matrix, chairs_seated,
+)
+
+
+def random_boxes(rng, count, width=1920, height=1080, min_size=40, max_size=260):
+    x1 = rng.integers(0, width - max_size, count)
+    y1 = rng.integers(0, height - max_size, count)
+    w = rng.integers(min_size, max_size, count)
+    h = rng.integers(min_size, max_size, count)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1).astype(np.int64)
+
+
+class Command(BaseCommand):
+    help = "Check the vectorized chair/person kernels against the scalar predicates and time both"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chairs", type=int, nargs="+", default=[10, 60, 200])
+        parser.add_argument("--persons", type=int, nargs="+", default=[5, 40, 100])
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def time_it(self, fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        repeat = options["repeat"]
+
+        self.stdout.write(f"{'chairs':>7} {'persons':>8} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8}  match")
+        for n_chairs in options["chairs"]:
+            for n_persons in options["persons"]:
+                chairs = random_boxes(rng, n_chairs)
+                persons = random_boxes(rng, n_persons, min_size=60, max_size=400)
+                chair_list = [tuple(c) for c in chairs.tolist()]
+                person_list = [tuple(p) for p in persons.tolist()]
+
+                # Correctness first: every matrix has to agree with the scalar version
+                expected_seated = np.array([[is_seated(c, p) for p in person_list] for c in chair_list], dtype=bool).reshape(n_chairs, n_persons)
+                expected_valid = np.array([[is_valid_seated_position(c, p) for p in person_list] for c in chair_list], dtype=bool).reshape(n_chairs, n_persons)
+                expected_iou = np.array([[calculate_iou(c, p) for p in person_list] for c in chair_list]).reshape(n_chairs, n_persons)
+                match = (
+                    np.array_equal(expected_seated, seated_matrix(chairs, persons))
+                    and np.array_equal(expected_valid, valid_seated_matrix(chairs, persons))
+                    and np.array_equal(expected_iou, iou_matrix(chairs, persons))
+                )
+
+                loop_ms = self.time_it(
+                    lambda: [any(is_seated(c, p) for p in person_list) for c in chair_list], repeat
+                )
+                numpy_ms = self.time_it(lambda: chairs_seated(chairs, persons), repeat)
+
+                self.stdout.write(
+                    f"{n_chairs:>7} {n_persons:>8} {loop_ms:>9.3f} {numpy_ms:>9.3f} {loop_ms / numpy_ms:>7.1f}x  {'yes' if match else 'NO'}"
+                )
+                if not match:
+                    self.stderr.write(self.style.ERROR("Vectorized results differ from the scalar predicates."))
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,217 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from backend_app.inference import BACKENDS, MODEL_PATH, TRACK_CONFIDENCE, InferenceBackend
+
+REFERENCE_CONFIDENCE = 0.25  # torch boxes above this are the "ground truth" the others are scored against
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def read_clip(clip, count):
+    """Up to count frames spread evenly over the clip."""
+    cap = cv2.VideoCapture(clip)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    wanted = set(np.linspace(0, total - 1, min(count, total)).astype(int).tolist())
+    frames, index = [], 0
+    while len(frames) < len(wanted):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index in wanted:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def boxes_from_result(result):
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    boxes = result.boxes.cpu().numpy()
+    return boxes.xyxy.astype(np.float32), boxes.cls.astype(np.int64), boxes.conf.astype(np.float32)
+
+
+def box_iou(a, b):
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def average_precision(predictions, references, cls, iou_threshold):
+    """COCO-style 101-point AP for one class; each list holds per-frame (boxes, classes[, confidences])."""
+    scored, total = [], 0
+    for (boxes, classes, confidences), (ref_boxes, ref_classes) in zip(predictions, references):
+        refs = ref_boxes[ref_classes == cls]
+        total += len(refs)
+        mask = classes == cls
+        preds, confs = boxes[mask], confidences[mask]
+        order = np.argsort(-confs)
+        matched = np.zeros(len(refs), dtype=bool)
+        ious = box_iou(preds[order], refs) if len(refs) and len(preds) else np.zeros((len(preds), 0))
+        for row, i in enumerate(order):
+            hit = False
+            if ious.shape[1]:
+                candidates = np.where(~matched & (ious[row] >= iou_threshold))[0]
+                if len(candidates):
+                    matched[candidates[np.argmax(ious[row][candidates])]] = True
+                    hit = True
+            scored.append((confs[i], hit))
+    if total == 0:
+        return None
+    if not scored:
+        return 0.0
+    scored.sort(key=lambda s: -s[0])
+    hits = np.array([hit for _, hit in scored], dtype=np.float64)
+    tp = np.cumsum(hits)
+    recall = tp / total
+    precision = tp / np.arange(1, len(hits) + 1)
+    # Precision envelope, sampled at 101 recall points
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall, points, side="left")
+    return float(np.mean(np.where(idx < len(precision), precision[np.minimum(idx, len(precision) - 1)], 0.0)))
+
+
+def mean_average_precision(predictions, references):
+    """(mAP50, mAP50-95) of predictions against the reference boxes, over the classes the reference found."""
+    classes = sorted(set(np.concatenate([ref_classes for _, ref_classes in references]).tolist())) if references else []
+    if not classes:
+        return None, None
+    per_threshold = []
+    for threshold in IOU_THRESHOLDS:
+        aps = [average_precision(predictions, references, cls, threshold) for cls in classes]
+        per_threshold.append(np.mean([ap for ap in aps if ap is not None]))
+    return float(per_threshold[0]), float(np.mean(per_threshold))
+
+
+class Command(BaseCommand):
+    help = "Export the detector to ONNX Runtime / OpenVINO and compare latency, throughput and mAP drift on a local clip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clip", required=True, help="Local validation video")
+        parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+        parser.add_argument("--imgsz", type=int, nargs="+", default=[640], help="Input sizes to try")
+        parser.add_argument("--int8", action="store_true", help="Also try INT8 variants of the exported backends")
+        parser.add_argument("--export", action="store_true", help="Export variants that don't exist yet")
+        parser.add_argument("--model", default=MODEL_PATH)
+        parser.add_argument("--frames", type=int, default=200, help="Frames sampled from the clip")
+        parser.add_argument("--batch", type=int, default=4, help="Batch size for the throughput run")
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--max-drift", type=float, default=0.05,
+                            help="Largest acceptable drop in mAP50 against the torch reference")
+
+    def handle(self, *args, **options):
+        frames = read_clip(options["clip"], options["frames"])
+        if not frames:
+            raise CommandError(f"No frames could be read from {options['clip']}")
+
+        variants = []
+        for name in options["backends"]:
+            for imgsz in options["imgsz"]:
+                variants.append(InferenceBackend(name, options["model"], imgsz, int8=False))
+                if options["int8"] and name != "torch":
+                    variants.append(InferenceBackend(name, options["model"], imgsz, int8=True))
+
+        # The drift baseline is always the original weights at full size
+        reference_backend = InferenceBackend("torch", options["model"], 640)
+        reference_model = reference_backend.load()
+        references = []
+        for frame in frames:
+            boxes, classes, confidences = boxes_from_result(reference_backend.predict(reference_model, frame)[0])
+            keep = confidences >= REFERENCE_CONFIDENCE
+            references.append((boxes[keep], classes[keep]))
+
+        self.stdout.write(f"{len(frames)} frames from {options['clip']}, reference {reference_backend.label}")
+        self.stdout.write(
+            f"{'variant':<20} {'load ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'fps':>7} {'mAP50':>6} {'mAP50-95':>9}  status"
+        )
+        rows = []
+        # Calibration frames only need to outlive the exports
+        with tempfile.TemporaryDirectory(prefix="calibration_") as workdir:
+            calibration = None
+            if options["export"] and options["int8"] and "openvino" in options["backends"]:
+                calibration = self.calibration_data(frames, reference_model.names, workdir)
+            for backend in variants:
+                if not backend.exported():
+                    if not options["export"]:
+                        self.stdout.write(f"{backend.label:<20} not exported (use --export)")
+                        continue
+                    try:
+                        started = time.perf_counter()
+                        backend.export(calibration)
+                        self.stdout.write(f"[INFO] Exported {backend.label} to {backend.path} "
+                                          f"in {time.perf_counter() - started:.0f} s")
+                    except Exception as e:
+                        self.stderr.write(f"[ERROR] Could not export {backend.label}: {e}")
+                        continue
+                row = self.measure(backend, frames, references, options)
+                rows.append(row)
+                status = "ok" if row["acceptable"] else "drift"
+                map50 = f"{row['map50']:.3f}" if row["map50"] is not None else "-"
+                map5095 = f"{row['map50_95']:.3f}" if row["map50_95"] is not None else "-"
+                self.stdout.write(
+                    f"{backend.label:<20} {row['load_ms']:>8.0f} {row['p50_ms']:>7.1f} {row['p95_ms']:>7.1f} "
+                    f"{row['fps']:>7.1f} {map50:>6} {map5095:>9}  {status}"
+                )
+
+        acceptable = [row for row in rows if row["acceptable"]]
+        if not acceptable:
+            self.stdout.write(self.style.WARNING("No variant stayed within the drift limit."))
+            return
+        best = max(acceptable, key=lambda row: row["fps"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Fastest acceptable: {best['backend'].label} -> INFERENCE_BACKEND={best['backend'].name} "
+            f"INFERENCE_IMGSZ={best['backend'].imgsz} INFERENCE_INT8={int(best['backend'].int8)}"
+        ))
+
+    def measure(self, backend, frames, references, options):
+        started = time.perf_counter()
+        model = backend.load()
+        load_ms = (time.perf_counter() - started) * 1000
+        for _ in range(options["warmup"]):
+            backend.predict(model, frames[:options["batch"]])
+
+        # Latency: one frame at a time, as a single camera sees it
+        latencies, predictions = [], []
+        for frame in frames:
+            started = time.perf_counter()
+            result = backend.predict(model, frame, conf=TRACK_CONFIDENCE)[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            predictions.append(boxes_from_result(result))
+
+        # Throughput: batches, as the scheduler runs several cameras
+        started = time.perf_counter()
+        for i in range(0, len(frames), options["batch"]):
+            backend.predict(model, frames[i:i + options["batch"]], conf=TRACK_CONFIDENCE)
+        fps = len(frames) / (time.perf_counter() - started)
+
+        map50, map50_95 = mean_average_precision(predictions, references)
+        return {
+            "backend": backend,
+            "load_ms": load_ms,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "fps": fps,
+            "map50": map50,
+            "map50_95": map50_95,
+            # A clip with nothing in it can't show drift
+            "acceptable": map50 is None or map50 >= 1.0 - options["max_drift"],
+        }
+
+    def calibration_data(self, frames, names, root):
+        """A throwaway dataset of clip frames in root for OpenVINO INT8 calibration (labels aren't needed)."""
+        os.makedirs(os.path.join(root, "images"))
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(root, "images", f"{i:05d}.jpg"), frame)
+        path = os.path.join(root, "data.yaml")
+        # JSON is valid YAML
+        with open(path, "w") as f:
+            json.dump({"path": root, "train": "images", "val": "images", "names": dict(names)}, f)
+        return path
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+import glob
+import time
+import cv2 as cv
+import numpy as np
+from backend_app.association import iou_matrix
+from backend_app.face_recognition import detect_faces, align_good_faces
+
+
+def read_frames(source, limit, step):
+    # A video file or stream, or a glob of still images
+    paths = sorted(glob.glob(source))
+    if paths:
+        for path in paths[:limit]:
+            frame = cv.imread(path)
+            if frame is not None:
+                yield frame
+        return
+    cap = cv.VideoCapture(source)
+    if not cap.isOpened():
+        raise CommandError(f"Cannot open {source}")
+    read = 0
+    index = 0
+    while read < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if index % step == 0:
+            read += 1
+            yield frame
+        index += 1
+    cap.release()
+
+
+def as_corner_boxes(faces):
+    boxes = faces[:, :4].astype(np.int64)
+    boxes[:, 2:] += boxes[:, :2]
+    return boxes
+
+
+class Command(BaseCommand):
+    help = "Time YuNet at several detection widths and report face recall against full resolution"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Video file, stream URL or image glob")
+        parser.add_argument("--widths", type=int, nargs="+", default=[0, 1280, 960, 640, 480, 320],
+                            help="Detection widths; 0 is full resolution")
+        parser.add_argument("--frames", type=int, default=200)
+        parser.add_argument("--step", type=int, default=5, help="Use every Nth video frame")
+        parser.add_argument("--iou", type=float, default=0.5, help="Overlap that counts as the same face")
+
+    def handle(self, *args, **options):
+        frames = list(read_frames(options["source"], options["frames"], options["step"]))
+        if not frames:
+            raise CommandError("No frames read")
+        reference = [detect_faces(frame, detection_width=0) for frame in frames]
+        total = sum(len(faces) for faces in reference)
+        self.stdout.write(f"{len(frames)} frame(s) at {frames[0].shape[1]}x{frames[0].shape[0]}, {total} face(s) at full resolution")
+
+        self.stdout.write(f"{'width':>6} {'ms/frame':>9} {'faces':>6} {'recall':>7} {'pass gate':>10}")
+        for width in options["widths"]:
+            detect_faces(frames[0], detection_width=width)  # warm up at this input size
+            found = matched = passed = 0
+            elapsed = 0.0
+            for frame, expected in zip(frames, reference):
+                started = time.perf_counter()
+                faces = detect_faces(frame, detection_width=width)
+                elapsed += time.perf_counter() - started
+                found += len(faces)
+                if len(faces) and len(expected):
+                    overlap = iou_matrix(as_corner_boxes(expected), as_corner_boxes(faces))
+                    matched += int((overlap.max(axis=1) >= options["iou"]).sum())
+                passed += len(align_good_faces(frame, faces)[0])
+
+            recall = matched / total if total else 1.0
+            self.stdout.write(
+                f"{width or 'full':>6} {elapsed / len(frames) * 1000:>9.2f} {found:>6} {recall:>7.3f} {passed:>10}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+import time
+import numpy as np
+from backend_app import face_recognition
+from backend_app.face_recognition import SFACE_INPUT_SIZE, get_face_models, embed_aligned_faces
+
+
+class Command(BaseCommand):
+    help = "Compare per-face SFace feature() calls with one batched forward pass per frame"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--faces", type=int, nargs="+", default=[1, 8, 32], help="Faces per frame")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        _, recognizer = get_face_models()
+
+        self.stdout.write(f"{'faces':>6} {'per-face ms':>12} {'batched ms':>11} {'faces/s per-face':>17} {'faces/s batched':>16}  same")
+        for n in options["faces"]:
+            # Aligned crops are what alignCrop() hands to the network
+            aligned = [rng.integers(0, 256, SFACE_INPUT_SIZE + (3,), dtype=np.uint8) for _ in range(n)]
+
+            recognizer.feature(aligned[0])  # warm up both paths
+            embed_aligned_faces(aligned)
+
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                expected = [recognizer.feature(face) for face in aligned]
+            per_face = (time.perf_counter() - started) / options["repeat"]
+
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                batched = embed_aligned_faces(aligned)
+            batch = (time.perf_counter() - started) / options["repeat"]
+
+            same = all(np.allclose(a, b, atol=1e-3) for a, b in zip(expected, batched))
+            self.stdout.write(
+                f"{n:>6} {per_face * 1000:>12.2f} {batch * 1000:>11.2f} {n / per_face:>17.0f} {n / batch:>16.0f}  {'yes' if same else 'NO'}"
+            )
+
+        if face_recognition._batching_supported is False:
+            self.stdout.write(self.style.WARNING("This SFace model only accepts one face per pass; the batched column fell back to per-face calls."))
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+import os
+import tempfile
+import time
+import numpy as np
+from backend_app.face_index import EmbeddingMatrix, EMBEDDING_DIM, INDEX_BACKENDS, build_index, measure_recall
+
+
+def clustered_faces(rng, n, people_per_cluster=50):
+    # Real embeddings cluster (lighting, age, ethnicity); pure noise would flatter neither backend
+    centers = rng.standard_normal((max(n // people_per_cluster, 1), EMBEDDING_DIM)).astype(np.float32)
+    labels = rng.integers(0, len(centers), n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+
+
+class Command(BaseCommand):
+    help = "Compare exact and approximate face index backends: build time, query latency, recall and reload time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--identities", type=int, nargs="+", default=[1000, 10000, 50000])
+        parser.add_argument("--backends", nargs="+", default=list(INDEX_BACKENDS), choices=list(INDEX_BACKENDS))
+        parser.add_argument("--faces", type=int, default=8, help="Faces per frame")
+        parser.add_argument("--queries", type=int, default=500, help="Queries used to measure recall")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        faces = options["faces"]
+
+        self.stdout.write(
+            f"{'identities':>10} {'backend':>8} {'build ms':>9} {'ms/frame':>9} {'recall':>7} {'load ms':>8}"
+        )
+        for n in options["identities"]:
+            features = clustered_faces(rng, n)
+            known = {f"customer_{i + 1}": features[i] for i in range(n)}
+            # Queries are noisy copies of known faces so there is a real best match
+            picks = rng.integers(0, n, options["queries"])
+            queries = features[picks] + 0.3 * rng.standard_normal((len(picks), EMBEDDING_DIM)).astype(np.float32)
+            exact = EmbeddingMatrix.from_mapping(known)
+
+            for backend in options["backends"]:
+                started = time.perf_counter()
+                index = build_index(known, backend)
+                build_ms = (time.perf_counter() - started) * 1000
+
+                started = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    index.match(queries[:faces])
+                frame_ms = (time.perf_counter() - started) / options["repeat"] * 1000
+
+                recall = measure_recall(index, queries, exact)
+
+                with tempfile.TemporaryDirectory() as tmp:
+                    path = os.path.join(tmp, "index.npz")
+                    index.save(path)
+                    started = time.perf_counter()
+                    EmbeddingMatrix.load(path)
+                    load_ms = (time.perf_counter() - started) * 1000
+
+                self.stdout.write(
+                    f"{n:>10} {backend:>8} {build_ms:>9.1f} {frame_ms:>9.2f} {recall:>7.3f} {load_ms:>8.1f}"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+import pickle
+import time
+import numpy as np
+from backend_app.face_index import EmbeddingMatrix, EMBEDDING_DIM
+
+
+def legacy_match(face_feature, pickled):
+    # What recognize_face did per face: decode every stored embedding, then score pair by pair
+    best_match, best_score = "Unknown", 0.0
+    query = face_feature / np.linalg.norm(face_feature)
+    for name, payload in pickled.items():
+        stored = pickle.loads(payload)
+        score = float(np.sum(query * (stored / np.linalg.norm(stored))))
+        if score > best_score:
+            best_score, best_match = score, name
+    return best_match, best_score
+
+
+class Command(BaseCommand):
+    help = "Compare per-pair face matching with the in-memory embedding matrix at several identity counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--identities", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--faces", type=int, default=8, help="Faces per frame")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--legacy-max", type=int, default=100000,
+                            help="Skip the per-pair baseline above this many identities")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        faces = options["faces"]
+
+        self.stdout.write(f"{'identities':>10} {'per-pair ms/frame':>18} {'matrix ms/frame':>16} {'speedup':>9}  match")
+        for n in options["identities"]:
+            features = rng.standard_normal((n, 1, EMBEDDING_DIM)).astype(np.float32)
+            names = [f"customer_{i + 1}" for i in range(n)]
+            # Queries are noisy copies of known faces so there is a real best match
+            picks = rng.integers(0, n, faces)
+            queries = [features[i] + 0.3 * rng.standard_normal((1, EMBEDDING_DIM)).astype(np.float32) for i in picks]
+
+            index = EmbeddingMatrix.from_mapping(dict(zip(names, features)))
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                matched = index.match(queries)
+            matrix_ms = (time.perf_counter() - started) / options["repeat"] * 1000
+
+            if n <= options["legacy_max"]:
+                pickled = {name: pickle.dumps(feature) for name, feature in zip(names, features)}
+                started = time.perf_counter()
+                expected = [legacy_match(q, pickled) for q in queries]
+                legacy_ms = (time.perf_counter() - started) * 1000
+                same = all(a[0] == b[0] and abs(a[1] - b[1]) < 1e-4 for a, b in zip(expected, matched))
+                self.stdout.write(
+                    f"{n:>10} {legacy_ms:>18.1f} {matrix_ms:>16.2f} {legacy_ms / matrix_ms:>8.0f}x  {'yes' if same else 'NO'}"
+                )
+            else:
+                self.stdout.write(f"{n:>10} {'skipped':>18} {matrix_ms:>16.2f} {'-':>9}  -")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
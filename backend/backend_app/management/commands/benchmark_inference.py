@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+import time
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from backend_app.inference import MODEL_PATH, TRACK_CONFIDENCE
+
+
+class Command(BaseCommand):
+    help = "Compare per-frame and cross-camera batched YOLO throughput at several stream counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--streams", type=int, nargs="+", default=[1, 4, 8])
+        parser.add_argument("--frames", type=int, default=50, help="Frames per stream to run")
+        parser.add_argument("--clip", default=None, help="Local video to sample frames from (random frames if omitted)")
+        parser.add_argument("--model", default=MODEL_PATH)
+        parser.add_argument("--warmup", type=int, default=3)
+
+    def load_frames(self, clip, count):
+        if not clip:
+            rng = np.random.default_rng(0)
+            return [rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8) for _ in range(count)]
+        cap = cv2.VideoCapture(clip)
+        frames = []
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                if not frames:
+                    break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            frames.append(frame)
+        cap.release()
+        return frames
+
+    def handle(self, *args, **options):
+        model = YOLO(options["model"])
+        max_streams = max(options["streams"])
+        frames = self.load_frames(options["clip"], max_streams)
+        if not frames:
+            self.stderr.write("No frames could be read from the clip.")
+            return
+        # Each stream gets its own frame so the batch is not just one image repeated
+        frames = [frames[i % len(frames)] for i in range(max_streams)]
+
+        for _ in range(options["warmup"]):
+            model.predict(frames[:max_streams], conf=TRACK_CONFIDENCE, verbose=False)
+
+        self.stdout.write(f"{'streams':>8} {'per-frame fps':>14} {'batched fps':>12} {'speedup':>8}")
+        for n in options["streams"]:
+            batch = frames[:n]
+
+            started = time.perf_counter()
+            for _ in range(options["frames"]):
+                for frame in batch:
+                    model.predict(frame, conf=TRACK_CONFIDENCE, verbose=False)
+            single_fps = n * options["frames"] / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for _ in range(options["frames"]):
+                model.predict(batch, conf=TRACK_CONFIDENCE, verbose=False)
+            batched_fps = n * options["frames"] / (time.perf_counter() - started)
+
+            self.stdout.write(f"{n:>8} {single_fps:>14.1f} {batched_fps:>12.1f} {batched_fps / single_fps:>7.2f}x")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,140 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import RefreshToken
+import asyncio
+import threading
+import time
+from backend_app.live_events import LiveEventPublisher
+from backend_app.models import UserCafe
+from backend_app.occupancy import OccupancyPublisher, occupancy_cameras_key, occupancy_key
+from backend_app.views import redis_client
+
+POLLED_URLS = ["/api/chair-occupancy/", "/api/analytics/detection-status/", "/api/entry-state/"]
+LIVE_URL = "/api/async/live/"
+BENCHMARK_CAMERA = 0  # occupancy published under a camera id no real camera uses
+
+
+class QueryCounter:
+    """Counts SQL statements on every connection, including the ones sync_to_async threads open."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if connection is not None and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = "Compare polling the dashboard endpoints at 1 Hz with one live SSE stream per dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dashboards", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode")
+        parser.add_argument("--interval", type=float, default=1.0, help="Polling interval per dashboard")
+        parser.add_argument("--changes", type=float, default=2.0, help="Occupancy changes per second while measuring")
+        parser.add_argument("--cafe", type=int, default=None, help="Cafe whose owner the dashboards log in as")
+
+    def handle(self, *args, **options):
+        cafe = UserCafe.objects.filter(id=options["cafe"]).first() if options["cafe"] else UserCafe.objects.first()
+        if cafe is None:
+            raise CommandError("No cafe to benchmark against")
+        token = str(RefreshToken.for_user(cafe.user).access_token)
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        for connection in connections.all():
+            counter.install(connection=connection)
+
+        stop = threading.Event()
+        changes = threading.Thread(target=self.publish_changes, args=(cafe.id, options["changes"], stop), daemon=True)
+        changes.start()
+        try:
+            self.stdout.write(
+                f"{'mode':>6} {'dashboards':>11} {'cpu ms/s':>9} {'requests':>9} {'db queries':>11} "
+                f"{'redis cmds':>11} {'KB sent':>8} {'updates':>8}"
+            )
+            self.measure("poll", options, counter, lambda: self.poll(token, options))
+            self.measure("sse", options, counter, lambda: asyncio.run(self.stream(token, options)))
+        finally:
+            stop.set()
+            changes.join()
+            connection_created.disconnect(counter.install)
+            redis_client.delete(occupancy_key(cafe.id, BENCHMARK_CAMERA))
+            redis_client.srem(occupancy_cameras_key(cafe.id), BENCHMARK_CAMERA)
+
+    def publish_changes(self, cafe_id, rate, stop):
+        occupancy = OccupancyPublisher(redis_client, cafe_id, BENCHMARK_CAMERA)
+        events = LiveEventPublisher(redis_client)
+        occupied, i = False, 0
+        while not stop.wait(1.0 / rate):
+            occupied = not occupied
+            occupancy.publish([(0, (0, 0, 10, 10), occupied, time.time() if occupied else None)])
+            i += 1
+            if i % 5 == 0:
+                events.publish(cafe_id, "benchmark", {"change": i})
+
+    def redis_commands(self):
+        try:
+            return sum(stats["calls"] for stats in redis_client.info("commandstats").values())
+        except Exception:
+            return 0
+
+    def measure(self, mode, options, counter, run):
+        queries, commands = counter.count, self.redis_commands()
+        cpu = time.process_time()
+        requests, sent, updates = run()
+        cpu = time.process_time() - cpu
+        self.stdout.write(
+            f"{mode:>6} {options['dashboards']:>11} {cpu * 1000 / options['duration']:>9.1f} {requests:>9} "
+            f"{counter.count - queries:>11} {self.redis_commands() - commands:>11} {sent / 1024:>8.0f} {updates:>8}"
+        )
+
+    def poll(self, token, options):
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+        requests = sent = updates = 0
+        seen = {}
+        deadline = time.perf_counter() + options["duration"]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            for dashboard in range(options["dashboards"]):
+                for url in POLLED_URLS:
+                    response = client.get(url)
+                    requests += 1
+                    sent += len(response.content)
+                    # An update is a poll that returned something new for that dashboard
+                    if seen.get((dashboard, url)) != response.content:
+                        seen[(dashboard, url)] = response.content
+                        updates += 1
+            time.sleep(max(0.0, options["interval"] - (time.perf_counter() - started)))
+        return requests, sent, updates
+
+    async def stream(self, token, options):
+        client = AsyncClient()
+        totals = {"sent": 0, "updates": 0}
+
+        async def dashboard():
+            response = await client.get(LIVE_URL, {"token": token})
+            content = response.streaming_content
+            try:
+                async for chunk in content:
+                    totals["sent"] += len(chunk)
+                    if chunk.startswith(b"id:"):
+                        totals["updates"] += 1
+            finally:
+                await content.aclose()
+
+        tasks = [asyncio.create_task(dashboard()) for _ in range(options["dashboards"])]
+        await asyncio.sleep(options["duration"])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return options["dashboards"], totals["sent"], totals["updates"]
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+from django.conf import settings
+
+# Runs in a fresh interpreter, so nothing this command imported is already warm
+PROBE = """
+import json, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+imported = time.perf_counter()
+from backend_app.model_registry import models
+print("STARTUP " + json.dumps({{
+    "setup_ms": (setup_done - started) * 1000,
+    "import_ms": (imported - setup_done) * 1000,
+    "models_loaded": sorted(models.status()),
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Time a fresh process running django.setup() and importing backend_app.views, and check no model loads on import"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--module", nargs="+", default=["backend_app.views"], help="Modules the probe imports")
+        parser.add_argument("--top", type=int, default=10, help="Slowest imports to list (from -X importtime)")
+        parser.add_argument("--budget-ms", type=float, default=None,
+                            help="Fail if the median import time exceeds this")
+        parser.add_argument("--load-models", action="store_true",
+                            help="Also load each registered model here and report its load time")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"))
+        code = PROBE.format(modules=options["module"])
+        runs, importtime = [], ""
+        for _ in range(options["runs"]):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", code],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            line = next((l for l in proc.stdout.splitlines() if l.startswith("STARTUP ")), None)
+            if proc.returncode != 0 or line is None:
+                raise CommandError(f"Probe failed:\n{proc.stderr[-2000:]}")
+            runs.append(json.loads(line[len("STARTUP "):]))
+            importtime = proc.stderr
+
+        setup = np.median([r["setup_ms"] for r in runs])
+        imports = np.median([r["import_ms"] for r in runs])
+        self.stdout.write(f"django.setup(): {setup:.0f} ms   import {', '.join(options['module'])}: {imports:.0f} ms "
+                          f"(median of {len(runs)})")
+
+        self.stdout.write("Slowest imports (cumulative, last run):")
+        for cumulative, module in self.slowest(importtime, options["top"]):
+            self.stdout.write(f"  {cumulative / 1000:>8.1f} ms  {module}")
+
+        loaded = runs[-1]["models_loaded"]
+        if loaded:
+            raise CommandError(f"Models were loaded at import time: {', '.join(loaded)}")
+        self.stdout.write("No models loaded at import.")
+
+        if options["load_models"]:
+            self.load_models()
+
+        if options["budget_ms"] is not None and imports > options["budget_ms"]:
+            raise CommandError(f"Import took {imports:.0f} ms, over the {options['budget_ms']:.0f} ms budget")
+
+    def slowest(self, importtime, top):
+        rows = []
+        for line in importtime.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, module = line[len("import time:"):].split("|")
+            # Top-level imports and their direct children; deeper ones repeat their parents' time
+            depth = (len(module) - len(module.lstrip()) - 1) // 2
+            if depth <= 1:
+                rows.append((int(cumulative), module.strip()))
+        return sorted(rows, reverse=True)[:top]
+
+    def load_models(self):
+        from backend_app.face_recognition import get_face_models, get_feature_net
+        from backend_app.inference import yolo_model
+        from backend_app.model_registry import models
+
+        for name, load in (("yolo", yolo_model), ("face", get_face_models), ("sface_batch", get_feature_net)):
+            try:
+                load()
+            except Exception as e:
+                self.stderr.write(f"Could not load {name}: {e}")
+        for name, stats in models.status().items():
+            self.stdout.write(f"  {name:<60} {stats['last_load_ms']:>8.1f} ms")
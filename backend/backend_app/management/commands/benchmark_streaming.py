@@ -0,0 +1,145 @@
+from django.core.management.base import BaseCommand, CommandError
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+import cv2
+import numpy as np
+from backend_app.shared_video import frame_bus, FRAME_SHAPE
+
+FRAME_MARKER = b"Content-Type: image/jpeg"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test live MJPEG endpoints with many concurrent viewers, e.g. a WSGI and an ASGI server side by side:\n"
+        "  gunicorn backend.wsgi -b :8000 --threads 32   and   uvicorn backend.asgi:application --port 8001\n"
+        "  manage.py benchmark_streaming --publish --target wsgi=http://127.0.0.1:8000/api/video_feed/ "
+        "--target asgi=http://127.0.0.1:8001/api/async/video_feed/\n"
+        "Servers must run on this host to read the frames --publish writes to the shared-memory frame bus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", action="append", required=True, help="name=url of a streaming endpoint")
+        parser.add_argument("--viewers", type=int, nargs="+", default=[10, 50, 100, 200])
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds each viewer stays connected")
+        parser.add_argument("--connect-timeout", type=float, default=5.0)
+        parser.add_argument("--publish", action="store_true", help="Feed synthetic frames into the frame bus while testing")
+        parser.add_argument("--camera", type=int, default=1, help="Camera id --publish writes to")
+        parser.add_argument("--fps", type=float, default=15.0, help="Frame rate --publish writes at")
+        parser.add_argument("--min-fps", type=float, default=0.5,
+                            help="Fraction of --fps a viewer must receive to count as served")
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            name, sep, url = target.partition("=")
+            if not sep:
+                raise CommandError(f"--target must be name=url, got {target!r}")
+            targets.append((name, url))
+
+        stop = threading.Event()
+        publisher = None
+        if options["publish"]:
+            publisher = threading.Thread(target=self.publish, args=(options["camera"], options["fps"], stop), daemon=True)
+            publisher.start()
+            time.sleep(0.5)
+
+        try:
+            self.stdout.write(
+                f"{'target':>8} {'viewers':>8} {'connected':>10} {'served':>7} {'failed':>7} "
+                f"{'mean fps':>9} {'1st frame p50':>14} {'p95':>8}"
+            )
+            for name, url in targets:
+                for viewers in options["viewers"]:
+                    results = asyncio.run(self.run_viewers(url, viewers, options))
+                    self.report(name, viewers, results, options)
+        finally:
+            stop.set()
+            if publisher is not None:
+                publisher.join()
+                frame_bus.remove(options["camera"])
+
+    def publish(self, camera_id, fps, stop):
+        rng = np.random.default_rng(0)
+        height, width = FRAME_SHAPE[:2]
+        frames = []
+        for _ in range(8):
+            # Upscaled blocks plus sensor-like noise encode to camera-sized JPEGs (~60 KB)
+            frame = cv2.resize(rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8), (width, height),
+                               interpolation=cv2.INTER_CUBIC)
+            frames.append(np.clip(frame + rng.normal(0, 6, frame.shape), 0, 255).astype(np.uint8))
+        interval = 1.0 / fps
+        i = 0
+        while not stop.is_set():
+            frame_bus.publish(camera_id, frames[i % len(frames)])
+            i += 1
+            time.sleep(interval)
+
+    async def run_viewers(self, url, viewers, options):
+        return await asyncio.gather(*[self.viewer(url, options) for _ in range(viewers)])
+
+    async def viewer(self, url, options):
+        """(connected, frames, seconds to first frame) for one viewer."""
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        started = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, parts.port or 80), options["connect_timeout"]
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False, 0, None
+
+        frames, first_frame = 0, None
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            status = await asyncio.wait_for(reader.readline(), options["connect_timeout"])
+            if b" 200 " not in status:
+                return False, 0, None
+            headers = (await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), options["connect_timeout"])).lower()
+            chunked = b"transfer-encoding: chunked" in headers
+
+            deadline = started + options["duration"]
+            tail = b""
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                data = await asyncio.wait_for(self.read_body(reader, chunked), remaining)
+                if not data:
+                    break
+                data = tail + data
+                count = data.count(FRAME_MARKER)
+                if count and first_frame is None:
+                    first_frame = time.perf_counter() - started
+                frames += count
+                tail = data[-(len(FRAME_MARKER) - 1):]
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+        return True, frames, first_frame
+
+    async def read_body(self, reader, chunked):
+        if not chunked:
+            return await reader.read(64 * 1024)
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size == 0:
+            return b""
+        data = await reader.readexactly(size)
+        await reader.readexactly(2)
+        return data
+
+    def report(self, name, viewers, results, options):
+        connected = [r for r in results if r[0]]
+        fps = [frames / options["duration"] for _, frames, _ in connected]
+        served = sum(1 for f in fps if f >= options["fps"] * options["min_fps"])
+        firsts = [first for _, _, first in connected if first is not None]
+        p50 = f"{np.percentile(firsts, 50) * 1000:.0f} ms" if firsts else "-"
+        p95 = f"{np.percentile(firsts, 95) * 1000:.0f} ms" if firsts else "-"
+        self.stdout.write(
+            f"{name:>8} {viewers:>8} {len(connected):>10} {served:>7} {viewers - len(connected):>7} "
+            f"{(np.mean(fps) if fps else 0):>9.1f} {p50:>14} {p95:>8}"
+        )
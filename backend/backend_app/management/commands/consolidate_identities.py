@@ -0,0 +1,147 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+import time
+import numpy as np
+from backend_app.face_index import normalize, decode_embedding, encode_embedding, EMBEDDING_DIM
+from backend_app.face_recognition import redis_client, face_indexes, face_image_store, EMBEDDINGS_VERSION_KEY
+from backend_app.models import ActivityLog, Customer, EntryEvent, UserCafe
+
+
+class DisjointSet:
+    def __init__(self, size):
+        self.parent = np.arange(size)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def load_embeddings(customers, chunk=1000):
+    # Rows follow `customers`; customers without a stored embedding are left out
+    rows, kept = [], []
+    for start in range(0, len(customers), chunk):
+        batch = customers[start:start + chunk]
+        payloads = redis_client.hmget("face_embeddings", [c["face_id"] for c in batch])
+        for customer, payload in zip(batch, payloads):
+            if payload is None:
+                continue
+            try:
+                rows.append(decode_embedding(payload))
+            except Exception:
+                continue
+            kept.append(customer)
+    if not rows:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32), kept
+    return normalize(np.vstack(rows)), kept
+
+
+def cluster(matrix, threshold, block):
+    """Single-linkage groups of rows whose cosine similarity reaches threshold.
+
+    Similarities are computed block x block, so peak memory is one
+    (block, block) float32 tile on top of the matrix itself.
+    """
+    groups = DisjointSet(len(matrix))
+    pairs = 0
+    for i in range(0, len(matrix), block):
+        rows = matrix[i:i + block]
+        for j in range(i, len(matrix), block):
+            scores = rows @ matrix[j:j + block].T
+            if i == j:
+                scores = np.triu(scores, k=1)
+            a, b = np.nonzero(scores >= threshold)
+            pairs += len(a)
+            for x, y in zip((a + i).tolist(), (b + j).tolist()):
+                groups.union(x, y)
+    labels = np.array([groups.find(i) for i in range(len(matrix))])
+    return labels, pairs
+
+
+class Command(BaseCommand):
+    help = "Merge duplicate customer identities whose stored face embeddings are near-identical"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cafe", type=int, nargs="*", help="Cafe ids (default: all)")
+        parser.add_argument("--threshold", type=float, default=0.75,
+                            help="Cosine similarity at which two identities are the same person")
+        parser.add_argument("--block", type=int, default=4096, help="Rows per similarity tile")
+        parser.add_argument("--dry-run", action="store_true", help="Report the merges without writing anything")
+        parser.add_argument("--force", action="store_true",
+                            help="Merge even though detection is reported as running")
+
+    def handle(self, *args, **options):
+        # A running detector caches face_id -> Customer pk; merging deletes some of those rows
+        status = redis_client.get("detection_status")
+        if not options["dry_run"] and not options["force"] and status in (b"running", "running"):
+            raise CommandError("Detection is running; stop it before merging identities (or pass --force)")
+        cafe_ids = options["cafe"] or list(UserCafe.objects.values_list("id", flat=True))
+        for cafe_id in cafe_ids:
+            self.consolidate(cafe_id, options)
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def consolidate(self, cafe_id, options):
+        started = time.perf_counter()
+        customers = list(
+            Customer.objects.filter(cafe_id=cafe_id)
+            .order_by("first_visit", "customer_id")
+            .values("customer_id", "face_id", "first_visit", "last_visit", "visit_count", "average_stay")
+        )
+        matrix, customers = load_embeddings(customers)
+        labels, pairs = cluster(matrix, options["threshold"], options["block"])
+
+        # Rows are ordered by first visit, so the first row of each group is the identity that stays
+        order = np.argsort(labels, kind="stable")
+        boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+        merges = [members.tolist() for members in np.split(order, boundaries) if len(members) > 1]
+        duplicates = sum(len(members) - 1 for members in merges)
+        self.stdout.write(
+            f"Cafe {cafe_id}: {len(customers)} identities, {pairs} similar pair(s), "
+            f"{len(merges)} group(s) to merge, {duplicates} duplicate(s) "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+        if not merges or options["dry_run"]:
+            return
+
+        with transaction.atomic():
+            for members in merges:
+                self.merge([customers[i] for i in members])
+
+        # Each kept identity gets the mean of its group's embeddings; the rest leave the index
+        pipe = redis_client.pipeline()
+        for members in merges:
+            keep = customers[members[0]]
+            pipe.hset("face_embeddings", keep["face_id"], encode_embedding(normalize(matrix[members].mean(axis=0))))
+            removed = [customers[i]["face_id"] for i in members[1:]]
+            pipe.hdel("face_embeddings", *removed)
+        # Bumped without an announcement, so running processes see they are behind and reload
+        pipe.incr(EMBEDDINGS_VERSION_KEY)
+        pipe.execute()
+        face_image_store.delete(*[customers[i]["face_id"] for members in merges for i in members[1:]])
+
+        index = face_indexes.rebuild(cafe_id)
+        self.stdout.write(f"Cafe {cafe_id}: index now holds {len(index)} identities")
+
+    def merge(self, group):
+        keep, duplicates = group[0], group[1:]
+        duplicate_ids = [c["customer_id"] for c in duplicates]
+        visits = sum(c["visit_count"] for c in group)
+        stays = sum(c["average_stay"] * c["visit_count"] for c in group)
+        last_visits = [c["last_visit"] for c in group if c["last_visit"] is not None]
+
+        EntryEvent.objects.filter(customer_id__in=duplicate_ids).update(customer_id=keep["customer_id"])
+        ActivityLog.objects.filter(customer_id__in=duplicate_ids).update(customer_id=keep["customer_id"])
+        Customer.objects.filter(customer_id=keep["customer_id"]).update(
+            visit_count=visits,
+            last_visit=max(last_visits) if last_visits else None,
+            average_stay=stays / visits if visits else keep["average_stay"],
+            status="returning" if visits > 1 else "new",
+        )
+        Customer.objects.filter(customer_id__in=duplicate_ids).delete()
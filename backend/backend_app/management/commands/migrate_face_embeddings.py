@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from backend_app.face_index import encode_embedding, decode_embedding, is_legacy_embedding
+from backend_app.face_recognition import redis_client, face_indexes
+from backend_app.models import UserCafe
+
+
+class Command(BaseCommand):
+    help = "Rewrite pickled entries of the face_embeddings hash as raw float32 and rebuild the per-cafe index snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=1000, help="Entries per HSCAN/pipeline round")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would change")
+        parser.add_argument("--skip-snapshots", action="store_true", help="Don't rebuild the index snapshots")
+
+    def handle(self, *args, **options):
+        converted = current = failed = 0
+        pending = {}
+
+        def write(pending):
+            if pending and not options["dry_run"]:
+                redis_client.hset("face_embeddings", mapping=pending)
+
+        for name, payload in redis_client.hscan_iter("face_embeddings", count=options["batch"]):
+            if not is_legacy_embedding(payload):
+                current += 1
+                continue
+            try:
+                pending[name] = encode_embedding(decode_embedding(payload))
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"Skipping {name!r}: {e}"))
+                continue
+            converted += 1
+            if len(pending) >= options["batch"]:
+                write(pending)
+                pending = {}
+        write(pending)
+
+        verb = "Would convert" if options["dry_run"] else "Converted"
+        self.stdout.write(f"{verb} {converted} embedding(s); {current} already raw float32, {failed} unreadable.")
+
+        if options["dry_run"] or options["skip_snapshots"]:
+            return
+        for cafe_id in UserCafe.objects.values_list("id", flat=True):
+            index = face_indexes.rebuild(cafe_id)
+            self.stdout.write(f"Cafe {cafe_id}: snapshot with {len(index)} identities at {face_indexes.path(cafe_id)}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from backend_app.face_images import LEGACY_FACE_IMAGES_KEY
+from backend_app.face_recognition import redis_client, face_image_store, ensure_customer_sequence
+
+
+class Command(BaseCommand):
+    help = "Move JPEG crops out of the Redis face_images hash into the on-disk face image store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=500, help="Entries per HSCAN round")
+        parser.add_argument("--keep", action="store_true", help="Leave the Redis entries in place after copying")
+        parser.add_argument("--prune", action="store_true", help="Also delete image files no customer refers to")
+
+    def handle(self, *args, **options):
+        # Seed the id sequence while the legacy hash still counts every minted id
+        ensure_customer_sequence()
+        moved = failed = 0
+        done = []
+        for face_id, data in redis_client.hscan_iter(LEGACY_FACE_IMAGES_KEY, count=options["batch"]):
+            try:
+                face_image_store.save_jpeg(face_id.decode(), data)
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"Skipping {face_id!r}: {e}"))
+                continue
+            moved += 1
+            done.append(face_id)
+            if len(done) >= options["batch"] and not options["keep"]:
+                redis_client.hdel(LEGACY_FACE_IMAGES_KEY, *done)
+                done = []
+        if done and not options["keep"]:
+            redis_client.hdel(LEGACY_FACE_IMAGES_KEY, *done)
+        self.stdout.write(f"Moved {moved} image(s) to {face_image_store.root}; {failed} failed.")
+
+        if options["prune"]:
+            self.stdout.write(f"Pruned {face_image_store.prune()} unreferenced file(s).")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0009_alter_seat_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seat',
+            name='camera',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='seats', to='backend_app.camera'),
+        ),
+    ]
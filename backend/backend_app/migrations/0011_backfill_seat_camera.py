@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def backfill_seat_camera(apps, schema_editor):
+    # Seats from before chair_index was per camera: take the camera that last detected the seat,
+    # or the cafe's only camera. Anything still ambiguous is claimed by the first camera that reports it.
+    Seat = apps.get_model('backend_app', 'Seat')
+    Camera = apps.get_model('backend_app', 'Camera')
+    SeatDetection = apps.get_model('backend_app', 'SeatDetection')
+    only_camera = {}
+    for cafe_id in Camera.objects.values_list('cafe_id', flat=True).distinct():
+        ids = list(Camera.objects.filter(cafe_id=cafe_id).values_list('id', flat=True)[:2])
+        if len(ids) == 1:
+            only_camera[cafe_id] = ids[0]
+    for seat in Seat.objects.filter(camera__isnull=True):
+        camera_id = (
+            SeatDetection.objects.filter(seat_id=seat.seat_id).order_by('-time_start')
+            .values_list('camera_id', flat=True).first()
+        ) or only_camera.get(seat.cafe_id)
+        if camera_id is not None:
+            Seat.objects.filter(seat_id=seat.seat_id).update(camera_id=camera_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0010_seat_camera'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_seat_camera, migrations.RunPython.noop),
+    ]
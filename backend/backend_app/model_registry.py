@@ -0,0 +1,70 @@
+# model_registry.py
+import threading
+import time
+
+
+class ModelRegistry:
+    """Loads model weights on first use and keeps them for the life of the process.
+
+    Importing a module that needs a model costs nothing; the first get()
+    loads it, every later caller (any camera, any detection session) shares
+    that instance, and status() reports how long each load took.
+
+    get_local() is for models that keep per-call state (OpenCV DNN objects):
+    each thread gets its own instance, loaded once per thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loading = {}  # name -> Lock held while that model loads
+        self.models = {}
+        self.local = threading.local()
+        self.stats = {}  # name -> {"loads", "load_ms", "last_load_ms", "loaded_at", "per_thread"}
+
+    def get(self, name, loader):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self.lock:
+            load_lock = self.loading.setdefault(name, threading.Lock())
+        # One load per model; other models can load at the same time
+        with load_lock:
+            model = self.models.get(name)
+            if model is None:
+                model = self.models[name] = self.timed_load(name, loader, per_thread=False)
+        return model
+
+    def get_local(self, name, loader):
+        models = getattr(self.local, "models", None)
+        if models is None:
+            models = self.local.models = {}
+        model = models.get(name)
+        if model is None:
+            model = models[name] = self.timed_load(name, loader, per_thread=True)
+        return model
+
+    def timed_load(self, name, loader, per_thread):
+        started = time.perf_counter()
+        model = loader()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            stats = self.stats.setdefault(name, {"loads": 0, "load_ms": 0.0, "per_thread": per_thread})
+            stats["loads"] += 1
+            stats["load_ms"] += elapsed * 1000
+            stats["last_load_ms"] = round(elapsed * 1000, 1)
+            stats["loaded_at"] = time.time()
+        print(f"[INFO] Loaded model {name} in {elapsed * 1000:.0f} ms")
+        return model
+
+    def loaded(self, name):
+        return name in self.models or name in getattr(self.local, "models", {})
+
+    def status(self):
+        with self.lock:
+            return {
+                name: dict(stats, load_ms=round(stats["load_ms"], 1))
+                for name, stats in self.stats.items()
+            }
+
+
+models = ModelRegistry()
@@ -70,6 +70,7 @@ from django.db import models
 class Seat(models.Model):
     seat_id = models.AutoField(primary_key=True)
     cafe = models.ForeignKey(UserCafe, on_delete=models.CASCADE, related_name="seats")
+    camera = models.ForeignKey('Camera', null=True, blank=True, on_delete=models.SET_NULL, related_name="seats")  # chair_index is per camera
     last_updated = models.DateTimeField(auto_now=True)
     is_occupied = models.BooleanField(default=False)
     chair_index = models.IntegerField()
@@ -0,0 +1,219 @@
+# occupancy.py
+import asyncio
+import json
+import time
+
+# === Redis Keys ===
+# chair_occupancy:cafe:{cafe}:camera:{camera}  hash, chair id -> chair JSON
+# chair_occupancy_cameras:cafe:{cafe}          set of cameras that publish for the cafe
+# chair_occupancy_meta:cafe:{cafe}             hash with the cafe-wide "version" and last "timestamp"
+# chair_occupancy_updates:cafe:{cafe}          pub/sub channel carrying each diff
+
+def occupancy_key(cafe_id, camera_id):
+    return f"chair_occupancy:cafe:{cafe_id}:camera:{camera_id}"
+
+def occupancy_cameras_key(cafe_id):
+    return f"chair_occupancy_cameras:cafe:{cafe_id}"
+
+def occupancy_meta_key(cafe_id):
+    return f"chair_occupancy_meta:cafe:{cafe_id}"
+
+def occupancy_channel(cafe_id):
+    return f"chair_occupancy_updates:cafe:{cafe_id}"
+
+
+def chair_payload(camera_id, box, occupied, start_time):
+    return {
+        "status": "occupied" if occupied else "available",
+        "box": list(box),
+        "start_time": start_time,
+        "camera_id": camera_id,
+    }
+
+
+class OccupancyPublisher:
+    """Publishes one camera's chair states to Redis, writing only the chairs that changed.
+
+    Called once per processed frame. Nothing is written when no chair changed,
+    and min_interval caps the write rate. Each write bumps the cafe-wide version
+    and announces the diff on the updates channel.
+    """
+
+    def __init__(self, client, cafe_id, camera_id, min_interval=0.0):
+        self.client = client
+        self.cafe_id = cafe_id
+        self.camera_id = camera_id
+        self.min_interval = min_interval
+
+        self.published = {}  # chair id -> (occupied, box, start_time) last written
+        self.last_publish = 0.0
+        self.version = None
+
+        self.publishes = 0
+        self.skipped = 0
+        self.chairs_written = 0
+
+    def reset(self):
+        # Start from an empty hash so chairs from a previous run don't linger
+        pipe = self.client.pipeline()
+        pipe.delete(occupancy_key(self.cafe_id, self.camera_id))
+        pipe.sadd(occupancy_cameras_key(self.cafe_id), self.camera_id)
+        pipe.execute()
+        self.published = {}
+
+    def publish(self, chairs, now=None, force=False):
+        """chairs yields (chair_id, box, occupied, start_time). Returns the new version, or None if nothing was written."""
+        now = now or time.time()
+        if not force and now - self.last_publish < self.min_interval:
+            self.skipped += 1
+            return None
+
+        current = {chair_id: (occupied, box, start_time) for chair_id, box, occupied, start_time in chairs}
+        changed = {
+            str(chair_id): chair_payload(self.camera_id, box, occupied, start_time)
+            for chair_id, (occupied, box, start_time) in current.items()
+            if self.published.get(chair_id) != (occupied, box, start_time)
+        }
+        removed = [str(chair_id) for chair_id in self.published if chair_id not in current]
+        if not changed and not removed and not force:
+            self.skipped += 1
+            return None
+
+        key = occupancy_key(self.cafe_id, self.camera_id)
+        pipe = self.client.pipeline()
+        if changed:
+            pipe.hset(key, mapping={chair_id: json.dumps(chair) for chair_id, chair in changed.items()})
+        if removed:
+            pipe.hdel(key, *removed)
+        pipe.hincrby(occupancy_meta_key(self.cafe_id), "version", 1)
+        pipe.hset(occupancy_meta_key(self.cafe_id), "timestamp", now)
+        results = pipe.execute()
+        self.version = results[-2]
+
+        self.client.publish(occupancy_channel(self.cafe_id), json.dumps({
+            "version": self.version,
+            "camera_id": self.camera_id,
+            "timestamp": now,
+            "changed": {f"{self.camera_id}:{chair_id}": chair for chair_id, chair in changed.items()},
+            "removed": [f"{self.camera_id}:{chair_id}" for chair_id in removed],
+        }))
+
+        self.published = current
+        self.last_publish = now
+        self.publishes += 1
+        self.chairs_written += len(changed)
+        return self.version
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "publishes": self.publishes,
+            "skipped": self.skipped,
+            "chairs_written": self.chairs_written,
+        }
+
+
+# === Readers ===
+def read_occupancy_version(client, cafe_id):
+    return int(client.hget(occupancy_meta_key(cafe_id), "version") or 0)
+
+def read_cafe_occupancy(client, cafe_id):
+    # Merge the per-camera hashes into the cafe-wide shape the dashboard expects
+    camera_ids = sorted(client.smembers(occupancy_cameras_key(cafe_id)))
+    pipe = client.pipeline()
+    pipe.hgetall(occupancy_meta_key(cafe_id))
+    for camera_id in camera_ids:
+        pipe.hgetall(occupancy_key(cafe_id, camera_id))
+    meta, *hashes = pipe.execute()
+    return merge_cafe_occupancy(camera_ids, meta, hashes)
+
+def merge_cafe_occupancy(camera_ids, meta, hashes):
+    chairs = {}
+    for camera_id, chair_hash in zip(camera_ids, hashes):
+        for chair_id, chair in chair_hash.items():
+            chairs[f"{camera_id}:{chair_id}"] = json.loads(chair)
+    return {
+        "chairs": chairs,
+        "timestamp": float(meta["timestamp"]) if meta.get("timestamp") else None,
+        "version": int(meta.get("version") or 0),
+    }
+
+
+# === Async Readers ===
+# Same reads for redis.asyncio clients, used by the ASGI views
+
+async def aread_occupancy_version(client, cafe_id):
+    return int(await client.hget(occupancy_meta_key(cafe_id), "version") or 0)
+
+async def aread_cafe_occupancy(client, cafe_id):
+    camera_ids = sorted(await client.smembers(occupancy_cameras_key(cafe_id)))
+    pipe = client.pipeline()
+    pipe.hgetall(occupancy_meta_key(cafe_id))
+    for camera_id in camera_ids:
+        pipe.hgetall(occupancy_key(cafe_id, camera_id))
+    meta, *hashes = await pipe.execute()
+    return merge_cafe_occupancy(camera_ids, meta, hashes)
+
+
+class OccupancyWatcher:
+    """One Redis pattern subscription per event loop, fanning occupancy diffs out to waiting requests.
+
+    Long-polling clients await a future instead of each holding its own
+    pub/sub connection.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.pubsub = None
+        self.task = None
+        self.waiters = {}  # cafe id (str) -> set of futures
+        self.starting = asyncio.Lock()
+
+    async def start(self):
+        async with self.starting:
+            if self.task is not None and not self.task.done():
+                return
+            self.pubsub = self.client.pubsub()
+            await self.pubsub.psubscribe(occupancy_channel("*"))
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+
+    async def listen(self):
+        try:
+            async for message in self.pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                cafe_id = message["channel"].rsplit(":", 1)[1]
+                futures = self.waiters.pop(cafe_id, ())
+                if not futures:
+                    continue
+                update = json.loads(message["data"])
+                for future in futures:
+                    if not future.done():
+                        future.set_result(update)
+        except Exception as e:
+            print(f"[ERROR] Occupancy watcher stopped: {e}")
+            for futures in self.waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            self.waiters = {}
+
+    def register(self, cafe_id):
+        # Register before reading the current version, so no update falls in between
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(str(cafe_id), set()).add(future)
+        return future
+
+    def unregister(self, cafe_id, future):
+        futures = self.waiters.get(str(cafe_id))
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del self.waiters[str(cafe_id)]
+
+    async def wait(self, future, timeout):
+        """The next diff published for the cafe, or None after timeout."""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
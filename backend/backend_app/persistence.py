@@ -0,0 +1,297 @@
+# persistence.py
+import queue
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from backend_app.models import Camera, Customer, EntryEvent, Seat, SeatDetection
+from backend_app.visits import to_aware
+
+MAX_QUEUE_SIZE = 10000  # records; beyond this new records are dropped rather than stalling detection
+FLUSH_SIZE = 200
+FLUSH_INTERVAL = 1.0  # seconds
+MAX_FLUSH_ATTEMPTS = 3  # a batch that fails this many times in a row is dropped
+FLUSH_RETRY_DELAY = 1.0  # seconds, multiplied by the attempt number
+
+# Records the detector hands over instead of writing to the database itself.
+# A seat session is identified by (camera_id, chair_index, start_time).
+EntryRecord = namedtuple("EntryRecord", ["camera_id", "event_type", "track_id", "face_id", "timestamp"])
+SeatOpenRecord = namedtuple("SeatOpenRecord", ["cafe_id", "camera_id", "chair_index", "box", "start_time"])
+SeatCloseRecord = namedtuple("SeatCloseRecord", ["camera_id", "chair_index", "start_time", "end_time"])
+# A track got its identity after some of its entry events were already recorded
+IdentityRecord = namedtuple("IdentityRecord", ["camera_id", "track_id", "face_id", "since"])
+
+_STOP = object()
+
+
+class PersistenceQueue:
+    """Background writer for detector events.
+
+    Records are buffered in a bounded queue and written with bulk_create /
+    bulk_update whenever FLUSH_SIZE records are waiting or FLUSH_INTERVAL has
+    passed, so slow database writes never block the detection loop.
+    """
+
+    def __init__(self, max_size=MAX_QUEUE_SIZE, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, events=None):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.events = events  # LiveEventPublisher announcing written entries, if any
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.thread = None
+        self.started_at = None  # when the current detection run began writing
+
+        self.seats = {}  # (cafe_id, camera_id, chair_index) -> Seat
+        self.open_detections = {}  # (camera_id, chair_index, start_time) -> SeatDetection
+        self.customer_ids = {}  # face_id -> Customer pk
+        self.camera_cafes = {}  # camera_id -> cafe_id
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flushed_records = 0
+        self.errors = 0
+        self.discarded = 0  # records dropped after MAX_FLUSH_ATTEMPTS failed flushes
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    # === Lifecycle ===
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.started_at = timezone.now()
+        self.thread = threading.Thread(target=self.run, name="persistence-writer", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, timeout=10):
+        # Everything queued before this call is flushed before the writer exits
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout=timeout)
+
+    # === Producer Side ===
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"[WARN] Persistence queue full, dropped {self.dropped} record(s) so far.")
+            return False
+
+    def record_entry(self, camera_id, event_type, track_id, face_id=None):
+        return self.put(EntryRecord(camera_id, event_type, track_id, face_id, timezone.now()))
+
+    def record_identity(self, camera_id, track_id, face_id, since):
+        return self.put(IdentityRecord(camera_id, track_id, face_id, since))
+
+    def record_seat_open(self, cafe_id, camera_id, chair_index, box, start_time):
+        return self.put(SeatOpenRecord(cafe_id, camera_id, chair_index, tuple(box), start_time))
+
+    def record_seat_close(self, camera_id, chair_index, start_time, end_time):
+        return self.put(SeatCloseRecord(camera_id, chair_index, start_time, end_time))
+
+    def status(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "flushed_records": self.flushed_records,
+            "errors": self.errors,
+            "discarded": self.discarded,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 2),
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 2),
+            "open_seat_detections": len(self.open_detections),
+        }
+
+    # === Writer Side ===
+    def run(self):
+        stopping = False
+        try:
+            while not stopping:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.flush_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        record = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        stopping = True
+                        break
+                    batch.append(record)
+
+                if stopping:
+                    # Drain whatever arrived alongside the stop request
+                    while True:
+                        try:
+                            record = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if record is not _STOP:
+                            batch.append(record)
+
+                if batch:
+                    self.flush_with_retry(batch)
+        finally:
+            connection.close()
+
+    def flush_with_retry(self, batch):
+        # Records after this batch wait while it is retried, so rows keep their order
+        for attempt in range(1, MAX_FLUSH_ATTEMPTS + 1):
+            if self.flush(batch):
+                return True
+            if attempt < MAX_FLUSH_ATTEMPTS:
+                time.sleep(FLUSH_RETRY_DELAY * attempt)
+        self.discarded += len(batch)
+        print(f"[ERROR] Dropped {len(batch)} detector record(s) after {MAX_FLUSH_ATTEMPTS} failed flushes.")
+        return False
+
+    def flush(self, batch):
+        """Writes the batch in one transaction; returns False (with nothing written) if it failed."""
+        started = time.perf_counter()
+        close_old_connections()
+        # Rolled back along with the rows if the flush fails, so a retry starts from the same state
+        cached = dict(self.seats), dict(self.open_detections), dict(self.customer_ids)
+        try:
+            with transaction.atomic():
+                self.write(batch)
+            self.flushed_records += len(batch)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ERROR] Failed to persist {len(batch)} detector record(s): {e}")
+            self.seats, self.open_detections, self.customer_ids = cached
+            return False
+        finally:
+            self.last_flush_latency = time.perf_counter() - started
+            self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+            self.flushes += 1
+
+        entries = [r for r in batch if isinstance(r, EntryRecord)]
+        if entries and self.events is not None:
+            try:
+                self.publish_entries(entries)
+            except Exception as e:
+                print(f"[WARN] Failed to announce {len(entries)} entry event(s): {e}")
+        return True
+
+    def write(self, batch):
+        entries = [r for r in batch if isinstance(r, EntryRecord)]
+        opens = [r for r in batch if isinstance(r, SeatOpenRecord)]
+        closes = [r for r in batch if isinstance(r, SeatCloseRecord)]
+        identities = [r for r in batch if isinstance(r, IdentityRecord)]
+
+        customer_ids = self.get_customer_ids([r.face_id for r in entries + identities])
+        if entries:
+            EntryEvent.objects.bulk_create([
+                EntryEvent(
+                    camera_id=r.camera_id, event_type=r.event_type, track_id=r.track_id,
+                    customer_id=customer_ids.get(r.face_id), timestamp=r.timestamp,
+                ) for r in entries
+            ])
+        for r in identities:
+            if r.face_id in customer_ids:
+                # Track ids start over with each process, so never reach back past this run
+                since = to_aware(r.since)
+                if self.started_at is not None:
+                    since = max(since, self.started_at)
+                EntryEvent.objects.filter(
+                    camera_id=r.camera_id, track_id=r.track_id,
+                    customer__isnull=True, timestamp__gte=since,
+                ).update(customer_id=customer_ids[r.face_id])
+        # A session that opened and closed within one batch is written once, already closed
+        closes = {(r.camera_id, r.chair_index, r.start_time): r for r in closes}
+        if opens:
+            self.flush_seat_opens(opens, closes)
+        if closes:
+            self.flush_seat_closes(closes.values())
+
+    def publish_entries(self, entries):
+        # One live event per cafe per flush, after the rows are written
+        missing = {r.camera_id for r in entries} - set(self.camera_cafes)
+        if missing:
+            self.camera_cafes.update(Camera.objects.filter(id__in=missing).values_list("id", "cafe_id"))
+        by_cafe = defaultdict(list)
+        for r in entries:
+            cafe_id = self.camera_cafes.get(r.camera_id)
+            if cafe_id is not None:
+                by_cafe[cafe_id].append((r.camera_id, r.event_type, r.face_id, r.timestamp))
+        for cafe_id, cafe_entries in by_cafe.items():
+            self.events.publish_entries(cafe_id, cafe_entries)
+
+    def get_customer_ids(self, face_ids):
+        missing = {face_id for face_id in face_ids if face_id and face_id not in self.customer_ids}
+        if missing:
+            self.customer_ids.update(Customer.objects.filter(face_id__in=missing).values_list("face_id", "customer_id"))
+        return {face_id: self.customer_ids[face_id] for face_id in face_ids if face_id in self.customer_ids}
+
+    def get_seats(self, opens):
+        # Seat rows are looked up once per chair and kept, then only their coordinates change
+        seats = {}
+        for r in opens:
+            key = (r.cafe_id, r.camera_id, r.chair_index)
+            seat = self.seats.get(key)
+            if seat is None:
+                seat = (
+                    Seat.objects.filter(cafe_id=r.cafe_id, camera_id=r.camera_id, chair_index=r.chair_index).first()
+                    # Rows the camera backfill couldn't place go to the first camera that reports the chair
+                    or Seat.objects.filter(cafe_id=r.cafe_id, camera__isnull=True, chair_index=r.chair_index).first()
+                )
+                if seat is None:
+                    seat = Seat.objects.create(
+                        cafe_id=r.cafe_id, camera_id=r.camera_id, chair_index=r.chair_index,
+                        x1=r.box[0], y1=r.box[1], x2=r.box[2], y2=r.box[3],
+                    )
+                seat.camera_id = r.camera_id
+                self.seats[key] = seat
+            seat.x1, seat.y1, seat.x2, seat.y2 = r.box
+            seat.last_updated = timezone.now()
+            seats[key] = seat
+        Seat.objects.bulk_update(list(seats.values()), ["camera", "x1", "y1", "x2", "y2", "last_updated"])
+        return seats
+
+    def flush_seat_opens(self, opens, closes):
+        seats = self.get_seats(opens)
+        detections = []
+        for r in opens:
+            key = (r.camera_id, r.chair_index, r.start_time)
+            detection = SeatDetection(
+                camera_id=r.camera_id,
+                seat=seats[(r.cafe_id, r.camera_id, r.chair_index)],
+                time_start=to_aware(r.start_time),
+            )
+            close = closes.pop(key, None)
+            if close is not None:
+                detection.time_end = to_aware(close.end_time)
+            else:
+                self.open_detections[key] = detection
+            detections.append(detection)
+        SeatDetection.objects.bulk_create(detections)
+
+    def flush_seat_closes(self, closes):
+        updated = []
+        for r in closes:
+            detection = self.open_detections.pop((r.camera_id, r.chair_index, r.start_time), None)
+            if detection is None:
+                continue  # Opened before a restart; nothing to close
+            detection.time_end = to_aware(r.end_time)
+            if detection.pk is not None:
+                updated.append(detection)
+            else:
+                # Backends that don't return ids from bulk_create
+                SeatDetection.objects.filter(
+                    camera_id=detection.camera_id, seat_id=detection.seat_id,
+                    time_start=detection.time_start, time_end__isnull=True,
+                ).update(time_end=detection.time_end)
+        if updated:
+            SeatDetection.objects.bulk_update(updated, ["time_end"])
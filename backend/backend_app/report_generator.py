@@ -3,9 +3,11 @@ from django.conf import settings
 from datetime import datetime
 from django.db.models import ExpressionWrapper, F, DurationField,Sum,Avg
 from .models import EntryEvent, SeatDetection
-from reportlab.pdfgen import canvas
 
 def generate_pdf_for_month(cafe, year, month):
+    # reportlab is only needed here; importing it with views slowed every worker's startup
+    from reportlab.pdfgen import canvas
+
     # === Gather summary data ===
     total_visitors = EntryEvent.objects.filter(
         camera__cafe=cafe,
@@ -0,0 +1,158 @@
+# seat_state.py
+import io
+from collections import namedtuple
+
+import numpy as np
+
+from backend_app.association import iou_matrix
+
+DUPLICATE_IOU_THRESHOLD = 0.8
+
+# kind is "occupied" when a seat crosses the occupancy time threshold and
+# "free" when an occupied seat has been empty for the cooldown period.
+SeatEvent = namedtuple("SeatEvent", ["chair_id", "kind", "box", "start_time", "timestamp"])
+
+
+class SeatStateStore:
+    """Chair boxes and occupancy state for one camera, kept in contiguous arrays.
+
+    Row i holds chair ids[i]. start_times uses NaN where the old dict state
+    used None. update() applies the same transitions as the old per-chair
+    loop, but for every chair at once, and returns only the seats that changed.
+    """
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.next_chair_id = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4), dtype=np.int64)
+        self.occupied = np.zeros(capacity, dtype=bool)
+        self.start_times = np.full(capacity, np.nan, dtype=np.float64)
+        self.cooldowns = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, capacity):
+        n = self.count
+        for name, fill in (("ids", 0), ("boxes", 0), ("occupied", False), ("start_times", np.nan), ("cooldowns", 0)):
+            old = getattr(self, name)
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+    def active_boxes(self):
+        return self.boxes[:self.count]
+
+    # === Registration ===
+    def add(self, chair_id, box, occupied=False, start_time=None, cooldown=0):
+        if self.count == len(self.ids):
+            self.grow(max(2 * len(self.ids), 16))
+        i = self.count
+        self.ids[i] = chair_id
+        self.boxes[i] = box
+        self.occupied[i] = occupied
+        self.start_times[i] = np.nan if start_time is None else start_time
+        self.cooldowns[i] = cooldown
+        self.count += 1
+        self.next_chair_id = max(self.next_chair_id, chair_id + 1)
+        return chair_id
+
+    def register(self, box, iou_threshold=DUPLICATE_IOU_THRESHOLD):
+        # Returns the new chair id, or None if the box overlaps an existing chair
+        if self.count and (iou_matrix([box], self.active_boxes())[0] > iou_threshold).any():
+            return None
+        return self.add(self.next_chair_id, box)
+
+    # === Per-Frame Transitions ===
+    def update(self, seated, now, occupancy_threshold, cooldown_threshold):
+        n = self.count
+        if n == 0:
+            return []
+        seated = np.asarray(seated, dtype=bool)
+        occupied = self.occupied[:n]
+        start_times = self.start_times[:n]
+        cooldowns = self.cooldowns[:n]
+        has_start = ~np.isnan(start_times)
+
+        # Seated: reset the cooldown, start the timer, or promote once it has run long enough
+        becomes_occupied = seated & has_start & ~occupied & ((now - start_times) >= occupancy_threshold)
+        start_times[seated & ~has_start] = now
+        cooldowns[seated] = 0
+        occupied[becomes_occupied] = True
+
+        # Not seated: count empty frames, then clear the seat
+        empty = ~seated
+        cooldowns[empty] += 1
+        expired = empty & (cooldowns >= cooldown_threshold)
+        becomes_free = expired & occupied
+        freed_start_times = start_times[becomes_free].copy()
+        start_times[expired] = np.nan
+        occupied[expired] = False
+
+        events = []
+        for i in np.flatnonzero(becomes_occupied).tolist():
+            events.append(SeatEvent(int(self.ids[i]), "occupied", tuple(self.boxes[i].tolist()), float(start_times[i]), now))
+        for i, start_time in zip(np.flatnonzero(becomes_free).tolist(), freed_start_times.tolist()):
+            events.append(SeatEvent(int(self.ids[i]), "free", tuple(self.boxes[i].tolist()), start_time, now))
+        return events
+
+    # === Views ===
+    def items(self):
+        # (chair_id, box, occupied, start_time) per chair, with None for an unset start time
+        n = self.count
+        for chair_id, box, occupied, start_time in zip(
+            self.ids[:n].tolist(), self.boxes[:n].tolist(), self.occupied[:n].tolist(), self.start_times[:n].tolist()
+        ):
+            yield chair_id, tuple(box), occupied, None if start_time != start_time else start_time
+
+    # === Serialization ===
+    def to_cache(self):
+        # Same JSON shape as the cached_chair_positions entries the detector already reads
+        n = self.count
+        return {
+            "registered_chairs": {
+                str(chair_id): {
+                    "box": box,
+                    "occupied": occupied,
+                    "start_time": start_time,
+                    "cooldown": cooldown,
+                }
+                for (chair_id, box, occupied, start_time), cooldown in zip(self.items(), self.cooldowns[:n].tolist())
+            },
+            "next_chair_id": self.next_chair_id,
+        }
+
+    @classmethod
+    def from_cache(cls, data):
+        chairs = data["registered_chairs"]
+        store = cls(capacity=max(len(chairs), 16))
+        for cid, c in chairs.items():
+            store.add(int(cid), tuple(c["box"]), c["occupied"], c["start_time"], c["cooldown"])
+        store.next_chair_id = max(store.next_chair_id, data["next_chair_id"])
+        return store
+
+    def to_bytes(self):
+        # Raw array checkpoint; much cheaper than JSON once there are hundreds of seats
+        n = self.count
+        buffer = io.BytesIO()
+        np.savez(
+            buffer, ids=self.ids[:n], boxes=self.boxes[:n], occupied=self.occupied[:n],
+            start_times=self.start_times[:n], cooldowns=self.cooldowns[:n],
+            next_chair_id=np.int64(self.next_chair_id),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload):
+        arrays = np.load(io.BytesIO(payload))
+        n = len(arrays["ids"])
+        store = cls(capacity=max(n, 16))
+        store.ids[:n] = arrays["ids"]
+        store.boxes[:n] = arrays["boxes"]
+        store.occupied[:n] = arrays["occupied"]
+        store.start_times[:n] = arrays["start_times"]
+        store.cooldowns[:n] = arrays["cooldowns"]
+        store.count = n
+        store.next_chair_id = int(arrays["next_chair_id"])
+        return store
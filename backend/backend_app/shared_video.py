@@ -1,6 +1,333 @@
 # shared_video.py
 
+import sys
 import threading
+import time
+from multiprocessing import shared_memory
 
-video_lock = threading.Lock()
-latest_frame = None
+import numpy as np
+
+# === Frame Bus ===
+# Annotated frames live in shared memory, one ring per camera, so any process on
+# the host (every gunicorn/uvicorn worker) can read the latest frame without the
+# detector's process or a lock. Layout of a ring segment:
+#   header   int64[HEADER_FIELDS]  magic, latest seq, height, width, channels, slots, closed, published_at_ns
+#   slot seq int64[slots]          seq held by each slot, 0 while it is being written
+#   frames   uint8[slots, h, w, c]
+# Readers take a view of the slot for the latest seq and, once done with it,
+# check the slot still holds that seq (valid()) to detect an overwrite.
+
+FRAME_BUS_PREFIX = "cafe_frames"
+FRAME_SHAPE = (480, 640, 3)  # the detector publishes 640x480 annotated frames
+RING_SLOTS = 4
+MAX_CAMERAS = 64
+STALE_AFTER = 2.0  # seconds without a frame before a reader checks for a replaced segment
+REATTACH_INTERVAL = 1.0  # seconds between a reader's attempts to re-attach
+
+RING_MAGIC = 0x46524D42  # "FRMB"
+INDEX_MAGIC = 0x46524958  # "FRIX"
+HEADER_FIELDS = 8
+MAGIC, SEQ, HEIGHT, WIDTH, CHANNELS, SLOTS, CLOSED, PUBLISHED_AT = range(HEADER_FIELDS)
+
+
+def attach_segment(name, owner=False):
+    segment = shared_memory.SharedMemory(name=name)
+    if not owner:
+        try:
+            # Attaching registers the segment with this process's resource tracker,
+            # which would unlink it when a reader exits; only the writer owns it
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(segment._name, "shared_memory")
+        except Exception:
+            pass
+    return segment
+
+
+def create_segment(name, size):
+    # The writer owns the segment either way: it unlinks it when done, and its
+    # resource tracker cleans up after a crash
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size), True
+    except FileExistsError:
+        return attach_segment(name, owner=True), False
+
+
+def unlink_segment(segment):
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class FrameRing:
+    """One camera's ring of frame slots in a shared memory segment."""
+
+    def __init__(self, segment, owner=False):
+        self.segment = segment
+        self.owner = owner
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=segment.buf)
+        slots, shape = int(header[SLOTS]), (int(header[HEIGHT]), int(header[WIDTH]), int(header[CHANNELS]))
+        self.bind(slots, shape)
+
+    def bind(self, slots, shape):
+        buf = self.segment.buf
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=buf)
+        self.slot_seqs = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=HEADER_FIELDS * 8)
+        self.frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=buf, offset=frames_offset(slots))
+        self.shape = shape
+
+    @classmethod
+    def create(cls, name, shape=FRAME_SHAPE, slots=RING_SLOTS):
+        size = frames_offset(slots) + slots * int(np.prod(shape))
+        segment, created = create_segment(name, size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=segment.buf)
+        if not created and (header[MAGIC] != RING_MAGIC or tuple(header[[HEIGHT, WIDTH, CHANNELS]]) != shape
+                            or header[SLOTS] != slots):
+            # Left over from a run with another layout
+            header[CLOSED] = 1
+            segment.close()
+            segment.unlink()
+            segment, created = create_segment(name, size)
+            header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=segment.buf)
+        if created:
+            header[:] = 0
+            header[[HEIGHT, WIDTH, CHANNELS, SLOTS]] = shape + (slots,)
+            header[MAGIC] = RING_MAGIC
+        header[CLOSED] = 0
+        return cls(segment, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        segment = attach_segment(name)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=segment.buf)
+        if header[MAGIC] != RING_MAGIC:
+            segment.close()
+            raise FileNotFoundError(name)
+        return cls(segment)
+
+    # === Writer Side ===
+    def publish(self, frame):
+        if frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match ring shape {self.shape}")
+        seq = int(self.header[SEQ]) + 1
+        slot = seq % len(self.slot_seqs)
+        self.slot_seqs[slot] = 0
+        self.frames[slot] = frame
+        self.slot_seqs[slot] = seq
+        self.header[PUBLISHED_AT] = time.time_ns()
+        self.header[SEQ] = seq
+        return seq
+
+    # === Reader Side ===
+    def latest(self):
+        """(seq, frame view) for the newest complete frame, or (0, None)."""
+        for _ in range(3):
+            seq = int(self.header[SEQ])
+            if seq == 0 or self.header[CLOSED]:
+                return 0, None
+            slot = seq % len(self.slot_seqs)
+            if self.slot_seqs[slot] == seq:
+                return seq, self.frames[slot]
+        return 0, None
+
+    def valid(self, seq):
+        # True while the slot a reader got for seq hasn't been reused
+        return seq > 0 and self.slot_seqs[seq % len(self.slot_seqs)] == seq
+
+    @property
+    def closed(self):
+        return bool(self.header[CLOSED])
+
+    @property
+    def published_at(self):
+        return self.header[PUBLISHED_AT] / 1e9
+
+    def unlink(self):
+        # Attached readers keep their mapping; they see the ring closed and look for a new one
+        if self.owner:
+            self.header[CLOSED] = 1
+            unlink_segment(self.segment)
+            self.owner = False
+
+    def close(self):
+        # Raises BufferError while a caller still holds a frame view; the ring stays usable then.
+        # Views of frames don't pin the mapping, so count the references to it ourselves.
+        if sys.getrefcount(self.frames) > 2:
+            raise BufferError("a frame view is still in use")
+        self.segment.close()
+        self.header = self.slot_seqs = self.frames = None
+
+
+def frames_offset(slots):
+    offset = (HEADER_FIELDS + slots) * 8
+    return (offset + 63) // 64 * 64
+
+
+class FrameBus:
+    """Per-camera frame rings plus an index of active cameras, shared across processes."""
+
+    def __init__(self, prefix=FRAME_BUS_PREFIX, shape=FRAME_SHAPE, slots=RING_SLOTS):
+        self.prefix = prefix
+        self.shape = shape
+        self.slots = slots
+        self.writers = {}  # camera_id -> FrameRing this process publishes to
+        self.readers = {}  # camera_id -> FrameRing attached for reading
+        self.attached_at = {}  # camera_id -> last attach attempt
+        self.retired = []  # replaced mappings; views into them may still be in use
+        self.index_segment = None
+        self.index = None
+        self.index_owner = False  # this process created the index and unlinks it with its last ring
+        self.index_opened_at = 0.0
+        self.lock = threading.RLock()  # guards the rings, the camera index and retired mappings across threads
+
+    def ring_name(self, camera_id):
+        return f"{self.prefix}_{camera_id}"
+
+    # === Camera Index ===
+    # int64[3 + MAX_CAMERAS]: magic, last published camera, count, camera ids
+    def open_index(self, create=False):
+        with self.lock:
+            if self.index is not None:
+                # A reader re-opens now and then: a restarted writer makes a new segment under the same name.
+                # A writer re-opens an index it only attached to as a reader, so that it owns it.
+                fresh = time.time() - self.index_opened_at < REATTACH_INTERVAL
+                if (self.index_owner or not create) and (self.writers or fresh):
+                    return self.index
+                segment, self.index_segment, self.index = self.index_segment, None, None
+                self.release(segment)
+            self.index_opened_at = time.time()
+            self.index_owner = create
+            name = f"{self.prefix}_index"
+            try:
+                if create:
+                    segment, created = create_segment(name, (3 + MAX_CAMERAS) * 8)
+                else:
+                    segment, created = attach_segment(name), False
+            except FileNotFoundError:
+                return None
+            index = np.ndarray((3 + MAX_CAMERAS,), dtype=np.int64, buffer=segment.buf)
+            if created:
+                index[:] = 0
+                index[0] = INDEX_MAGIC
+            self.index_segment, self.index = segment, index
+            return index
+
+    def cameras(self):
+        index = self.open_index()
+        if index is None or index[0] != INDEX_MAGIC:
+            return []
+        return index[3:3 + int(index[2])].tolist()
+
+    def set_cameras(self, camera_ids):
+        with self.lock:
+            index = self.open_index(create=True)
+            camera_ids = list(camera_ids)[:MAX_CAMERAS]
+            index[3:3 + len(camera_ids)] = camera_ids
+            index[2] = len(camera_ids)
+
+    def default_camera(self):
+        index = self.open_index()
+        if index is None or index[0] != INDEX_MAGIC or not index[2]:
+            return None
+        return int(index[1]) if int(index[1]) in self.cameras() else self.cameras()[0]
+
+    # === Writer Side ===
+    def publish(self, camera_id, frame):
+        ring = self.writers.get(camera_id)
+        if ring is None:
+            # Adding to the camera set is a read-modify-write; another camera may be doing the same
+            with self.lock:
+                ring = self.writers.get(camera_id)
+                if ring is None:
+                    ring = FrameRing.create(self.ring_name(camera_id), self.shape, self.slots)
+                    self.set_cameras(sorted(set(self.cameras()) | {camera_id}))
+                    self.writers[camera_id] = ring
+        seq = ring.publish(frame)
+        self.index[1] = camera_id
+        return seq
+
+    def remove(self, camera_id):
+        # Readers see the ring as closed; the segment goes once the last of them lets go
+        with self.lock:
+            ring = self.writers.pop(camera_id, None)
+            if ring is not None:
+                ring.unlink()
+                self.release(ring)
+            if self.open_index() is not None:
+                self.set_cameras([c for c in self.cameras() if c != camera_id])
+            if not self.writers and self.index_owner:
+                segment, self.index_segment, self.index = self.index_segment, None, None
+                self.index_owner = False
+                unlink_segment(segment)
+                self.release(segment)
+
+    def clear(self):
+        for camera_id in list(self.writers):
+            self.remove(camera_id)
+
+    # === Reader Side ===
+    def reader(self, camera_id):
+        ring = self.writers.get(camera_id)
+        if ring is not None:
+            return ring
+        ring = self.readers.get(camera_id)
+        now = time.time()
+        if ring is not None and not ring.closed and now - ring.published_at <= STALE_AFTER:
+            return ring
+        # Closed or silent: the writer may have restarted with a new segment under the same name
+        with self.lock:
+            ring = self.readers.get(camera_id)
+            if ring is not None and not ring.closed and now - ring.published_at <= STALE_AFTER:
+                return ring
+            if now - self.attached_at.get(camera_id, 0.0) < REATTACH_INTERVAL:
+                return ring
+            self.attached_at[camera_id] = now
+            try:
+                fresh = FrameRing.attach(self.ring_name(camera_id))
+            except FileNotFoundError:
+                return ring
+            self.readers[camera_id] = fresh
+            if ring is not None:
+                self.release(ring)
+            return fresh
+
+    def release(self, mapping):
+        # Another thread may still hold a view into it; retry those on later releases
+        with self.lock:
+            pending, self.retired = self.retired + [mapping], []
+            for item in pending:
+                try:
+                    item.close()
+                except BufferError:
+                    self.retired.append(item)
+
+    def latest(self, camera_id=None):
+        """(seq, zero-copy view) of the newest frame for the camera (default: the last one published)."""
+        if camera_id is None:
+            camera_id = self.default_camera()
+            if camera_id is None:
+                return 0, None
+        ring = self.reader(int(camera_id))
+        if ring is None:
+            return 0, None
+        return ring.latest()
+
+    def valid(self, camera_id, seq):
+        if camera_id is None:
+            camera_id = self.default_camera()
+        ring = self.reader(int(camera_id)) if camera_id is not None else None
+        return ring is not None and ring.valid(seq)
+
+    def read_copy(self, camera_id=None):
+        # A private copy, for callers that hold on to the frame
+        for _ in range(3):
+            seq, view = self.latest(camera_id)
+            if view is None:
+                return None
+            frame = view.copy()
+            if self.valid(camera_id, seq):
+                return frame
+        return None
+
+
+frame_bus = FrameBus()
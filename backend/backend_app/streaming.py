@@ -0,0 +1,375 @@
+# streaming.py
+import asyncio
+import subprocess
+import threading
+import time
+
+import cv2
+
+from backend_app.shared_video import frame_bus
+
+MJPEG_BOUNDARY = "frame"
+DEFAULT_JPEG_QUALITY = 80
+ENCODE_POLL_INTERVAL = 0.005  # seconds; the frame bus has no cross-process wakeup, so encoders poll its seq
+ENCODE_POLL_MAX_INTERVAL = 0.08  # seconds; the poll doubles up to this while no new frame arrives
+ENCODER_IDLE_TIMEOUT = 5.0  # seconds an encoder waits for a new viewer before its thread exits
+SUBSCRIBER_WAIT = 1.0  # seconds a viewer blocks per wait, so stopped channels are noticed
+
+FFMPEG_FRAME_RATE = 10
+FFMPEG_QUALITY = 5  # -q:v, 2 (best) to 31
+FFMPEG_READ_SIZE = 64 * 1024
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+def parse_quality(value):
+    try:
+        quality = int(value) if value else DEFAULT_JPEG_QUALITY
+    except ValueError:
+        quality = DEFAULT_JPEG_QUALITY
+    # Rounded to a few levels so viewers share encoders
+    return min(95, max(10, round(quality, -1)))
+
+
+def parse_camera_id(value):
+    """Camera id from a query string; None when absent, ValueError when it isn't a positive integer."""
+    if not value:
+        return None
+    camera_id = int(value)
+    if camera_id <= 0:
+        raise ValueError(f"invalid camera id {value!r}")
+    return camera_id
+
+
+def mjpeg_part(jpeg):
+    return b"--" + MJPEG_BOUNDARY.encode() + b"\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+
+
+def resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# === Frame Sources ===
+class FrameSource:
+    """Latest JPEG plus a sequence number, waited on by sync and asyncio viewers alike.
+
+    Thread viewers block on the condition. Async viewers on the same event loop
+    share one future, resolved from the producer thread with a single
+    call_soon_threadsafe per loop, so hundreds of connections cost one wakeup.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.subscribers = 0
+        self.ended = False
+        self.seq = 0
+        self.jpeg = None
+        self.loop_futures = {}  # event loop -> future resolved by the next frame
+        self.frames_sent = 0
+
+    def publish(self, jpeg, count=1):
+        with self.cond:
+            self.jpeg = jpeg
+            self.seq += count
+            self.cond.notify_all()
+            futures, self.loop_futures = self.loop_futures, {}
+        for loop, future in futures.items():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(resolve, future)
+
+    def end(self):
+        with self.cond:
+            self.ended = True
+        self.publish(self.jpeg, count=0)
+
+    def take(self, after_seq):
+        # Under self.cond
+        if self.seq <= after_seq:
+            return after_seq, None
+        self.frames_sent += 1
+        return self.seq, self.jpeg
+
+    def wait(self, after_seq, timeout=SUBSCRIBER_WAIT):
+        """(seq, jpeg) of the first frame newer than after_seq; jpeg is None on timeout or end."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq or self.ended, timeout)
+            return self.take(after_seq)
+
+    async def wait_async(self, after_seq, timeout=SUBSCRIBER_WAIT):
+        with self.cond:
+            if self.seq > after_seq or self.ended:
+                return self.take(after_seq)
+            loop = asyncio.get_running_loop()
+            future = self.loop_futures.get(loop)
+            if future is None:
+                future = self.loop_futures[loop] = loop.create_future()
+        try:
+            # Shielded: one viewer timing out must not cancel the future the others share
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self.cond:
+            return self.take(after_seq)
+
+
+# === MJPEG Broadcaster ===
+class FrameChannel(FrameSource):
+    """Encodes one camera's frames at one JPEG quality, once, for all of its viewers."""
+
+    def __init__(self, camera_id, quality):
+        super().__init__()
+        self.camera_id = camera_id  # None follows whichever camera published last
+        self.quality = quality
+        self.thread = None
+        self.source = None  # (camera_id, bus seq) of the frame behind self.jpeg
+        # self.seq is a local counter, so viewers see it rise even if the default camera changes
+
+        self.encodes = 0
+        self.failed_encodes = 0
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=f"mjpeg-{self.camera_id}-{self.quality}", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+            self.cond.notify_all()
+
+    # === Encoder Side ===
+    def run(self):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        poll_interval = ENCODE_POLL_INTERVAL
+        while True:
+            with self.cond:
+                if not self.subscribers:
+                    # Nobody is watching: stop encoding, and stop the thread if no one comes back
+                    self.cond.wait_for(lambda: self.subscribers > 0, ENCODER_IDLE_TIMEOUT)
+                    if not self.subscribers:
+                        self.thread = None
+                        return
+
+            camera_id = self.camera_id if self.camera_id is not None else frame_bus.default_camera()
+            seq, frame = frame_bus.latest(camera_id) if camera_id is not None else (0, None)
+            if frame is None or (camera_id, seq) == self.source:
+                # Back off while the camera is quiet; a new frame resets the poll
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, ENCODE_POLL_MAX_INTERVAL)
+                continue
+            poll_interval = ENCODE_POLL_INTERVAL
+            ok, buffer = cv2.imencode(".jpg", frame, params)
+            if not ok or not frame_bus.valid(camera_id, seq):
+                # Overwritten while encoding; the next pass picks up the newer frame
+                self.failed_encodes += 1
+                continue
+
+            self.source = (camera_id, seq)
+            self.encodes += 1
+            self.publish(buffer.tobytes())
+
+    def status(self):
+        return {
+            "camera_id": self.camera_id,
+            "quality": self.quality,
+            "subscribers": self.subscribers,
+            "encoding": self.thread is not None,
+            "encodes": self.encodes,
+            "failed_encodes": self.failed_encodes,
+            "frames_sent": self.frames_sent,
+        }
+
+
+class MjpegBroadcaster:
+    """One FrameChannel per (camera, quality); every viewer of a pair shares its JPEG bytes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def channel(self, camera_id=None, quality=DEFAULT_JPEG_QUALITY):
+        key = (camera_id, quality)
+        with self.lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = FrameChannel(camera_id, quality)
+            return channel
+
+    def stream(self, camera_id=None, quality=DEFAULT_JPEG_QUALITY):
+        """multipart/x-mixed-replace body for one viewer."""
+        channel = self.channel(camera_id, quality)
+        channel.subscribe()
+        try:
+            seq = 0
+            while True:
+                seq, jpeg = channel.wait(seq)
+                if jpeg is not None:
+                    yield mjpeg_part(jpeg)
+        finally:
+            # Runs on client disconnect too (the server closes the generator)
+            channel.unsubscribe()
+
+    async def astream(self, camera_id=None, quality=DEFAULT_JPEG_QUALITY):
+        """Async body for ASGI; awaits frames instead of holding a thread per viewer."""
+        channel = self.channel(camera_id, quality)
+        channel.subscribe()
+        try:
+            seq = 0
+            while True:
+                seq, jpeg = await channel.wait_async(seq)
+                if jpeg is not None:
+                    yield mjpeg_part(jpeg)
+        finally:
+            # Also reached when the ASGI server cancels the response on disconnect
+            channel.unsubscribe()
+
+    def status(self):
+        with self.lock:
+            channels = list(self.channels.values())
+        return [channel.status() for channel in channels if channel.subscribers or channel.thread is not None]
+
+
+# === RTSP Stream Hub ===
+def ffmpeg_mjpeg_command(rtsp_url):
+    """ffmpeg arguments that decode an RTSP stream and write MJPEG to stdout."""
+    return [
+        "ffmpeg", "-loglevel", "error", "-rtsp_transport", "tcp", "-i", rtsp_url,
+        "-f", "mjpeg", "-q:v", str(FFMPEG_QUALITY), "-r", str(FFMPEG_FRAME_RATE), "-",
+    ]
+
+
+def split_jpeg_frames(buffer):
+    """Whole SOI..EOI JPEGs found in buffer, and the unfinished remainder.
+
+    0xFF bytes inside entropy-coded data are stuffed (FF 00), so FF D9 only
+    ever appears as the end-of-image marker.
+    """
+    frames = []
+    start = buffer.find(JPEG_SOI)
+    while start != -1:
+        end = buffer.find(JPEG_EOI, start + 2)
+        if end == -1:
+            break
+        frames.append(buffer[start:end + 2])
+        start = buffer.find(JPEG_SOI, end + 2)
+    return frames, (buffer[start:] if start != -1 else b"")
+
+
+class StreamHub(FrameSource):
+    """One ffmpeg process per camera, its JPEG frames fanned out to every viewer."""
+
+    def __init__(self, key, command):
+        super().__init__()
+        self.key = key
+        self.command = command
+        self.process = None
+        self.thread = None
+
+        self.started_at = None
+        self.frames = 0
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self.run, name=f"stream-hub-{self.key}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.end()
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def run(self):
+        pending = b""
+        stdout = self.process.stdout
+        try:
+            while True:
+                chunk = stdout.read1(FFMPEG_READ_SIZE)
+                if not chunk:
+                    break
+                frames, pending = split_jpeg_frames(pending + chunk)
+                if frames:
+                    # Viewers only ever want the newest whole frame
+                    self.frames += len(frames)
+                    self.publish(frames[-1], count=len(frames))
+        except Exception as e:
+            print(f"[ERROR] Stream hub {self.key} stopped reading: {e}")
+        finally:
+            self.end()
+
+    def status(self):
+        return {
+            "camera_id": self.key,
+            "subscribers": self.subscribers,
+            "running": not self.ended,
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "frames": self.frames,
+            "frames_sent": self.frames_sent,
+        }
+
+
+class StreamHubRegistry:
+    """Reference-counted StreamHubs: started by the first viewer, stopped with the last."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hubs = {}
+
+    def acquire(self, key, command):
+        with self.lock:
+            hub = self.hubs.get(key)
+            if hub is None or hub.ended:
+                hub = StreamHub(key, command)
+                hub.start()  # raises (e.g. ffmpeg missing) before the hub is registered
+                self.hubs[key] = hub
+            hub.subscribers += 1
+            return hub
+
+    def release(self, hub):
+        with self.lock:
+            hub.subscribers -= 1
+            if hub.subscribers > 0:
+                return
+            if self.hubs.get(hub.key) is hub:
+                del self.hubs[hub.key]
+        hub.stop()
+
+    def stream(self, key, command):
+        """multipart/x-mixed-replace body for one viewer; ends if ffmpeg exits."""
+        hub = self.acquire(key, command)
+        try:
+            seq = 0
+            while True:
+                seq, jpeg = hub.wait(seq)
+                if jpeg is not None:
+                    yield mjpeg_part(jpeg)
+                elif hub.ended:
+                    break
+        finally:
+            self.release(hub)
+
+    async def astream(self, key, command):
+        hub = self.acquire(key, command)
+        try:
+            seq = 0
+            while True:
+                seq, jpeg = await hub.wait_async(seq)
+                if jpeg is not None:
+                    yield mjpeg_part(jpeg)
+                elif hub.ended:
+                    break
+        finally:
+            self.release(hub)
+
+    def status(self):
+        with self.lock:
+            return [hub.status() for hub in self.hubs.values()]
+
+
+mjpeg_broadcaster = MjpegBroadcaster()
+stream_hubs = StreamHubRegistry()
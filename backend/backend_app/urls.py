@@ -19,8 +19,9 @@ from .views import (
     reset_chair_cache, chair_occupancy_view,
     update_hourly_entry_summary, SeatDetectionListCreateView, SeatDetectionUpdateView,
     EntryEventListCreateView, GenerateReportView, ReportListView, get_entry_state, video_feed,
-    seat_summary_analytics,rtsp_stream, user_cafe_view, peak_hour_analytics, visitor_traffic, customer_analytics, detection_status, activity_log, monthly_report_summary, historical_reports, detected_customers, 
+    seat_summary_analytics,rtsp_stream, user_cafe_view, peak_hour_analytics, visitor_traffic, customer_analytics, detection_status, activity_log, monthly_report_summary, historical_reports, detected_customers, customer_face_image,
 )
+from .async_views import video_feed_async, rtsp_stream_async, chair_occupancy_async, live_events_async
 
 urlpatterns = [
     # === Auth ===
@@ -50,6 +51,7 @@ urlpatterns = [
     path('analytics/stop-detection/', stop_detection_view, name='stop-detection'),
     #path('analytics/detection-status/', get_detection_status, name='detection-status'),
     path('analytics/customers/list/', detected_customers),
+    path('analytics/customers/<str:face_id>/image/', customer_face_image, name='customer-face-image'),
     path("cafes/user/", user_cafe_view), 
 
 
@@ -80,6 +82,12 @@ urlpatterns = [
     # === Live Video Feed ===
     path('video_feed/', video_feed, name='video_feed'),
 
+    # === Async Live Endpoints (for ASGI servers) ===
+    path('async/video_feed/', video_feed_async, name='video-feed-async'),
+    path('async/stream/<int:camera_id>/', rtsp_stream_async, name='rtsp-stream-async'),
+    path('async/chair-occupancy/', chair_occupancy_async, name='chair-occupancy-async'),
+    path('async/live/', live_events_async, name='live-events'),
+
     # Reports
      path('analytics/monthly-report/<int:year>/<int:month>/', monthly_report_summary),
      path('historical-data/reports/', historical_reports),
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone 
 from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import Count, Avg, F, ExpressionWrapper, DurationField
 from django.db.models.functions import TruncDate, TruncWeek, ExtractHour, ExtractWeekDay
@@ -17,7 +18,7 @@ from .serializers import ReportSerializer
 from django.utils.dateparse import parse_date
 from .report_generator import generate_pdf_for_month
 from .utils import compute_zone_counts
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import HttpResponse, HttpResponseNotFound, FileResponse
 from django.utils.timezone import get_current_timezone
 
 import calendar
@@ -25,7 +26,7 @@ import calendar
 
 
 from datetime import timedelta
-import redis, json, subprocess, os, time, cv2
+import redis, json, os, time, cv2
 
 from .utils import generate_otp, send_otp_via_email
 from .models import (
@@ -39,8 +40,11 @@ from .serializers import (
     UserCafeSerializer, FloorSerializer, CameraSerializer,
     SeatDetectionSerializer, entry_event_serializer,
 )
-from .detector import start_detection, stop_detection
+from .detector import start_detection, stop_detection, detection_state, detection_metrics
+from .occupancy import read_cafe_occupancy, read_occupancy_version
+from .face_recognition import face_image_store
 import backend_app.shared_video as shared_video
+from .streaming import mjpeg_broadcaster, stream_hubs, ffmpeg_mjpeg_command, parse_camera_id, parse_quality, MJPEG_BOUNDARY
 
 User = get_user_model()
 redis_client = redis.StrictRedis(host='localhost', port=6379, decode_responses=True)
@@ -246,8 +250,7 @@ def peak_hour_analytics(request):
     # 🔸 CURRENT OCCUPANCY
     try:
         cafe = UserCafe.objects.filter(user=user).first()
-        redis_data = redis_client.get(f"chair_occupancy:cafe:{cafe.id}")
-        data = json.loads(redis_data or '{}')
+        data = read_cafe_occupancy(redis_client, cafe.id)
         chairs = data.get("chairs", {})
         occupied = sum(1 for c in chairs.values() if c["status"] == "occupied")
         total = len(chairs)
@@ -370,11 +373,28 @@ def detected_customers(request):
         "last_visit": c.last_visit,
         "visit_count": c.visit_count,
         "average_stay": c.average_stay,
-        "status": c.status
+        "status": c.status,
+        "image_url": reverse("customer-face-image", args=[c.face_id]),
+        "thumbnail_url": reverse("customer-face-image", args=[c.face_id]) + "?size=thumb",
     } for c in customers]
 
     return Response(data)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def customer_face_image(request, face_id):
+    # Streams the stored crop from disk; ?size=thumb returns the small version
+    customer = get_object_or_404(Customer, face_id=face_id, cafe__user=request.user)
+    image = face_image_store.open(customer.face_id, thumbnail=request.GET.get("size") == "thumb")
+    if image is None:
+        return HttpResponseNotFound("No image stored for this customer")
+    response = FileResponse(image, content_type="image/jpeg")
+    digest = face_image_store.digest(customer.face_id)
+    if digest:
+        response["ETag"] = f'"{digest}"'
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
+
 # views.py
 from django.http import JsonResponse
 from backend_app.models import EntryEvent, SeatDetection
@@ -461,8 +481,17 @@ def chair_occupancy_view(request):
         if not cafe:
             return JsonResponse({"error": "No cafe linked to user"}, status=400)
 
-        data = redis_client.get(f"chair_occupancy:cafe:{cafe.id}")
-        return JsonResponse(json.loads(data or '{}'))
+        # Clients that pass the last version they saw get a cheap "unchanged" reply
+        since_version = request.GET.get("since_version")
+        if since_version is not None:
+            try:
+                since_version = int(since_version)
+            except ValueError:
+                return JsonResponse({"error": "since_version must be an integer"}, status=400)
+            version = read_occupancy_version(redis_client, cafe.id)
+            if version == since_version:
+                return JsonResponse({"version": version, "unchanged": True})
+        return JsonResponse(read_cafe_occupancy(redis_client, cafe.id))
     except redis.exceptions.ConnectionError:
         return JsonResponse({"error": "Redis connection failed"}, status=503)
 
@@ -476,6 +505,8 @@ def reset_chair_cache(request):
             return JsonResponse({"error": "No cafe linked to user"}, status=400)
 
         redis_client.delete(f"cached_chair_positions:cafe:{cafe.id}")
+        for key in redis_client.scan_iter(match=f"cached_chair_positions:cafe:{cafe.id}:camera:*"):
+            redis_client.delete(key)
         return JsonResponse({"status": "cache cleared"})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
@@ -538,19 +569,18 @@ def log_entry_event(track_id, face_id=None):
 
 @csrf_exempt
 def video_feed(request):
-    def generate_stream():
-        while True:
-            with shared_video.video_lock:
-                frame = shared_video.latest_frame.copy() if shared_video.latest_frame is not None else None
-            if frame is None:
-                continue
-            ret, jpeg = cv2.imencode('.jpg', frame)
-            if not ret:
-                continue
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
-            time.sleep(0.03)
-
-    return StreamingHttpResponse(generate_stream(), content_type='multipart/x-mixed-replace; boundary=frame')
+    try:
+        camera_id = parse_camera_id(request.GET.get("camera_id"))
+    except ValueError:
+        return JsonResponse({"error": "camera_id must be a positive integer"}, status=400)
+    if camera_id is not None and not Camera.objects.filter(id=camera_id).exists():
+        return HttpResponseNotFound("Camera not found")
+    quality = parse_quality(request.GET.get("quality"))
+
+    return StreamingHttpResponse(
+        mjpeg_broadcaster.stream(camera_id, quality),
+        content_type=f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}',
+    )
 
 def get_camera_streams(request):
     user = request.user
@@ -581,15 +611,20 @@ def start_detection_view(request):
         if source_type == "sample":
             video_path = request.data.get("video_path", "")
             redis_client.set("sample_video_path", video_path)
+        # Sample videos only: play at native FPS instead of as fast as possible (unset keeps the detector default)
+        paced = request.data.get("paced")
+        if paced is not None:
+            paced = str(paced).lower() in ("1", "true", "yes", "on")
         if source_type == "camera":
             selected_ids = request.data.get("selected_camera_ids", [])
             redis_client.set("selected_camera_ids", json.dumps(selected_ids))  # Optional: if needed later
-        if redis_client.get("detection_status") == "running":
-            return JsonResponse({"status": "already running"})
-        started = start_detection()
+        started = start_detection(paced=paced)
+        cameras = detection_state()
+        # The engine publishes detection state changes itself (live events and detection_status)
         if started:
-            redis_client.set("detection_status", "running")
-            return JsonResponse({"status": "started"})
+            return JsonResponse({"status": "started", "started_camera_ids": started, "cameras": cameras})
+        elif cameras:
+            return JsonResponse({"status": "already running", "cameras": cameras})
         else:
             return JsonResponse({"status": "failed to start"}, status=500)
     except Exception as e:
@@ -601,9 +636,21 @@ def start_detection_view(request):
 @permission_classes([permissions.IsAuthenticated])
 def stop_detection_view(request):
     try:
-        stop_detection()
-        redis_client.set("detection_status", "stopped")
-        return JsonResponse({"status": "stopped"})
+        camera_ids = request.data.get("camera_ids")  # Stop only these cameras, or everything when omitted
+        if camera_ids:
+            try:
+                if not isinstance(camera_ids, list):
+                    raise ValueError(camera_ids)
+                camera_ids = [int(camera_id) for camera_id in camera_ids]
+            except (TypeError, ValueError):
+                return JsonResponse({"error": "camera_ids must be a list of camera ids"}, status=400)
+            known = set(Camera.objects.filter(id__in=camera_ids).values_list("id", flat=True))
+            unknown = [camera_id for camera_id in camera_ids if camera_id not in known]
+            if unknown:
+                return JsonResponse({"error": "Camera not found", "camera_ids": unknown}, status=404)
+        stop_detection(camera_ids)
+        cameras = detection_state()
+        return JsonResponse({"status": "stopped", "cameras": cameras})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -613,7 +660,7 @@ def stop_detection_view(request):
 def detection_status(request):
     
     status = redis_client.get("detection_status") or "stopped"
-    return Response({"is_detecting": status == "running"})
+    return Response({"is_detecting": status == "running", "cameras": detection_state(), "pipeline": detection_metrics(), "streams": mjpeg_broadcaster.status(), "rtsp_hubs": stream_hubs.status()})
 
 
 
@@ -797,7 +844,13 @@ class ReportListView(APIView):
     
 
 def snapshot(request):
-    frame = shared_video.latest_frame
+    try:
+        camera_id = parse_camera_id(request.GET.get("camera_id"))
+    except ValueError:
+        return JsonResponse({"error": "camera_id must be a positive integer"}, status=400)
+    if camera_id is not None and not Camera.objects.filter(id=camera_id).exists():
+        return HttpResponseNotFound("Camera not found")
+    frame = shared_video.frame_bus.read_copy(camera_id)
     if frame is not None:
         _, buffer = cv2.imencode('.jpg', frame)
         return HttpResponse(buffer.tobytes(), content_type="image/jpeg")
@@ -813,31 +866,12 @@ def rtsp_stream(request, camera_id):
         camera = Camera.objects.get(id=camera_id)
         rtsp_url = f"rtsp://{camera.admin_name}:{camera.admin_password}@{camera.ip_address}/{camera.channel}"
 
-        # Start ffmpeg subprocess
-        command = [
-            "ffmpeg",
-            "-rtsp_transport", "tcp",
-            "-i", rtsp_url,
-            "-f", "mjpeg",
-            "-q:v", "5",
-            "-r", "10",
-            "-"
-        ]
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-
-        def generate():
-            try:
-                while True:
-                    chunk = process.stdout.read(1024)
-                    if not chunk:
-                        break
-                    yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + chunk + b"\r\n"
-            except GeneratorExit:
-                process.kill()
-            finally:
-                process.kill()
-
-        return StreamingHttpResponse(generate(), content_type="multipart/x-mixed-replace; boundary=frame")
+        # Every viewer of this camera shares one ffmpeg process
+        command = ffmpeg_mjpeg_command(rtsp_url)
+        return StreamingHttpResponse(
+            stream_hubs.stream(camera.id, command),
+            content_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+        )
     
     except Camera.DoesNotExist:
         return HttpResponseNotFound("Camera not found")
@@ -0,0 +1,134 @@
+# visits.py
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import close_old_connections, connection
+from django.db.models import F
+
+from backend_app.models import Customer
+
+VISIT_SESSION_GAP = 15 * 60  # seconds unseen before the next sighting counts as a new visit
+VISIT_FLUSH_INTERVAL = 5.0  # seconds between bulk writes
+
+
+def to_aware(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+class VisitAggregator:
+    """Turns per-frame face matches into one visit per presence session.
+
+    record() only touches memory. A background thread writes the buffered
+    last_visit / visit_count / status changes every VISIT_FLUSH_INTERVAL with
+    a single bulk_update, so a seated customer costs one UPDATE per flush at
+    most instead of one per frame.
+    """
+
+    def __init__(self, session_gap=VISIT_SESSION_GAP, flush_interval=VISIT_FLUSH_INTERVAL):
+        self.session_gap = session_gap
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.last_seen = {}  # face_id -> last sighting in this process
+        self.pending = {}  # face_id -> {"last_visit", "visits", "first_seen"}
+        self.thread = None
+        self.running = False
+
+        self.sightings = 0
+        self.visits_counted = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+
+    def record(self, face_id, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.sightings += 1
+            previous = self.last_seen.get(face_id)
+            self.last_seen[face_id] = now
+            entry = self.pending.setdefault(face_id, {"last_visit": now, "visits": 0, "first_seen": None})
+            entry["last_visit"] = now
+            if previous is None:
+                # First sighting since startup; flush() checks the stored last_visit before counting it
+                entry["first_seen"] = now
+            elif now - previous > self.session_gap:
+                entry["visits"] += 1
+        self.start()
+
+    # === Lifecycle ===
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name="visit-aggregator", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5):
+        self.running = False
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+        self.flush()
+
+    def run(self):
+        try:
+            while self.running:
+                time.sleep(self.flush_interval)
+                self.flush()
+        finally:
+            connection.close()
+
+    # === Writer Side ===
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            cutoff = time.time() - self.session_gap
+            self.last_seen = {face_id: seen for face_id, seen in self.last_seen.items() if seen >= cutoff}
+        if not pending:
+            return 0
+
+        close_old_connections()
+        try:
+            stored = Customer.objects.filter(face_id__in=list(pending)).values_list("customer_id", "face_id", "last_visit")
+            updates = []
+            for customer_id, face_id, last_visit in stored:
+                entry = pending[face_id]
+                visits = entry["visits"]
+                first_seen = entry["first_seen"]
+                if first_seen is not None and (last_visit is None or first_seen - last_visit.timestamp() > self.session_gap):
+                    visits += 1
+                customer = Customer(customer_id=customer_id, last_visit=to_aware(entry["last_visit"]))
+                fields = ["last_visit"]
+                if visits:
+                    customer.visit_count = F("visit_count") + visits
+                    customer.status = "returning"
+                    fields += ["visit_count", "status"]
+                    self.visits_counted += visits
+                updates.append((customer, tuple(fields)))
+
+            # bulk_update writes the same columns for every row, so group by the changed fields
+            for fields in {fields for _, fields in updates}:
+                Customer.objects.bulk_update([c for c, f in updates if f == fields], list(fields))
+            self.rows_written += len(updates)
+            self.flushes += 1
+            return len(updates)
+        except Exception as e:
+            self.errors += 1
+            print(f"[ERROR] Failed to write {len(pending)} customer visit update(s): {e}")
+            return 0
+
+    def status(self):
+        return {
+            "active_sessions": len(self.last_seen),
+            "pending": len(self.pending),
+            "sightings": self.sightings,
+            "visits_counted": self.visits_counted,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+        }
+
+
+visits = VisitAggregator()